@@ -0,0 +1,332 @@
+import heapq
+import os
+import pickle
+import struct
+import time
+import zlib
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from operator import itemgetter
+from threading import Lock
+
+from utils.url_set import url_hash64
+
+SAVE_INTERVAL = 30 # seconds between checkpoints of the crawl's stats
+COMPACT_AFTER = 64 # deltas after which the stats file is rewritten as one snapshot
+
+
+class WordFrequencies(object):
+    ''' Exact word counts summed over every page. Pages are merged with
+    Counter.update under a lock so several workers can add to it, and the
+    top k is picked with a heap instead of sorting the whole vocabulary. '''
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = Counter()
+        self.pages = 0
+        self.added = None # (counts, pages) since take_journal, once journal() was called
+
+    def update(self, word_freq, pages=1):
+        with self.lock:
+            self.counts.update(word_freq)
+            self.pages += pages
+            if self.added is not None:
+                self.added[0].update(word_freq)
+                self.added[1] += pages
+
+    def journal(self):
+        # from now on take_journal returns what was added since its last call
+        with self.lock:
+            self.added = [Counter(), 0]
+
+    def take_journal(self):
+        with self.lock:
+            added = self.added
+            self.added = [Counter(), 0]
+        return added
+
+    def replay_journal(self, added):
+        self.update(*added)
+
+    def most_common(self, k=50):
+        with self.lock:
+            return heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+
+    def snapshot(self, k=50):
+        ''' A consistent view of the counts that can be taken while the crawl
+        keeps going. '''
+        with self.lock:
+            return {
+                "pages": self.pages,
+                "vocabulary": len(self.counts),
+                "most_common": heapq.nlargest(
+                    k, self.counts.items(), key=itemgetter(1)),
+            }
+
+    def merge(self, other):
+        ''' Adds the counts of another WordFrequencies (e.g. from a shard). '''
+        with self.lock:
+            self.counts.update(other.counts)
+            self.pages += other.pages
+
+    def __getstate__(self):
+        # the lock cannot be pickled, a fresh one is made on the other side
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["added"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+
+class CountMinSketch(object):
+    ''' depth rows of width counters. A word adds its count to one counter in
+    every row and its estimate is the smallest of those counters, which can
+    only overcount. Memory is fixed no matter how many distinct words. '''
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = array("Q", bytes(8 * width * depth))
+
+    def _indexes(self, word):
+        digest = blake2b(word.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [row * self.width + (h1 + row * h2) % self.width
+                for row in range(self.depth)]
+
+    def add(self, word, count=1):
+        ''' Adds count to word and returns its new estimate. '''
+        table = self.table
+        estimate = None
+        for index in self._indexes(word):
+            table[index] += count
+            if estimate is None or table[index] < estimate:
+                estimate = table[index]
+        return estimate
+
+    def estimate(self, word):
+        return min(self.table[index] for index in self._indexes(word))
+
+    def merge(self, other):
+        # counters add up, so the estimates of the sum stay upper bounds
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches of the same size can be merged.")
+        table = self.table
+        for index, count in enumerate(other.table):
+            if count:
+                table[index] += count
+
+
+class SketchedWordFrequencies(object):
+    ''' Bounded memory word counts for very large vocabularies. Counts live in
+    a count-min sketch and only the heaviest candidates are kept by name, so
+    most_common is approximate (counts may be slightly too high). '''
+    def __init__(self, width=2**18, depth=4, candidates=1000):
+        self.lock = Lock()
+        self.sketch = CountMinSketch(width, depth)
+        self.capacity = candidates
+        self.candidates = dict() # word -> estimated count
+        self.floor = 0 # smallest estimate kept at the last prune
+        self.pages = 0
+        self.added = None # see WordFrequencies.journal
+
+    def update(self, word_freq, pages=1):
+        with self.lock:
+            if self.added is not None:
+                self.added[0].update(word_freq)
+                self.added[1] += pages
+            for word, count in word_freq.items():
+                estimate = self.sketch.add(word, count)
+                if word in self.candidates or estimate > self.floor:
+                    self.candidates[word] = estimate
+            # prune lazily, once the candidates have doubled
+            if len(self.candidates) > 2 * self.capacity:
+                kept = heapq.nlargest(
+                    self.capacity, self.candidates.items(), key=itemgetter(1))
+                self.candidates = dict(kept)
+                self.floor = kept[-1][1]
+            self.pages += pages
+
+    def most_common(self, k=50):
+        with self.lock:
+            return heapq.nlargest(k, self.candidates.items(), key=itemgetter(1))
+
+    def snapshot(self, k=50):
+        with self.lock:
+            return {
+                "pages": self.pages,
+                "vocabulary": None, # not known with a sketch
+                "most_common": heapq.nlargest(
+                    k, self.candidates.items(), key=itemgetter(1)),
+            }
+
+    journal = WordFrequencies.journal
+    take_journal = WordFrequencies.take_journal
+    replay_journal = WordFrequencies.replay_journal
+
+    def merge(self, other):
+        with self.lock:
+            self.sketch.merge(other.sketch)
+            # re-estimate every candidate from the merged counts
+            words = set(self.candidates) | set(other.candidates)
+            self.candidates = {word: self.sketch.estimate(word) for word in words}
+            self.floor = min(self.floor, other.floor)
+            self.pages += other.pages
+
+    __getstate__ = WordFrequencies.__getstate__
+    __setstate__ = WordFrequencies.__setstate__
+
+
+WORD_FREQUENCIES = {
+    "exact": WordFrequencies,
+    "sketch": SketchedWordFrequencies,
+}
+
+
+class PageWordCounts(object):
+    ''' Word count of every crawled page in two parallel arrays, the 8 byte
+    hash of the page's url and its count, with a dict from hash to row for
+    get(). Only the longest page keeps its url string. Rows are only ever
+    appended (a page recorded again gets a new row), so the rows added since
+    the last checkpoint are simply the tail of the arrays. '''
+    def __init__(self):
+        self.hashes = array("Q")
+        self.counts = array("I")
+        self.rows = dict() # url hash -> its latest row
+        self.longest = None # (url, word count)
+        self.saved = None # rows already journaled, once journal() was called
+
+    def __setitem__(self, url, count):
+        self._append(url_hash64(url), count)
+        if self.longest is None or count > self.longest[1]:
+            self.longest = (url, count)
+
+    def _append(self, h, count):
+        self.rows[h] = len(self.hashes)
+        self.hashes.append(h)
+        self.counts.append(count)
+
+    def get(self, url, default=None):
+        row = self.rows.get(url_hash64(url))
+        return default if row is None else self.counts[row]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def longest_page(self):
+        # same output as tokenizer.get_longest_page on a {url: count} dict
+        if self.longest is None:
+            return "N/A (no pages with words)"
+        return self.longest
+
+    def journal(self):
+        self.saved = len(self.hashes)
+
+    def take_journal(self):
+        added = (
+            self.hashes[self.saved:].tobytes(), self.counts[self.saved:].tobytes(),
+            self.longest)
+        self.saved = len(self.hashes)
+        return added
+
+    def replay_journal(self, added):
+        hashes, counts, longest = array("Q"), array("I"), added[2]
+        hashes.frombytes(added[0])
+        counts.frombytes(added[1])
+        for h, count in zip(hashes, counts):
+            self._append(h, count)
+        if longest is not None and (self.longest is None or longest[1] > self.longest[1]):
+            self.longest = longest
+
+    def merge(self, other):
+        self.replay_journal((other.hashes.tobytes(), other.counts.tobytes(), other.longest))
+
+    def __getstate__(self):
+        # rows is rebuilt from the arrays
+        state = self.__dict__.copy()
+        del state["rows"]
+        state["saved"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rows = {h: row for row, h in enumerate(self.hashes)}
+
+
+class AnalyticsStore(object):
+    ''' The crawl's stats on disk, so a crashed or resumed crawl still
+    reports everything it crawled. The file holds a full snapshot followed by
+    the deltas checkpointed since, each framed like the frontier log as
+    <length, crc32, pickled payload>. Reading stops at a torn tail left by a
+    crash and the next delta is written over it, so reading while another
+    process is writing is safe. Deltas are appended every SAVE_INTERVAL seconds and once
+    COMPACT_AFTER of them piled up the file is rewritten as one snapshot. '''
+    HEADER = struct.Struct("<II")
+
+    def __init__(self, path, interval=SAVE_INTERVAL, compact_after=COMPACT_AFTER):
+        self.path = path
+        self.interval = interval
+        self.compact_after = compact_after
+        self.records = 0
+        self.end = 0 # offset after the last good record
+        self.last_save = time.time()
+
+    def read(self):
+        records = list()
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "rb") as stats:
+            good_offset = 0
+            while True:
+                header = stats.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                length, checksum = self.HEADER.unpack(header)
+                payload = stats.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                records.append(pickle.loads(payload))
+                good_offset = stats.tell()
+        self.records = len(records)
+        self.end = good_offset
+        return records
+
+    def should_save(self):
+        return time.time() - self.last_save >= self.interval
+
+    def needs_snapshot(self):
+        return not self.records or self.records > self.compact_after
+
+    def write_snapshot(self, snapshot):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as stats:
+            stats.write(self._encode(snapshot))
+            stats.flush()
+            os.fsync(stats.fileno())
+            self.end = stats.tell()
+        os.replace(tmp_path, self.path)
+        self.records = 1
+        self.last_save = time.time()
+
+    def append(self, delta):
+        with open(self.path, "r+b") as stats:
+            stats.seek(self.end)
+            stats.write(self._encode(delta))
+            stats.truncate()
+            stats.flush()
+            os.fsync(stats.fileno())
+            self.end = stats.tell()
+        self.records += 1
+        self.last_save = time.time()
+
+    def _encode(self, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def state_file(config):
+    # the stats are kept next to the frontier save file
+    return f"{config.save_file}.analytics"
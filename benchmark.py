@@ -0,0 +1,43 @@
+from argparse import ArgumentParser
+
+from benchmarks import content_gate, crawl, download, frontier, page_parser, rate_control, resume, response, robots, shards, startup, tokenizer, url_filter, url_set
+
+
+def main():
+    parser = ArgumentParser()
+    benchmarks = parser.add_subparsers(dest="benchmark")
+    benchmarks.required = True
+    url_filter.add_arguments(benchmarks.add_parser(
+        "is_valid", help="compiled url filter against the original is_valid"))
+    page_parser.add_arguments(benchmarks.add_parser(
+        "parse", help="page_parser engines on saved pages"))
+    content_gate.add_arguments(benchmarks.add_parser(
+        "gate", help="pre-parse content gate against parsing every page"))
+    tokenizer.add_arguments(benchmarks.add_parser(
+        "tokenize", help="regex tokenizer against the per character loop"))
+    download.add_arguments(benchmarks.add_parser(
+        "download", help="threaded and async downloads from a local stand-in cache server"))
+    url_set.add_arguments(benchmarks.add_parser(
+        "url_set", help="memory and lookup speed of the seen-url set"))
+    response.add_arguments(benchmarks.add_parser(
+        "response", help="peak memory with giant and binary responses, with and without size limits"))
+    frontier.add_arguments(benchmarks.add_parser(
+        "frontier", help="adding link heavy pages to the frontier one link or one page at a time"))
+    rate_control.add_arguments(benchmarks.add_parser(
+        "rate", help="crawl of simulated slow, flaky, throttled and dead hosts with and without rate control"))
+    robots.add_arguments(benchmarks.add_parser(
+        "robots", help="crawl that obeys robots.txt rules, Crawl-delay, sitemaps and failed robots.txt"))
+    resume.add_arguments(benchmarks.add_parser(
+        "resume", help="time from opening a save file to the urls to download"))
+    shards.add_arguments(benchmarks.add_parser(
+        "shards", help="sharded crawl in several processes against a single process one"))
+    startup.add_arguments(benchmarks.add_parser(
+        "startup", help="launch.py time to the first download and import time"))
+    crawl.add_arguments(benchmarks.add_parser(
+        "crawl", help="end to end crawl replayed from a recorded corpus"))
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import time
+
+
+def timed(function, items, repeat=1):
+    ''' Calls function on every item, repeat times. Returns (seconds, calls per second). '''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    elapsed = time.perf_counter() - start
+    calls = len(items) * repeat
+    return elapsed, (calls / elapsed if elapsed else float("inf"))
+
+
+def report(name, elapsed, rate, unit="calls"):
+    print(f"{name:<24} {elapsed:9.3f}s {rate:14,.0f} {unit}/s")
@@ -0,0 +1,73 @@
+import sys
+import time
+
+from benchmarks import report
+from benchmarks.page_parser import load_pages, sample_pages
+from content_gate import ContentGate
+from scraper import analyze_page
+
+DEAD_PAGE = b"""<html><head><title>404 Not Found</title></head><body>
+<h1>Not Found</h1><p>The requested URL was not found on this server.</p>
+<hr><address>Apache Server at www.ics.uci.edu Port 443</address>%(filler)s</body></html>"""
+LOGIN_PAGE = b"""<html><head><title>Sign in</title></head><body>
+<p>Insufficient access privileges, please make sure to login with your UCInetID.</p>
+<form action="/login" method="post"><label>Username</label><input name="user">
+<label>Password</label><input type="password" name="pass"></form>%(filler)s</body></html>"""
+THIN_PAGE = b"""<html><head><title>Moved</title><style>body { margin: 0 }</style></head>
+<body><div class="nav"><a href="/">home</a></div>%(filler)s</body></html>"""
+# phrases only in markup the parsers leave out, the gate must let these through
+TRICKY_PAGE = b"""<html><head><script>var error = "page not found";</script></head><body>
+<a href="/login" title="password">Research groups</a><form action="/search"><input name="q"></form>
+%(paragraphs)s</body></html>"""
+
+
+def mixed_pages(count):
+    # mostly ordinary pages, with the kinds of pages the gate is for mixed in
+    filler = b"".join(b"<div class='spacer'><span></span></div>\n" for _ in range(300))
+    paragraphs = b"".join(
+        b"<p>Seminar on statistical learning and inference for the department.</p>"
+        for _ in range(20))
+    pages = sample_pages(count)
+    for i in range(0, count, 4):
+        pages[i] = (DEAD_PAGE, LOGIN_PAGE, THIN_PAGE, TRICKY_PAGE)[i // 4 % 4] % {
+            b"filler": filler, b"paragraphs": paragraphs}
+    return pages
+
+
+def run(args):
+    pages = load_pages(args.pages) if args.pages else mixed_pages(args.count)
+    url = "https://www.ics.uci.edu/page"
+    expected = [analyze_page(url, url, page, args.engine).skipped is not None for page in pages]
+    print(f"{len(pages)} pages, {sum(expected)} skipped by analyze_page, {args.engine} engine")
+
+    start = time.perf_counter()
+    for page in pages:
+        analyze_page(url, url, page, args.engine)
+    elapsed = time.perf_counter() - start
+    report("parse every page", elapsed, len(pages) / elapsed, "pages")
+
+    gate = ContentGate()
+    wrongly_skipped = 0
+    start = time.perf_counter()
+    for page, skipped in zip(pages, expected):
+        if gate.check(page) is None:
+            parse_start = time.perf_counter()
+            analyze_page(url, url, page, args.engine)
+            gate.parsed(len(page), time.perf_counter() - parse_start)
+        elif not skipped:
+            wrongly_skipped += 1
+    elapsed = time.perf_counter() - start
+    report("gate, then parse", elapsed, len(pages) / elapsed, "pages")
+    print(gate.summary())
+    print(f"{wrongly_skipped} pages skipped by the gate that analyze_page keeps")
+    if wrongly_skipped:
+        sys.exit(f"the gate skipped {wrongly_skipped} pages that analyze_page keeps")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--pages", type=str, default=None,
+        help="directory of saved html pages, defaults to generated pages")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--engine", default="soup", help="PARSER for the run")
+    parser.set_defaults(run=run)
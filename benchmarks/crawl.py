@@ -0,0 +1,149 @@
+import contextlib
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from configparser import ConfigParser
+from threading import Lock
+
+import scraper
+from crawler import Crawler
+from crawler.async_crawler import AsyncCrawler
+from crawler.frontier import FRONTIERS
+from utils.config import Config
+from utils.local_cache_server import LocalCacheServer, make_body
+from utils.replay import Corpus, CorpusWriter
+
+HOSTS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+
+
+def generate_corpus(path, pages, seed=0):
+    ''' Writes a synthetic site of pages spread over the seed hosts, in the
+    format a recorded crawl has. '''
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+        for _ in range(5000)]
+    urls = [f"https://{host}" for host in HOSTS] + [
+        f"https://{rng.choice(HOSTS)}/{rng.choice(vocabulary)}/{i}"
+        for i in range(pages - len(HOSTS))]
+    writer = CorpusWriter(path)
+    for url in urls:
+        words = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(100, 1500)))
+        links = "".join(
+            f'<li><a href="{rng.choice(urls)}">{rng.choice(vocabulary)}</a></li>'
+            for _ in range(rng.randint(5, 40)))
+        content = (
+            f"<html><head><title>{rng.choice(vocabulary)}</title></head>"
+            f"<body><p>{words}</p><ul>{links}</ul></body></html>").encode()
+        writer.add(url, make_body(url, 200, content))
+    writer.close()
+
+
+class Timer(object):
+    ''' Sums up seconds over calls from several threads. '''
+    def __init__(self, clock):
+        self.clock = clock
+        self.lock = Lock()
+        self.seconds = 0
+        self.calls = 0
+
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = self.clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = self.clock() - start
+                with self.lock:
+                    self.seconds += elapsed
+                    self.calls += 1
+        return timed
+
+
+def timed_frontier(frontier_class, timer):
+    # thread cpu time, so waiting on the politeness delay is not counted
+    class TimedFrontier(frontier_class):
+        pass
+    for name in ("add_url", "add_urls", "mark_url_complete", "get_tbd_url", "poll_tbd_url"):
+        if hasattr(frontier_class, name):
+            setattr(TimedFrontier, name, timer.wrap(getattr(frontier_class, name)))
+    return TimedFrontier
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux, children are the parse processes
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def run(args):
+    if args.generate and not os.path.exists(args.corpus):
+        generate_corpus(args.corpus, args.generate)
+    corpus = Corpus(args.corpus)
+
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    for setting in args.set:
+        section, _, setting = setting.partition(":")
+        key, _, value = setting.partition("=")
+        cparser[section][key] = value
+    save_dir = tempfile.mkdtemp()
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(save_dir, "frontier.save")
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    config = Config(cparser)
+
+    parse_timer = Timer(time.perf_counter)
+    frontier_timer = Timer(time.thread_time)
+    scraper.configure(config)
+    scraper.scraper = parse_timer.wrap(scraper.scraper)
+    crawler_factory = AsyncCrawler if config.engine == "async" else Crawler
+    frontier_factory = timed_frontier(FRONTIERS[config.frontier_type], frontier_timer)
+
+    logging.disable(logging.INFO)
+    with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+        if args.server:
+            server = stack.enter_context(
+                LocalCacheServer.replaying(corpus, args.latency / 1000))
+            config.cache_server = server.address
+        else:
+            config.replay_corpus = corpus
+        # the scraper prints a few lines per page
+        stack.enter_context(contextlib.redirect_stdout(devnull))
+        start = time.perf_counter()
+        crawler = crawler_factory(config, True, frontier_factory=frontier_factory)
+        crawler.start()
+        elapsed = time.perf_counter() - start
+        scraper.shutdown()
+    logging.disable(logging.NOTSET)
+
+    pages = parse_timer.calls
+    print(f"{config.engine} engine, {config.frontier_type} frontier, "
+          f"{'server' if args.server else 'in-process'} replay of {len(corpus)} recorded pages")
+    print(f"{'pages':<24} {pages:9d} in {elapsed:.2f}s, {pages / elapsed:,.1f} pages/s")
+    print(f"{'parse':<24} {parse_timer.seconds:9.3f}s wall in scraper.scraper")
+    print(f"{'frontier':<24} {frontier_timer.seconds:9.3f}s cpu in {frontier_timer.calls} calls")
+    print(f"{'peak rss':<24} {peak_rss_mb():9.1f} MB")
+    if scraper.page_cache is not None:
+        print(f"{'page cache':<24} {scraper.page_cache.hits} pages reused, "
+              f"{scraper.page_cache.misses} parsed")
+    corpus.close()
+
+
+def add_arguments(parser):
+    parser.add_argument("--corpus", required=True,
+        help="corpus recorded with RECORD in config.ini (see utils/replay.py)")
+    parser.add_argument("--generate", type=int, default=0,
+        help="write a synthetic corpus of this many pages first if --corpus does not exist")
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--set", nargs="*", default=[],
+        help="config overrides, e.g. CRAWLER:FRONTIER=polite \"LOCAL PROPERTIES:THREADCOUNT=4\"")
+    parser.add_argument("--politeness", type=float, default=0,
+        help="POLITENESS for the replayed crawl, seconds")
+    parser.add_argument("--server", action="store_true",
+        help="replay through a local stand-in cache server instead of in-process")
+    parser.add_argument("--latency", type=float, default=0,
+        help="milliseconds the stand-in server waits before answering (with --server)")
+    parser.set_defaults(run=run)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import report
+from utils.download import download
+from utils.local_cache_server import LocalCacheServer
+
+
+class BenchConfig(object):
+    def __init__(self, cache_server, concurrency):
+        self.cache_server = cache_server
+        self.user_agent = "IR benchmark"
+        self.concurrency = concurrency
+        self.record_corpus = None
+        self.replay_corpus = None
+        self.max_response_bytes = 0
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    return f"{'':<24} latency mean {mean * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+
+
+def run_threads(urls, config, logger):
+    def timed_download(url):
+        start = time.perf_counter()
+        download(url, config, logger)
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.concurrency) as pool:
+        latencies = list(pool.map(timed_download, urls))
+    return time.perf_counter() - start, latencies
+
+
+def run_async(urls, config, logger):
+    from utils.async_download import open_session, download as download_async
+
+    async def crawl():
+        latencies = list()
+        slots = asyncio.Semaphore(config.concurrency)
+        async with open_session(config) as session:
+            async def timed_download(url):
+                async with slots:
+                    start = time.perf_counter()
+                    await download_async(url, config, session, logger)
+                    latencies.append(time.perf_counter() - start)
+            await asyncio.gather(*(timed_download(url) for url in urls))
+        return latencies
+
+    start = time.perf_counter()
+    latencies = asyncio.run(crawl())
+    return time.perf_counter() - start, latencies
+
+
+def run(args):
+    logger = logging.getLogger("benchmark")
+    pages = {
+        f"https://www.ics.uci.edu/page/{i}": b"<html><body>%d</body></html>" % i
+        for i in range(args.pages)}
+    urls = list(pages)
+    with LocalCacheServer(pages, latency=args.latency / 1000) as server:
+        for concurrency in args.concurrency:
+            config = BenchConfig(server.address, concurrency)
+            elapsed, latencies = run_threads(urls, config, logger)
+            report(f"threads x{concurrency}", elapsed, len(urls) / elapsed, "pages")
+            print(latency_summary(latencies))
+            elapsed, latencies = run_async(urls, config, logger)
+            report(f"async x{concurrency}", elapsed, len(urls) / elapsed, "pages")
+            print(latency_summary(latencies))
+
+
+def add_arguments(parser):
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=20,
+        help="milliseconds the stand-in cache server waits before answering")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.set_defaults(run=run)
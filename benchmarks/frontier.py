@@ -0,0 +1,60 @@
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from configparser import ConfigParser
+
+from benchmarks import report
+from benchmarks.url_set import synthetic_urls
+from crawler.frontier import FRONTIERS
+from utils.config import Config
+
+
+def index_pages(pages, links, seed=0):
+    # link heavy pages, about half of every page's links were already on earlier pages
+    rng = random.Random(seed)
+    pool = synthetic_urls(pages * links // 2)
+    return [[rng.choice(pool) for _ in range(links)] for _ in range(pages)]
+
+
+def add_one_by_one(frontier, page, parent):
+    for url in page:
+        frontier.add_url(url, parent=parent)
+
+
+def add_batch(frontier, page, parent):
+    frontier.add_urls(page, parent=parent)
+
+
+def run(args):
+    pages = index_pages(args.pages, args.links)
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    cparser["LOCAL PROPERTIES"]["STORAGE"] = args.storage
+    logging.disable(logging.INFO)
+    print(f"{args.pages} pages of {args.links} links, {args.frontier} frontier, {args.storage} storage")
+    for name, add in (("add_url per link", add_one_by_one), ("add_urls per page", add_batch)):
+        directory = tempfile.mkdtemp()
+        try:
+            cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, "frontier.save")
+            frontier = FRONTIERS[args.frontier](Config(cparser), True)
+            start = time.perf_counter()
+            for i, page in enumerate(pages):
+                add(frontier, page, f"https://www.ics.uci.edu/index/{i}")
+            elapsed = time.perf_counter() - start
+            frontier.close()
+        finally:
+            shutil.rmtree(directory)
+        report(name, elapsed, len(pages) / elapsed, "pages")
+    logging.disable(logging.NOTSET)
+
+
+def add_arguments(parser):
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links", type=int, default=500)
+    parser.add_argument("--frontier", default="polite", choices=sorted(FRONTIERS))
+    parser.add_argument("--storage", default="log", choices=["log", "shelve"])
+    parser.set_defaults(run=run)
@@ -0,0 +1,92 @@
+import os
+import sys
+
+from benchmarks import timed, report
+from page_parser import ENGINES
+from tokenizer import tokenize
+
+SAMPLE_PAGE = b"""<!DOCTYPE html>
+<html><head><title>Department of Statistics</title>
+<style>body { font-family: sans-serif; }</style>
+<script>var nav = "<a href='/not-a-link'>";</script></head>
+<body><!-- header -->
+<div id="nav">%(nav)s</div>
+<h1>Research &amp; Teaching</h1>
+%(paragraphs)s
+<form action="/search"><input name="q"></form>
+</body></html>"""
+
+
+def sample_pages(count=200):
+    pages = list()
+    for i in range(count):
+        nav = "".join(
+            f'<a href="/section/{i}/{j}">Section {j}</a> | ' for j in range(40))
+        paragraphs = "".join(
+            f"<p>Paragraph {j} about probability, inference and "
+            f"<a href='https://www.stat.uci.edu/people/{j}#bio'>faculty</a>"
+            f" research<br>in the department's groups.</p>" for j in range(60))
+        pages.append(SAMPLE_PAGE % {
+            b"nav": nav.encode(), b"paragraphs": paragraphs.encode()})
+    return pages
+
+
+# non-ascii pages, most without a declared charset, and the encodings they are saved in
+NON_ASCII_PAGE = """<html><head>%(meta)s<title>Facultad – Départment</title></head><body>
+<p>José García’s seminar on “naïve” Bayes, Größe and façade.</p>
+<a href="/people/José-García">José</a> <a href="/über/straße?q=ñ">über</a>
+<p>日本語 and Ελληνικά for the utf-8 pages.</p></body></html>"""
+ENCODINGS = [
+    ("utf-8", ""), ("utf-8", '<meta charset="utf-8">'), ("utf-8-sig", ""),
+    ("cp1252", ""), ("cp1252", '<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">'),
+    ("latin-1", '<meta charset="iso-8859-1">'), ("shift_jis", ""), ("utf-16", ""),
+]
+
+
+def non_ascii_pages():
+    pages = list()
+    for encoding, meta in ENCODINGS:
+        page = NON_ASCII_PAGE % {"meta": meta}
+        if encoding not in ("utf-8", "utf-8-sig", "utf-16"):
+            # drop what the encoding cannot hold
+            page = page.encode(encoding, "ignore").decode(encoding)
+        pages.append(page.encode(encoding))
+    return pages
+
+
+def load_pages(directory):
+    pages = list()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as page_file:
+            pages.append(page_file.read())
+    return pages
+
+
+def run(args):
+    pages = (load_pages(args.pages) if args.pages else sample_pages()) + non_ascii_pages()
+    total_bytes = sum(len(page) for page in pages)
+    reference = ENGINES["soup"]
+    differences = 0
+    for page in pages:
+        expected = reference(page)
+        for name, engine in ENGINES.items():
+            text, links, has_form = engine(page)
+            if (links != expected[1] or has_form != expected[2]
+                    or tokenize(text.lower()) != tokenize(expected[0].lower())):
+                differences += 1
+    print(f"{len(pages)} pages ({len(ENCODINGS)} of them non-ascii), {total_bytes / 1e6:.1f} MB, "
+          f"{differences} parsed differently from the soup engine")
+    for name, engine in ENGINES.items():
+        elapsed, rate = timed(engine, pages, args.repeat)
+        report(f"{name} engine", elapsed, rate, "pages")
+        print(f"{'':<24} {total_bytes * args.repeat / elapsed / 1e6:10.1f} MB/s")
+    if differences:
+        sys.exit(f"{differences} pages parsed differently from the soup engine")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--pages", type=str, default=None,
+        help="directory of saved html pages, defaults to generated pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.set_defaults(run=run)
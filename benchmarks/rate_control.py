@@ -0,0 +1,182 @@
+import contextlib
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from configparser import ConfigParser
+from threading import Lock
+
+import scraper
+from crawler import Crawler
+from crawler.frontier import FRONTIERS
+from utils.config import Config
+from utils.local_cache_server import LocalCacheServer
+
+# host -> (seconds per response, how it fails)
+HOSTS = {
+    "ics.uci.edu": (0.02, "healthy"),
+    "cs.uci.edu": (0.4, "slow"),
+    "informatics.uci.edu": (0.05, "flaky"),
+    "stat.uci.edu": (0.02, "throttled"),
+    "vision.ics.uci.edu": (1.0, "dead"),
+}
+FLAKY_ERRORS = 0.3 # share of 503s from the flaky host
+THROTTLE_INTERVAL = 0.3 # the throttled host answers 429 to requests closer together than this
+
+
+class SimulatedSite(object):
+    ''' Pages spread over HOSTS, each answering with its latency and
+    failures, served through LocalCacheServer. Counts what every host was
+    asked for and how many downloads it had in flight at most, and keeps
+    the times of the dead host's requests. '''
+    def __init__(self, pages_per_host, seed=0):
+        rng = random.Random(seed)
+        vocabulary = [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+            for _ in range(3000)]
+        urls = {host: [f"https://{host}/page/{i}" for i in range(pages_per_host)] for host in HOSTS}
+        everything = [url for host_urls in urls.values() for url in host_urls]
+        self.pages = dict()
+        for host, host_urls in urls.items():
+            for url in host_urls:
+                links = rng.sample(host_urls, 5) + rng.sample(everything, 2)
+                self.pages[url] = (
+                    "<html><body><p>" + " ".join(rng.choice(vocabulary) for _ in range(200))
+                    + "</p>" + "".join(f'<a href="{link}">link</a>' for link in links)
+                    + "</body></html>").encode()
+        self.seeds = [urls[host][0] for host in HOSTS if HOSTS[host][1] != "dead"]
+        self.rng = random.Random(seed)
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {host: 0 for host in HOSTS}
+        self.errors = {host: 0 for host in HOSTS}
+        self.in_flight = {host: 0 for host in HOSTS}
+        self.max_in_flight = {host: 0 for host in HOSTS}
+        self.last_request = {host: 0 for host in HOSTS}
+        self.dead_requests = list()
+        self.start = time.time()
+
+    def respond(self, url):
+        host = url.split("/")[2]
+        if host not in HOSTS:
+            return (404, b"")
+        latency, behaviour = HOSTS[host]
+        with self.lock:
+            now = time.time()
+            self.requests[host] += 1
+            self.in_flight[host] += 1
+            self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+            status = 200
+            if behaviour == "dead":
+                status = 502
+                self.dead_requests.append(now)
+            elif behaviour == "flaky" and self.rng.random() < FLAKY_ERRORS:
+                status = 503
+            elif behaviour == "throttled" and now - self.last_request[host] < THROTTLE_INTERVAL:
+                status = 429
+            self.last_request[host] = now
+            if status != 200:
+                self.errors[host] += 1
+        time.sleep(latency)
+        with self.lock:
+            self.in_flight[host] -= 1
+        if status != 200:
+            return (status, b"")
+        return (200, self.pages.get(url, b""))
+
+    def done_at(self, host):
+        # seconds into the crawl of the host's last request
+        return self.last_request[host] - self.start if self.last_request[host] else 0
+
+
+def check_breaker(site, errors, seconds, trips):
+    # the dead host should get errors requests before the breaker opens, then
+    # one probe each time it half-opens, no sooner than its pause (doubled
+    # every time), until the trips-th opening gives it up. How much later
+    # depends on when the crawl comes across another link to the host.
+    latency = HOSTS["vision.ics.uci.edu"][0]
+    times = site.dead_requests
+    expected = errors + trips - 1
+    if len(times) != expected:
+        return [f"the dead host got {len(times)} requests, expected {expected}"]
+    problems = list()
+    for trip in range(1, trips):
+        pause = seconds * 2 ** (trip - 1)
+        gap = times[errors + trip - 1] - times[errors + trip - 2]
+        if gap < latency + pause:
+            problems.append(f"probe {trip} came {gap - latency:.2f}s after the breaker "
+                            f"opened, expected {pause:g}s")
+    return problems
+
+
+def crawl(cparser, site, address, frontier_type):
+    directory = tempfile.mkdtemp()
+    try:
+        cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, "frontier.save")
+        config = Config(cparser)
+        config.cache_server = address
+        scraper.configure(config)
+        site.reset()
+        start = time.perf_counter()
+        Crawler(config, True, frontier_factory=FRONTIERS[frontier_type]).start()
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+
+def run(args):
+    site = SimulatedSite(args.pages)
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(site.seeds)
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["CRAWLER"]["ROBOTS"] = "false"
+    cparser["CRAWLER"]["SIMHASH_DISTANCE"] = "-1"
+    cparser["CRAWLER"]["BREAKER_SECONDS"] = str(args.breaker_seconds)
+    cparser["CRAWLER"]["MAX_BACKOFF"] = str(args.max_backoff)
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    print(f"{len(site.pages)} pages on {len(HOSTS)} hosts, {args.threads} threads, "
+          f"{args.frontier} frontier, POLITENESS {args.politeness}")
+    logging.disable(logging.WARNING)
+    failures = list()
+    with LocalCacheServer(site.respond) as server, open(os.devnull, "w") as devnull:
+        for name, settings in (
+                ("fixed delay", {"RATE_CONTROL": "false"}),
+                ("rate control", {"RATE_CONTROL": "true", "HOST_CONCURRENCY": "1"}),
+                (f"rate control, {args.concurrency} per host",
+                 {"RATE_CONTROL": "true", "HOST_CONCURRENCY": str(args.concurrency)})):
+            cparser["CRAWLER"].update(settings)
+            with contextlib.redirect_stdout(devnull):
+                elapsed = crawl(cparser, site, server.address, args.frontier)
+            ok = sum(site.requests.values()) - sum(site.errors.values())
+            wasted = sum(site.errors[host] * HOSTS[host][0] for host in HOSTS)
+            print(f"{name:<24} {elapsed:9.3f}s {ok:5d} pages, {sum(site.errors.values()):4d} errors, "
+                  f"{wasted:6.1f}s of downloads spent on errors")
+            for host, (_, behaviour) in HOSTS.items():
+                print(f"  {behaviour:<22} {site.requests[host]:5d} requests, "
+                      f"{site.errors[host]:4d} errors, at most {site.max_in_flight[host]} in flight, "
+                      f"last at {site.done_at(host):.1f}s")
+            if settings["RATE_CONTROL"] == "true":
+                failures.extend(f"{name}: {problem}" for problem in check_breaker(
+                    site, cparser["CRAWLER"].getint("BREAKER_ERRORS", 5), args.breaker_seconds,
+                    cparser["CRAWLER"].getint("BREAKER_TRIPS", 3)))
+    logging.disable(logging.NOTSET)
+    if failures:
+        sys.exit("Circuit breaker misbehaved:\n" + "\n".join(failures))
+
+
+def add_arguments(parser):
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--pages", type=int, default=40, help="pages per host")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--frontier", default="lifo", choices=["lifo", "polite", "priority"])
+    parser.add_argument("--politeness", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=4, help="HOST_CONCURRENCY of the last run")
+    parser.add_argument("--breaker_seconds", type=float, default=1)
+    parser.add_argument("--max_backoff", type=float, default=2)
+    parser.set_defaults(run=run)
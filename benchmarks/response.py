@@ -0,0 +1,109 @@
+import contextlib
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+import scraper
+from benchmarks.page_parser import sample_pages
+from utils.config import Config
+from utils.download import download
+from utils.local_cache_server import LocalCacheServer
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+PDF = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n" + b"1 0 obj << /Type /Catalog >> endobj\n" * 500
+# never parsed with limits on, whatever content type they are served with
+BINARY_URLS = [
+    "https://www.stat.uci.edu/logo.png",
+    "https://www.stat.uci.edu/paper",
+    "https://www.stat.uci.edu/paper.pdf",
+]
+
+
+def giant_page(megabytes):
+    paragraph = b"<p>statistics inference probability <a href='/giant/next'>next</a></p>\n"
+    return b"<html><body>" + paragraph * (megabytes * 2**20 // len(paragraph)) + b"</body></html>"
+
+
+def site(giant_mb):
+    # normal pages, a few giant ones and binary files, some served as text/html
+    pages = {f"https://www.stat.uci.edu/page/{i}": (200, page)
+             for i, page in enumerate(sample_pages(100))}
+    for i in range(4):
+        pages[f"https://www.stat.uci.edu/giant/{i}"] = (200, None)
+    pages[BINARY_URLS[0]] = (200, PNG, "image/png")
+    pages[BINARY_URLS[1]] = (200, PDF, "text/html")
+    pages[BINARY_URLS[2]] = (200, PDF, "application/pdf")
+
+    def respond(url):
+        # giant pages are built per request, so they never sit in the benchmark's memory
+        response = pages.get(url, (404, b""))
+        if response[1] is None:
+            return (200, giant_page(giant_mb))
+        return response
+    return list(pages), respond
+
+
+def crawl(config, urls, threads, results):
+    # runs in its own process, so ru_maxrss is only this crawl's peak
+    scraper.configure(config)
+
+    def fetch(url):
+        return scraper.extract_next_links(url, download(url, config, logging.getLogger("benchmark")))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        linked = [url for url, links in zip(urls, pool.map(fetch, urls)) if links]
+    elapsed = time.perf_counter() - start
+    results.put((linked, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run(args):
+    urls, respond = site(args.giant_mb)
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    cparser["CRAWLER"]["PARSER"] = args.engine
+    # the sample pages are near duplicates of each other
+    cparser["CRAWLER"]["SIMHASH_DISTANCE"] = "-1"
+    logging.disable(logging.INFO)
+    print(f"{len(urls)} urls: 100 pages, 4 of {args.giant_mb} MB, 3 binary, {args.threads} threads")
+    peaks = dict()
+    failures = list()
+    with LocalCacheServer(respond) as server, open(os.devnull, "w") as devnull:
+        for name, limits in (("no limits", ("0", "0")), ("limits", (args.max_response, args.max_page))):
+            cparser["CRAWLER"]["MAX_RESPONSE_BYTES"], cparser["CRAWLER"]["MAX_PAGE_BYTES"] = limits
+            config = Config(cparser)
+            config.cache_server = server.address
+            results = multiprocessing.Queue()
+            with contextlib.redirect_stdout(devnull):
+                process = multiprocessing.Process(
+                    target=crawl, args=(config, urls, args.threads, results))
+                process.start()
+                linked, elapsed, peaks[name] = results.get()
+                process.join()
+            print(f"{name:<24} {elapsed:9.3f}s {len(linked):4d} pages with links, "
+                  f"peak rss {peaks[name]:7.1f} MB")
+            if name == "limits":
+                failures += [f"{url} was parsed" for url in BINARY_URLS if url in linked]
+                missing = sum(1 for url in urls if "/page/" in url and url not in linked)
+                if missing:
+                    failures.append(f"{missing} ordinary pages lost their links")
+    logging.disable(logging.NOTSET)
+    if peaks["limits"] >= peaks["no limits"]:
+        failures.append("the limits did not lower the peak rss")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+def add_arguments(parser):
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--engine", default="stream", help="PARSER for the run")
+    parser.add_argument("--giant_mb", type=int, default=24)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--max_response", default="10485760", help="MAX_RESPONSE_BYTES with limits")
+    parser.add_argument("--max_page", default="2097152", help="MAX_PAGE_BYTES with limits")
+    parser.set_defaults(run=run)
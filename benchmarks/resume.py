@@ -0,0 +1,59 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.url_set import synthetic_urls
+from crawler.storage import LogStorage, ShelveStorage
+from url_filter import url_filter
+from utils import get_urlhash, get_canonical_urlhash, normalize
+
+
+def fill(storage, urls, completed):
+    for url in urls:
+        storage.put(get_urlhash(url), (url, False))
+    for url in urls[:completed]:
+        storage.put(get_urlhash(url), (url, True))
+    storage.close()
+
+
+def time_resume(storage_factory, path, logger):
+    ''' Seconds from opening the save file to having the urls to queue. '''
+    start = time.perf_counter()
+    storage = storage_factory(path, 1024, 10, logger, url_filter.version)
+    storage.rekey(normalize, get_canonical_urlhash)
+    pending = storage.pending_records(url_filter.allows)
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return elapsed, len(pending)
+
+
+def run(args):
+    logger = logging.getLogger("benchmark")
+    # the frontier only ever saves urls that passed is_valid
+    urls = [url for url in synthetic_urls(args.urls) if url_filter.is_valid(url)]
+    completed = int(len(urls) * args.completed)
+    directory = tempfile.mkdtemp()
+    try:
+        for name, storage_factory in (("shelve", ShelveStorage), ("log", LogStorage)):
+            path = os.path.join(directory, name)
+            fill(storage_factory(path, 1024, 10, logger, url_filter.version), urls, completed)
+            if storage_factory is LogStorage:
+                checkpoint = f"{path}.checkpoint"
+                shutil.move(checkpoint, f"{checkpoint}.kept")
+                elapsed, pending = time_resume(storage_factory, path, logger)
+                print(f"{'log, full replay':<24} {elapsed:9.3f}s {pending:,} urls to download")
+                shutil.move(f"{checkpoint}.kept", checkpoint)
+                name = "log, checkpoint"
+            elapsed, pending = time_resume(storage_factory, path, logger)
+            print(f"{name:<24} {elapsed:9.3f}s {pending:,} urls to download")
+    finally:
+        shutil.rmtree(directory)
+
+
+def add_arguments(parser):
+    parser.add_argument("--urls", type=int, default=100000)
+    parser.add_argument("--completed", type=float, default=0.5,
+        help="fraction of the urls that were already downloaded")
+    parser.set_defaults(run=run)
@@ -0,0 +1,234 @@
+import contextlib
+import gzip
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from configparser import ConfigParser
+from threading import Lock
+
+import scraper
+import crawler.robots
+from crawler import Crawler
+from crawler.frontier import FRONTIERS
+from utils.config import Config
+from utils.local_cache_server import LocalCacheServer
+
+WORDS = " ".join(f"word{i}" for i in range(300))
+
+RULES_HOST = "ics.uci.edu" # robots.txt with a group for USERAGENT
+CRAWL_DELAY = 0.2
+RULES_ROBOTS = """User-agent: *
+Disallow: /
+
+User-agent: %(agent)s
+Disallow: /private
+Allow: /private/open
+Disallow: /*/print$
+Disallow: /tmp*/cache
+Allow: /public
+Disallow: /public/secret
+Allow: /same
+Disallow: /same
+Crawl-delay: %(delay)s
+"""
+# path on RULES_HOST -> whether its robots.txt lets the crawler download it
+RULES_PATHS = {
+    "/about": True, # no rule
+    "/private": False,
+    "/private/notes": False,
+    "/private/open": True, # the longer allow wins
+    "/private/open/notes": True,
+    "/news/print": False, # * and $
+    "/news/print/page": True, # $ anchors the end
+    "/news/print?page=2": True, # the query is part of the path
+    "/tmp/cache": False,
+    "/tmp2/cache/page": False,
+    "/tmp2/other": True,
+    "/public/page": True,
+    "/public/secret/page": False, # the longer disallow wins
+    "/same/page": True, # allow wins a tie
+}
+
+SITEMAP_HOST = "cs.uci.edu" # robots.txt lists a sitemap index
+SITEMAP_PAGES = 40 # pages only the sitemaps link to, more than --sitemap_urls
+SITEMAP_ROBOTS = """User-agent: *
+Disallow:
+Sitemap: https://cs.uci.edu/sitemap_index.xml
+Sitemap: https://example.com/sitemap.xml
+"""
+
+FLAKY_HOST = "informatics.uci.edu" # robots.txt fails with a 503 once
+DEAD_HOST = "stat.uci.edu" # robots.txt always fails with a 503
+
+
+def urlset(urls):
+    return ('<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + "".join(f"<url><loc>{url}</loc></url>" for url in urls) + "</urlset>").encode()
+
+
+def page(links=()):
+    return (f"<html><body><p>{WORDS}</p>"
+            + "".join(f'<a href="{link}">link</a>' for link in links)
+            + "</body></html>").encode()
+
+
+class RobotsSite(object):
+    ''' The four hosts above, served through LocalCacheServer. Keeps the
+    time of every request per url. '''
+    def __init__(self, user_agent):
+        self.pages = {
+            f"https://{RULES_HOST}/robots.txt": (
+                RULES_ROBOTS % {"agent": user_agent, "delay": CRAWL_DELAY}).encode(),
+            f"https://{RULES_HOST}": page(f"https://{RULES_HOST}{path}" for path in RULES_PATHS),
+            f"https://{SITEMAP_HOST}/robots.txt": SITEMAP_ROBOTS.encode(),
+            f"https://{SITEMAP_HOST}": page(),
+            f"https://{SITEMAP_HOST}/sitemap_index.xml": (
+                '<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f"<sitemap><loc>https://{SITEMAP_HOST}/sitemap1.xml.gz</loc></sitemap>"
+                f"<sitemap><loc>https://{SITEMAP_HOST}/sitemap2.xml</loc></sitemap>"
+                "<sitemap><loc>https://example.com/other.xml</loc></sitemap>"
+                "</sitemapindex>").encode(),
+            f"https://{SITEMAP_HOST}/sitemap1.xml.gz": gzip.compress(urlset(
+                [f"https://{SITEMAP_HOST}/files/report.pdf"]
+                + [f"https://{SITEMAP_HOST}/s/{i}" for i in range(SITEMAP_PAGES // 2)])),
+            f"https://{SITEMAP_HOST}/sitemap2.xml": urlset(
+                f"https://{SITEMAP_HOST}/s/{i}" for i in range(SITEMAP_PAGES // 2, SITEMAP_PAGES)),
+            f"https://{FLAKY_HOST}/robots.txt": b"User-agent: *\nDisallow: /blocked\n",
+            f"https://{FLAKY_HOST}": page(
+                f"https://{FLAKY_HOST}/{path}" for path in ("a", "b", "blocked")),
+            f"https://{DEAD_HOST}": page(f"https://{DEAD_HOST}/a"),
+            f"https://{DEAD_HOST}/a": page(),
+        }
+        for i in range(SITEMAP_PAGES):
+            self.pages[f"https://{SITEMAP_HOST}/s/{i}"] = page()
+        for path in RULES_PATHS:
+            self.pages[f"https://{RULES_HOST}{path}"] = page()
+        for path in ("a", "b", "blocked"):
+            self.pages[f"https://{FLAKY_HOST}/{path}"] = page()
+        self.seeds = [f"https://{host}" for host in (RULES_HOST, SITEMAP_HOST, FLAKY_HOST, DEAD_HOST)]
+        self.lock = Lock()
+        self.requests = dict()
+
+    def respond(self, url):
+        with self.lock:
+            times = self.requests.setdefault(url, list())
+            times.append(time.time())
+        if url == f"https://{DEAD_HOST}/robots.txt" or (
+                url == f"https://{FLAKY_HOST}/robots.txt" and len(times) == 1):
+            return (503, b"")
+        if url not in self.pages:
+            return (404, b"")
+        return (200, self.pages[url], "text/plain" if url.endswith(".txt") else "text/html")
+
+    def fetched(self, host, prefix=""):
+        return sorted(url for url in self.requests
+                      if url.split("/")[2] == host and url.startswith(f"https://{host}{prefix}"))
+
+
+def check(site, frontier, sitemap_urls):
+    # what the crawl fetched against what the robots.txt files allow, one line per problem
+    problems = list()
+    expected = [f"https://{RULES_HOST}"] + sorted(
+        f"https://{RULES_HOST}{path}" for path, allowed in RULES_PATHS.items() if allowed)
+    fetched = [url for url in site.fetched(RULES_HOST) if not url.endswith("/robots.txt")]
+    for url in sorted(set(expected) ^ set(fetched)):
+        problems.append(f"{url} was {'not ' if url in expected else ''}downloaded")
+
+    if frontier.time_delay(RULES_HOST) != CRAWL_DELAY:
+        problems.append(f"the frontier's delay for {RULES_HOST} is "
+                        f"{frontier.time_delay(RULES_HOST)}s, not its Crawl-delay {CRAWL_DELAY}s")
+    starts = sorted(times[0] for url, times in site.requests.items() if url in expected)
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    if gaps and min(gaps) < CRAWL_DELAY * 0.95:
+        problems.append(f"two pages of {RULES_HOST} were downloaded {min(gaps):.3f}s apart")
+
+    sitemap_pages = site.fetched(SITEMAP_HOST, "/s/")
+    if len(sitemap_pages) != min(sitemap_urls, SITEMAP_PAGES):
+        problems.append(f"{len(sitemap_pages)} sitemap pages were downloaded, "
+                        f"expected {min(sitemap_urls, SITEMAP_PAGES)}")
+    for sitemap in ("sitemap_index.xml", "sitemap1.xml.gz", "sitemap2.xml"):
+        if sitemap_urls and f"https://{SITEMAP_HOST}/{sitemap}" not in site.requests:
+            problems.append(f"{sitemap} was not read")
+    for url in site.requests:
+        if "example.com" in url or url.endswith(".pdf"):
+            problems.append(f"{url} was downloaded")
+
+    robots = len(site.requests.get(f"https://{FLAKY_HOST}/robots.txt", ()))
+    if robots != 2:
+        problems.append(f"the robots.txt that failed once was fetched {robots} times, expected 2")
+    fetched = site.fetched(FLAKY_HOST)
+    for path in ("", "/a", "/b"):
+        if f"https://{FLAKY_HOST}{path}" not in fetched:
+            problems.append(f"https://{FLAKY_HOST}{path} was not downloaded after its robots.txt loaded")
+    if f"https://{FLAKY_HOST}/blocked" in fetched:
+        problems.append(f"https://{FLAKY_HOST}/blocked was downloaded")
+
+    robots = len(site.requests.get(f"https://{DEAD_HOST}/robots.txt", ()))
+    if robots != crawler.robots.FAILED_LOADS:
+        problems.append(f"the robots.txt that always fails was fetched {robots} times, "
+                        f"expected {crawler.robots.FAILED_LOADS}")
+    fetched = [url for url in site.fetched(DEAD_HOST) if not url.endswith("/robots.txt")]
+    if fetched or f"https://{DEAD_HOST}" in site.requests:
+        problems.append(f"{DEAD_HOST} pages were downloaded while its robots.txt failed")
+    return problems
+
+
+def crawl(cparser, site, address, frontier_type):
+    directory = tempfile.mkdtemp()
+    try:
+        cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, "frontier.save")
+        config = Config(cparser)
+        config.cache_server = address
+        scraper.configure(config)
+        site.requests = dict()
+        start = time.perf_counter()
+        robots_crawler = Crawler(config, True, frontier_factory=FRONTIERS[frontier_type])
+        robots_crawler.start()
+        return time.perf_counter() - start, robots_crawler.frontier
+    finally:
+        shutil.rmtree(directory)
+
+
+def run(args):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    site = RobotsSite(cparser["IDENTIFICATION"]["USERAGENT"].strip())
+    cparser["CRAWLER"]["SEEDURL"] = ",".join(site.seeds)
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    cparser["CRAWLER"]["ROBOTS"] = "true"
+    cparser["CRAWLER"]["SITEMAP_URLS"] = str(args.sitemap_urls)
+    cparser["CRAWLER"]["SIMHASH_DISTANCE"] = "-1"
+    cparser["CRAWLER"]["MAX_BACKOFF"] = str(args.failed_ttl)
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(args.threads)
+    # the robots.txt that failed is fetched again after --failed_ttl instead of two minutes
+    crawler.robots.FAILED_TTL = args.failed_ttl
+    print(f"{len(site.pages)} pages on 4 hosts, {args.threads} threads, SITEMAP_URLS "
+          f"{args.sitemap_urls}, robots.txt failures retried after {args.failed_ttl}s")
+    logging.disable(logging.WARNING)
+    failures = list()
+    with LocalCacheServer(site.respond) as server, open(os.devnull, "w") as devnull:
+        for frontier_type in args.frontiers:
+            with contextlib.redirect_stdout(devnull):
+                elapsed, frontier = crawl(cparser, site, server.address, frontier_type)
+            problems = check(site, frontier, args.sitemap_urls)
+            print(f"{frontier_type:<24} {elapsed:9.3f}s {sum(map(len, site.requests.values())):5d} requests, "
+                  f"{len(problems)} problems")
+            failures.extend(f"{frontier_type}: {problem}" for problem in problems)
+    logging.disable(logging.NOTSET)
+    if failures:
+        sys.exit("The crawl did not follow robots.txt:\n" + "\n".join(failures))
+
+
+def add_arguments(parser):
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--frontiers", nargs="+", default=["lifo", "polite", "priority"],
+        choices=["lifo", "polite", "priority"])
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--politeness", type=float, default=0.01)
+    parser.add_argument("--sitemap_urls", type=int, default=25)
+    parser.add_argument("--failed_ttl", type=float, default=0.3,
+        help="seconds before a robots.txt that failed is fetched again")
+    parser.set_defaults(run=run)
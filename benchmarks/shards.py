@@ -0,0 +1,120 @@
+import contextlib
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from configparser import ConfigParser
+
+import scraper
+import traps
+from benchmarks.crawl import generate_corpus
+from crawler import Crawler
+from crawler.distributed import DistributedCrawler
+from crawler.frontier import FRONTIERS
+from url_filter import url_filter
+from utils.config import Config
+from utils.replay import open_corpus, close_corpus
+
+
+def summary():
+    # what print_summary reports, in a form two crawls can be compared by
+    return {
+        "unique links": len(scraper.unique_links),
+        "duplicates avoided": scraper.duplicates_avoided,
+        "pages": len(scraper.word_count),
+        "longest page": scraper.word_count.longest_page(),
+        "word frequencies": dict(scraper.all_word_freq.counts),
+        "subdomains": dict(scraper.subdomain_count),
+        "rejections": dict(url_filter.rejections),
+        "blocked templates": dict(traps.trap_detector.blocked),
+        "blocked hosts": dict(traps.trap_detector.blocked_hosts),
+    }
+
+
+def crawl_once(config, results):
+    open_corpus(config)
+    scraper.configure(config)
+    Crawler(config, True, frontier_factory=FRONTIERS[config.frontier_type]).start()
+    close_corpus(config)
+    scraper.shutdown()
+    results.put(summary())
+
+
+def crawl_sharded(config, results):
+    # like launch.py: the shards open their own corpus and scraper state
+    scraper.configure_stats(config)
+    DistributedCrawler(config, True, frontier_factory=FRONTIERS[config.frontier_type]).start()
+    results.put(summary())
+
+
+def timed_crawl(target, config):
+    ''' (seconds, summary) of a crawl in a forked process, so every crawl
+    starts from empty scraper globals. '''
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(config, results))
+    start = time.perf_counter()
+    process.start()
+    result = results.get()
+    elapsed = time.perf_counter() - start
+    process.join()
+    return elapsed, result
+
+
+def run(args):
+    if args.generate and not os.path.exists(args.corpus):
+        generate_corpus(args.corpus, args.generate)
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    for setting in args.set:
+        section, _, setting = setting.partition(":")
+        key, _, value = setting.partition("=")
+        cparser[section][key] = value
+    cparser["LOCAL PROPERTIES"]["REPLAY"] = args.corpus
+    cparser["LOCAL PROPERTIES"]["RECORD"] = ""
+    cparser["CRAWLER"]["POLITENESS"] = "0"
+    # the near-duplicate check keeps whichever copy of a page comes first, which depends on the order
+    cparser["CRAWLER"]["SIMHASH_DISTANCE"] = "-1"
+    cparser["CRAWLER"]["WORD_FREQUENCIES"] = "exact"
+    directory = tempfile.mkdtemp()
+    multiprocessing.set_start_method("fork", force=True)
+    logging.disable(logging.INFO)
+    try:
+        results = dict()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for shards in [1] + args.shards:
+                cparser["CRAWLER"]["SHARDS"] = str(shards)
+                cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, f"shards{shards}.save")
+                config = Config(cparser)
+                results[shards] = timed_crawl(crawl_sharded if shards > 1 else crawl_once, config)
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(directory)
+
+    single = results[1][1]
+    print(f"{config.engine} engine, {config.frontier_type} frontier, replay of {args.corpus}, "
+          f"{single['pages']} pages")
+    failures = list()
+    for shards, (elapsed, merged) in results.items():
+        different = [name for name in single if merged[name] != single[name]]
+        print(f"{shards:>2} processes {elapsed:9.3f}s {merged['pages']:7d} pages, "
+              f"{merged['unique links']:7d} unique links, "
+              f"{'same summary' if not different else 'differs in ' + ', '.join(different)}")
+        failures.extend(f"{shards} processes: {name} differs" for name in different)
+    if failures:
+        sys.exit("The sharded crawl's summary is not the single process one:\n" + "\n".join(failures))
+
+
+def add_arguments(parser):
+    parser.add_argument("--corpus", required=True,
+        help="corpus recorded with RECORD in config.ini (see utils/replay.py)")
+    parser.add_argument("--generate", type=int, default=0,
+        help="write a synthetic corpus of this many pages first if --corpus does not exist")
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4],
+        help="SHARDS of the crawls compared with a single process one")
+    parser.add_argument("--set", nargs="*", default=[],
+        help="config overrides, e.g. CRAWLER:FRONTIER=polite \"LOCAL PROPERTIES:THREADCOUNT=4\"")
+    parser.set_defaults(run=run)
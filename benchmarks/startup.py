@@ -0,0 +1,111 @@
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from configparser import ConfigParser
+
+from benchmarks.crawl import generate_corpus
+from utils.metrics import MetricsExporter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs launch.py in a fresh interpreter and prints the time the first download
+# returned, then exits. utils.download is patched before anything imports it.
+FIRST_DOWNLOAD = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import utils.download
+download = utils.download.download
+def first_download(*args, **kwargs):
+    response = download(*args, **kwargs)
+    print(time.time(), flush=True)
+    os._exit(0)
+utils.download.download = first_download
+import launch
+launch.main(sys.argv[1], True)
+"""
+
+
+def import_times(stderr):
+    ''' (module, cumulative microseconds) of the top level imports in the
+    -X importtime lines of stderr, slowest first. '''
+    imports = list()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "): # nested imports are indented
+            imports.append((name.strip(), int(cumulative)))
+    return sorted(imports, key=lambda item: -item[1])
+
+
+def first_download(config_file, directory):
+    ''' Seconds from starting the interpreter to the first download, and the
+    top level imports up to then. '''
+    start = time.time()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FIRST_DOWNLOAD.format(root=ROOT), config_file],
+        cwd=directory, capture_output=True, text=True)
+    lines = child.stdout.split()
+    if not lines:
+        raise RuntimeError(f"launch.py did not download anything:\n{child.stderr[-2000:]}")
+    return float(lines[-1]) - start, import_times(child.stderr)
+
+
+def check_exporter():
+    # the runs above have no metrics port, http.server is imported lazily
+    # for it and this makes sure that path still serves
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    exporter = MetricsExporter(port=port).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10) as response:
+            body = response.read()
+    finally:
+        exporter.stop()
+    print(f"metrics exporter served {len(body)} bytes on port {port}")
+
+
+def run(args):
+    directory = tempfile.mkdtemp()
+    try:
+        corpus = os.path.join(directory, "startup.corpus")
+        generate_corpus(corpus, 50)
+        cparser = ConfigParser()
+        cparser.read(args.config_file)
+        cparser["LOCAL PROPERTIES"]["REPLAY"] = corpus
+        cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, "frontier.save")
+        cparser["LOCAL PROPERTIES"]["METRICS_PORT"] = "0"
+        cparser["LOCAL PROPERTIES"]["METRICS_FILE"] = ""
+        cparser["CRAWLER"]["SEEDURL"] = "https://ics.uci.edu"
+        print(f"launch.py replaying a recorded corpus, median of {args.repeat} runs")
+        for threads in args.threads:
+            cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(threads)
+            config_file = os.path.join(directory, f"startup{threads}.ini")
+            with open(config_file, "w") as ini:
+                cparser.write(ini)
+            runs = [first_download(config_file, directory) for _ in range(args.repeat)]
+            seconds = statistics.median(elapsed for elapsed, _ in runs)
+            imports = runs[-1][1]
+            print(f"{f'{threads} threads':<24} {seconds:9.3f}s to the first download, "
+                  f"{sum(us for _, us in imports) / 1e6:.3f}s of imports")
+        print("slowest imports before the first download (-X importtime, cumulative)")
+        for name, us in imports[:args.top]:
+            print(f"{name:<24} {us / 1e6:9.3f}s")
+        check_exporter()
+    finally:
+        shutil.rmtree(directory)
+
+
+def add_arguments(parser):
+    parser.add_argument("--config_file", default="config.ini")
+    parser.add_argument("--threads", type=int, nargs="*", default=[1, 64])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="number of slowest imports to list")
+    parser.set_defaults(run=run)
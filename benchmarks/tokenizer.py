@@ -0,0 +1,82 @@
+import random
+
+from benchmarks import timed, report
+from benchmarks.page_parser import sample_pages
+from page_parser import parse_stream
+from tokenizer import tokenize, computeWordFrequencies, STOP_WORDS
+
+
+def reference_tokenize(text_string):
+    ''' tokenizer.tokenize as it was before, one character at a time. '''
+    token_list = []
+    token = []
+    alphanum = set("abcdefghijklmnopqrstuvwxyz'")
+    for char in text_string:
+        if char.lower() in alphanum:
+            token.append(char.lower())
+        else:
+            if token:
+                token_string = ''.join(token)
+                if token_string not in STOP_WORDS and len(token_string)>1:
+                    token_list.append(token_string)
+                token = []
+    if token:
+        token_string = ''.join(token)
+        if token_string not in STOP_WORDS and len(token_string)>1:
+            token_list.append(token_string)
+    return token_list
+
+
+def reference_word_frequencies(token_list):
+    word_freq={}
+    for token in token_list:
+        if token not in word_freq:
+            word_freq[token]=1
+        else:
+            word_freq[token]+=1
+    return word_freq
+
+
+def random_texts(count, seed=0):
+    ''' Text that mixes ascii words with apostrophes, digits, punctuation and
+    non-ascii letters (including the kelvin sign and dotted capital I). '''
+    rng = random.Random(seed)
+    alphabet = "abcXYZ'' 0123.,-\n\tééİKß "
+    words = list(STOP_WORDS)[:20] + ["Research", "don't", "o'clock", "x"]
+    texts = list()
+    for _ in range(count):
+        pieces = list()
+        for _ in range(rng.randint(0, 400)):
+            if rng.random() < 0.5:
+                pieces.append(rng.choice(words))
+            else:
+                pieces.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))))
+        texts.append(rng.choice(["", " ", "\n"]).join(pieces))
+    return texts
+
+
+def run(args):
+    texts = random_texts(args.random)
+    pages = [parse_stream(page)[0].lower() for page in sample_pages(50)]
+    mismatches = sum(
+        1 for text in texts + pages
+        if tokenize(text) != reference_tokenize(text)
+        or computeWordFrequencies(tokenize(text))
+            != reference_word_frequencies(reference_tokenize(text)))
+    print(f"{len(texts)} random texts, {len(pages)} pages, "
+          f"{mismatches} tokenized differently")
+    total_chars = sum(len(page) for page in pages) * args.repeat
+    elapsed, rate = timed(reference_tokenize, pages, args.repeat)
+    report("reference tokenize", elapsed, total_chars / elapsed, "chars")
+    elapsed, rate = timed(tokenize, pages, args.repeat)
+    report("tokenize", elapsed, total_chars / elapsed, "chars")
+    token_lists = [tokenize(page) for page in pages]
+    report("reference frequencies", *timed(reference_word_frequencies, token_lists, args.repeat), "pages")
+    report("computeWordFrequencies", *timed(computeWordFrequencies, token_lists, args.repeat), "pages")
+
+
+def add_arguments(parser):
+    parser.add_argument("--random", type=int, default=2000,
+        help="number of random texts checked for equivalence")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.set_defaults(run=run)
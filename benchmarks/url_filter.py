@@ -0,0 +1,151 @@
+import re
+import sys
+from urllib.parse import urlparse
+
+from benchmarks import timed, report
+from url_filter import UrlFilter
+from utils.canonical import Canonicalizer
+
+# a small corpus that goes through most of the rules, used when no link file is given
+SAMPLE_LINKS = [
+    "https://www.ics.uci.edu",
+    "https://www.ics.uci.edu/about/people/index.php",
+    "https://wics.ics.uci.edu/events/2021/05/12",
+    "https://www.stat.uci.edu/faculty/",
+    "https://www.informatics.uci.edu/research/labs-centers/",
+    "https://cs.uci.edu/news/2020/01/15/some-story",
+    "https://wiki.ics.uci.edu/doku.php/projects:start?do=diff&rev=1234",
+    "https://wiki.ics.uci.edu/doku.php/accounts:login",
+    "https://www.ics.uci.edu/~eppstein/pubs/?C=N;O=D",
+    "https://www.ics.uci.edu/~dechter/publications/r1.pdf",
+    "https://today.uci.edu/department/information_computer_sciences/news",
+    "https://today.uci.edu/campus/news",
+    "https://www.google.com/search?q=uci",
+    "mailto:someone@ics.uci.edu",
+    "https://gitlab.ics.uci.edu/group/project",
+    "https://www.ics.uci.edu/a/b/c/d/e/f/g/h/i/j",
+    "https://www.ics.uci.edu/a/a/a/a",
+    "https://vision.ics.uci.edu/papers/index.html",
+    "https://www.cs.uci.edu/calendar/?month=2",
+    "https://ngs.ics.uci.edu/blog/page/3/?share=twitter",
+    "https://www.ics.uci.edu/~someone/code/Main.java",
+    "https://www.ics.uci.edu/community/news/view_news?id=1234",
+]
+
+# urls that take more than one pass of a careless canonicalizer
+CANONICAL_LINKS = [
+    "https://www.ics.uci.edu/a/index.html/",
+    "https://www.ics.uci.edu/a/index.html/index.php/",
+    "http://www.ics.uci.edu:443/about",
+    "http://www.www.ics.uci.edu/about/",
+    "HTTP://WWW.ICS.UCI.EDU:80/%7Eeppstein/%69ndex.html?b=2&a=1#top",
+]
+
+
+def reference_is_valid(url):
+    ''' scraper.is_valid as it was before the rule engine, minus the prints. '''
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False
+    domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+    if not (any(parsed.netloc.endswith(domain) for domain in domains) or
+        ("today.uci.edu" in parsed.netloc and
+         "/department/information_computer_sciences" in parsed.path)):
+        return False
+    if len(url) > 2000:
+        return False
+    if re.search(r"calendar|/>(year|month|day)=\d+", parsed.path.lower()):
+        return False
+    if re.search(r"events?/(\d{4}|\d{2})/(\d{2})/(\d{2})|events?/category|events?/tag|events?/\d+|events?/page/\d+|events?/day/|events?/month/|events?/week/|events?/archive", parsed.path.lower()):
+        return False
+    if re.search(r"/(20\d{2})/(0[1-9]|1[0-2])/(0[1-9]|[12]\d|3[01])|/(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)|(january|february|march|april|may|june|july|august|september|october|november|december)/", parsed.path.lower()):
+        return False
+    path_segments = parsed.path.split('/')
+    if len(path_segments) > 8:
+        return False
+    if len(set(path_segments)) < len(path_segments) / 2:
+        return False
+    for i in range(1, len(path_segments)):
+        if path_segments[i] and path_segments[i] == path_segments[i-1]:
+            return False
+    if "share=" in parsed.query:
+        return False
+    if "ical" in parsed.path or "ical" in parsed.query:
+        return False
+    if "do=diff" in parsed.path or "do=diff" in parsed.query:
+        return False
+    if "idx=" in parsed.query:
+        return False
+    if "rev=" in parsed.query:
+        return False
+    if "action=download" in parsed.query:
+        return False
+    if "wiki.ics.uci.edu" in parsed.netloc and (
+        "do=media" in parsed.query or "image=" in parsed.query
+    ):
+        return False
+    if "pdf" in parsed.path:
+        return False
+    if "redirect_to" in parsed.query or "login.php" in parsed.path:
+        return False
+    if re.search(r"\.(java|py|js)$", parsed.path.lower()):
+        return False
+    if "git" in parsed.path or "git" in parsed.query:
+        return False
+    if any(domain in parsed.netloc for domain in ["wics.ics.uci.edu", "isg.ics.uci.edu", "ics.uci.edu"]) and re.search(r"events?/|calendar/|schedule/", parsed.path.lower()):
+        return False
+    if "wiki.ics.uci.edu" in parsed.netloc and (
+        "/doku.php/accounts:" in parsed.path or
+        "/doku.php/login" in parsed.path or
+        "?do=login" in parsed.query
+    ):
+        return False
+    if re.search(r"[?&]C=(N|S);O=(A|D)", parsed.query):
+        return False
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz|ics|apk|war|img|jpg|scm|mpg|ppsx|frk|shar|lif|php)$", parsed.path.lower())
+
+
+def run(args):
+    if args.links:
+        with open(args.links) as links_file:
+            links = [line.strip() for line in links_file if line.strip()]
+    else:
+        links = SAMPLE_LINKS
+    url_filter = UrlFilter()
+    mismatches = [
+        link for link in links
+        if reference_is_valid(link) != url_filter.is_valid(link)]
+    print(f"{len(links)} links, {len(mismatches)} decided differently")
+    for link in mismatches[:10]:
+        print(f"  {link}")
+    # canonical urls have to stay as they are, or a url hashes differently in the frontier
+    canonicalize = Canonicalizer().canonicalize
+    unstable = [
+        link for link in links + CANONICAL_LINKS
+        if canonicalize(canonicalize(link)) != canonicalize(link)]
+    print(f"{len(unstable)} links canonicalized differently the second time")
+    for link in unstable[:10]:
+        print(f"  {link} -> {canonicalize(link)} -> {canonicalize(canonicalize(link))}")
+    report("reference is_valid", *timed(reference_is_valid, links, args.repeat))
+    report("compiled is_valid", *timed(url_filter.is_valid, links, args.repeat))
+    print("Rejections by rule:")
+    for rule, count in url_filter.rejections.most_common():
+        print(f"  {rule}: {count // (args.repeat + 1)}")
+    if mismatches or unstable:
+        sys.exit(f"{len(mismatches)} links decided differently, {len(unstable)} not canonical")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--links", type=str, default=None,
+        help="file with one url per line, defaults to a small built-in sample")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.set_defaults(run=run)
@@ -0,0 +1,70 @@
+import random
+import time
+import tracemalloc
+
+from benchmarks import report
+from utils import get_urlhash
+from utils.url_set import UrlSet
+
+
+def synthetic_urls(count, seed=0):
+    rng = random.Random(seed)
+    hosts = ["www.ics.uci.edu", "wiki.ics.uci.edu", "www.stat.uci.edu",
+             "www.informatics.uci.edu", "vision.ics.uci.edu"]
+    return [
+        f"https://{rng.choice(hosts)}/{rng.choice(['people', 'research', 'news', 'doku.php'])}"
+        f"/{rng.getrandbits(40):x}/page-{i}.html"
+        for i in range(count)]
+
+
+def measure(build):
+    ''' Returns (structure, bytes allocated while building it). '''
+    tracemalloc.start()
+    structure = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return structure, size
+
+
+def run(args):
+    urls = synthetic_urls(args.urls)
+    unseen = synthetic_urls(args.urls, seed=1)
+    # the set and the map keep their own copy of every url string, as
+    # scraper.unique_links and the frontier's save did
+    def build_set():
+        seen = set()
+        for url in urls:
+            seen.add((url + " ")[:-1])
+        return seen
+
+    def build_hex_map():
+        save = dict()
+        for url in urls:
+            save[get_urlhash(url)] = ((url + " ")[:-1], True)
+        return save
+
+    def build_url_set():
+        seen = UrlSet()
+        for url in urls:
+            seen.add(url)
+        return seen
+
+    print(f"{len(urls)} urls")
+    for name, build in [("set of urls", build_set),
+                        ("sha256 hex -> record", build_hex_map),
+                        ("UrlSet", build_url_set)]:
+        structure, size = measure(build)
+        print(f"{name:<24} {size / len(urls):8.1f} bytes/url")
+        if name == "sha256 hex -> record":
+            continue
+        lookups = urls[:len(urls) // 2] + unseen[:len(urls) // 2]
+        start = time.perf_counter()
+        for url in lookups:
+            url in structure
+        elapsed = time.perf_counter() - start
+        report(f"{name} lookups", elapsed, len(lookups) / elapsed, "lookups")
+
+
+def add_arguments(parser):
+    parser.add_argument("--urls", type=int, default=200000)
+    parser.set_defaults(run=run)
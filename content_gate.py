@@ -0,0 +1,162 @@
+import re
+import time
+from collections import Counter
+from threading import Lock
+
+MIN_TOKENS = 15 # pages with fewer tokens are low information, see analyze_page in scraper.py
+
+# phrases of dead pages and of login pages, matched against the lowered text of a page
+DEAD_PAGE_PHRASES = (
+    "page not found",
+    "page could not be found",
+    "page does not exist",
+    "404 not found",
+    "error 404",
+    "problem loading page",
+    "content not available",
+    "content not found",
+    "no results found",
+    "no results available",
+    "resource not available",
+    "resource not found",
+    "not a valid page",
+    "the requested url was not found on this server.",
+)
+LOGIN_PHRASES = (
+    "login",
+    "log in",
+    "sign in",
+    "username",
+    "password",
+    "authentication",
+    "credentials",
+    "insufficient access privileges",
+    "access to information in these pages are restricted",
+    "please make sure to login",
+    "you are currently not logged in",
+)
+
+
+def phrase_pattern(phrases, tails=None):
+    ''' One regex for all the phrases, factored into a trie: phrases with
+    the same start share it ("content not (?:available|found)"), so at every
+    position re tries one branch per first character instead of one per
+    phrase. Matches what "any(phrase in text)" would. tails maps a phrase to
+    a regex that has to follow it. '''
+    tails = tails or dict()
+    trie = dict()
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, dict())
+        node[""] = tails.get(phrase, "") # a phrase ends here
+
+    def branches(node):
+        alternatives = [re.escape(char) + branches(node[char]) for char in sorted(node) if char]
+        if node.get(""):
+            alternatives.append(node[""])
+        if not alternatives:
+            return ""
+        group = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        if node.get("") == "":
+            # a shorter phrase ends here, the rest is optional
+            return (group if len(alternatives) > 1 else f"(?:{group})") + "?"
+        return group
+    return branches(trie)
+
+
+DEAD_PAGE = re.compile(phrase_pattern(DEAD_PAGE_PHRASES))
+LOGIN = re.compile(phrase_pattern(LOGIN_PHRASES))
+
+# everything the parsers leave out of the text: script/style/template bodies, comments and tags.
+# form tags are kept, PHRASES takes them whole. A < that does not start a tag is text to lxml too.
+MARKUP = re.compile(
+    rb"<(script|style|template)\b.*?</\1\s*>|<!--.*?-->|<(?!form\b)[a-z/!?][^>]*>", re.S)
+DEAD_PAGE_BYTES = frozenset(phrase.encode() for phrase in DEAD_PAGE_PHRASES)
+PHRASES = re.compile(phrase_pattern(
+    DEAD_PAGE_PHRASES + LOGIN_PHRASES + ("<form",), {"<form": r"\b[^>]*>"}).encode())
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+def check(content):
+    ''' The rule a page fails before it is parsed, or None when it has to be
+    parsed. Works on the raw bytes: they are lowered, the markup is cut out
+    with one regex and one combined regex finds the phrases and forms.
+
+    thin: too little text left for MIN_TOKENS tokens of two letters.
+    dead: a DEAD_PAGE_PHRASES phrase in the text.
+    login: a LOGIN_PHRASES phrase in the text and a form on the page.
+
+    These are the checks analyze_page makes after parsing, so a page the gate
+    lets through can still be skipped there (entities, broken markup). '''
+    if len(content) < 2 * MIN_TOKENS:
+        return "thin"
+    text = MARKUP.sub(b" ", content.lower())
+    if len(text.translate(None, WHITESPACE)) < 2 * MIN_TOKENS:
+        return "thin"
+    login = has_form = False
+    for match in PHRASES.finditer(text):
+        phrase = match.group()
+        if phrase in DEAD_PAGE_BYTES:
+            return "dead"
+        if phrase.startswith(b"<form"):
+            has_form = True
+        else:
+            login = True
+    return "login" if login and has_form else None
+
+
+class ContentGate(object):
+    ''' check() in front of the parser, with the numbers to tell whether it
+    pays off: how often every rule fired, how long the gate itself took, and
+    an estimate of the parse time it saved (the bytes it skipped times the
+    seconds per byte of the pages that were parsed). '''
+    def __init__(self):
+        self.lock = Lock()
+        self.skips = Counter() # rule -> pages skipped
+        self.passed = 0
+        self.gate_seconds = 0.0
+        self.skipped_bytes = 0
+        self.parsed_bytes = 0
+        self.parse_seconds = 0.0
+
+    def check(self, content):
+        start = time.perf_counter()
+        rule = check(content)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.gate_seconds += elapsed
+            if rule is None:
+                self.passed += 1
+            else:
+                self.skips[rule] += 1
+                self.skipped_bytes += len(content)
+        return rule
+
+    def parsed(self, size, seconds):
+        # a page the gate let through took seconds to parse and tokenize
+        with self.lock:
+            self.parsed_bytes += size
+            self.parse_seconds += seconds
+
+    def saved_seconds(self):
+        with self.lock:
+            if not self.parsed_bytes:
+                return 0.0
+            return self.skipped_bytes * self.parse_seconds / self.parsed_bytes
+
+    def stats(self):
+        # {name: value} for metrics.collect
+        with self.lock:
+            stats = {"passed": self.passed, "gate_seconds": round(self.gate_seconds, 6)}
+        stats["parse_seconds_saved"] = round(self.saved_seconds(), 6)
+        return stats
+
+    def summary(self):
+        with self.lock:
+            skips = ", ".join(f"{rule} {count}" for rule, count in self.skips.most_common())
+            skipped = sum(self.skips.values())
+            passed, gate_seconds = self.passed, self.gate_seconds
+        return (f"Content gate skipped {skipped} of {skipped + passed} pages before parsing"
+                f"{f' ({skips})' if skips else ''}, saving about {self.saved_seconds():.2f}s"
+                f" of parsing for {gate_seconds:.2f}s of checks.")
@@ -1,5 +1,6 @@
 from utils import get_logger
 from crawler.frontier import Frontier
+from crawler.robots import open_robots
 from crawler.worker import Worker
 
 class Crawler(object):
@@ -7,20 +8,29 @@ class Crawler(object):
         self.config = config
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
+        self.robots = open_robots(config, self.frontier)
         self.workers = list()
         self.worker_factory = worker_factory
 
     def start_async(self):
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+            self.worker_factory(worker_id, self.config, self.frontier, self.robots)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
 
     def start(self):
+        self.run()
+        self.close()
+
+    def run(self):
+        # crawl until the frontier is empty, the frontier stays open
         self.start_async()
         self.join()
 
+    def close(self):
+        self.frontier.close()
+
     def join(self):
         for worker in self.workers:
             worker.join()
@@ -0,0 +1,108 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from crawler.frontier import PoliteFrontier
+from crawler.robots import open_robots, RobotsUnavailable
+from utils import get_logger
+from utils.async_download import open_session, download
+from utils.metrics import metrics, RateLimitedLog
+import scraper
+
+
+class AsyncCrawler(object):
+    ''' Crawls from one event loop instead of worker threads. Up to
+    config.concurrency downloads are in flight at once over a pooled
+    keep-alive session to the cache server. Per host politeness comes from
+    the frontier, which has to offer poll_tbd_url (PoliteFrontier does). '''
+    def __init__(self, config, restart, frontier_factory=PoliteFrontier):
+        self.config = config
+        self.logger = get_logger("CRAWLER")
+        self.frontier = frontier_factory(config, restart)
+        self.download_log = RateLimitedLog(self.logger, config.log_interval)
+        if not hasattr(self.frontier, "poll_tbd_url"):
+            raise ValueError(
+                "The async crawler needs a frontier with poll_tbd_url, "
+                "set FRONTIER = polite.")
+        # scraping is cpu bound, keep it off the event loop. With a parse
+        # process pool one thread per process keeps them all busy.
+        self.scrape_executor = ThreadPoolExecutor(
+            max_workers=max(1, config.parse_processes))
+        # fetching a robots.txt blocks, as many threads as downloads in flight
+        self.robots = open_robots(config, self.frontier)
+        self.robots_executor = ThreadPoolExecutor(max_workers=config.concurrency)
+        # adding and completing urls writes and syncs the save file, one
+        # thread does it in order while the loop keeps downloading
+        self.frontier_executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self):
+        self.run()
+        self.close()
+
+    def run(self):
+        # crawl until the frontier is empty, the frontier stays open
+        asyncio.run(self._crawl())
+
+    def close(self):
+        self.scrape_executor.shutdown()
+        self.robots_executor.shutdown()
+        self.frontier_executor.shutdown()
+        self.frontier.close()
+
+    async def _crawl(self):
+        in_flight = set()
+        async with open_session(self.config) as session:
+            while True:
+                url, wait = None, None
+                if len(in_flight) < self.config.concurrency:
+                    url, wait = self.frontier.poll_tbd_url()
+                if url:
+                    in_flight.add(asyncio.ensure_future(self._crawl_url(url, session)))
+                    continue
+                if not in_flight:
+                    if wait is None:
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+                # wait for a download to finish or for the next host to be ready
+                done, in_flight = await asyncio.wait(
+                    in_flight, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+
+    async def _crawl_url(self, url, session):
+        loop = asyncio.get_running_loop()
+        retry_at = None
+        try:
+            await self._fetch(url, session, loop)
+        except RobotsUnavailable as e:
+            # nothing is known about the url yet, it goes back to the frontier
+            self.download_log.info("robots_unavailable", url=url)
+            retry_at = e.retry_at
+        except Exception:
+            self.logger.exception(f"Failed to crawl {url}, skipping it.")
+        finally:
+            # completing the url frees its host, without it the crawl never ends
+            if retry_at is None:
+                await loop.run_in_executor(
+                    self.frontier_executor, self.frontier.mark_url_complete, url)
+            else:
+                await loop.run_in_executor(
+                    self.frontier_executor, self.frontier.defer_url, url, retry_at)
+
+    async def _fetch(self, url, session, loop):
+        if self.robots is not None and not await loop.run_in_executor(
+                self.robots_executor, self.robots.allowed, url):
+            self.download_log.info("robots_disallowed", url=url)
+            return
+        with metrics.timer("download") as timer:
+            resp = await download(url, self.config, session, self.logger)
+        self.frontier.record_download(url, resp.status, timer.elapsed)
+        self.download_log.info(
+            "downloaded", url=url, status=resp.status,
+            cache=self.config.cache_server)
+        scraped_urls = await loop.run_in_executor(
+            self.scrape_executor, scraper.scraper, url, resp)
+        await loop.run_in_executor(
+            self.frontier_executor, partial(self.frontier.add_urls, scraped_urls, parent=url))
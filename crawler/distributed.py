@@ -0,0 +1,202 @@
+import copy
+import multiprocessing
+from hashlib import blake2b
+from queue import Empty
+from threading import Lock
+from urllib.parse import urlparse
+
+import scraper
+from crawler import Crawler
+from crawler.frontier import Frontier
+from utils import get_logger, normalize
+from utils.metrics import start_exporter
+from utils.replay import open_corpus, close_corpus
+from utils.url_set import UrlSet
+
+STOP = None # put in every inbox once the whole crawl is done
+
+
+def shard_of(url, shards):
+    ''' The shard that crawls url. All urls of a host go to the same shard,
+    so each shard's frontier keeps politeness for its hosts on its own. '''
+    host = urlparse(url).netloc
+    return int.from_bytes(
+        blake2b(host.encode("utf-8"), digest_size=8).digest(), "little") % shards
+
+
+def shard_config(config, index, shards):
+    # every shard has its own save file (and traps file, page cache, recording...)
+    config = copy.copy(config)
+    config.save_file = f"{config.save_file}.shard{index}"
+    config.seed_urls = [
+        url for url in config.seed_urls if shard_of(normalize(url), shards) == index]
+    if config.page_cache:
+        config.page_cache = f"{config.page_cache}.shard{index}"
+    if config.record_file:
+        config.record_file = f"{config.record_file}.shard{index}"
+    if config.metrics_port:
+        config.metrics_port += 1 + index
+    if config.metrics_file:
+        config.metrics_file = f"{config.metrics_file}.shard{index}"
+    return config
+
+
+def shard_configs(config):
+    # the config of every shard, [config] when the crawl is not sharded
+    if config.shards <= 1:
+        return [config]
+    return [shard_config(config, index, config.shards) for index in range(config.shards)]
+
+
+class ShardFrontier(object):
+    ''' Wraps one shard's frontier. Links to hosts of other shards are
+    buffered and put on that shard's inbox in batches of batch_size, each
+    link at most once. Everything else goes straight to the frontier.
+
+    outstanding counts the shards still crawling plus the batches not taken
+    out of an inbox yet; the crawl is over when it drops to 0. A batch is
+    counted before it is sent, so the crawl never looks finished while one
+    is on its way. '''
+    def __init__(self, frontier, index, inboxes, outstanding, batch_size):
+        self.frontier = frontier
+        self.index = index
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+        self.batch_size = batch_size
+        self.lock = Lock()
+        self.outboxes = [list() for _ in inboxes]
+        self.forwarded = UrlSet()
+
+    def __getattr__(self, name):
+        return getattr(self.frontier, name)
+
+    def add_url(self, url, parent=None):
+        url = normalize(url)
+        shard = shard_of(url, len(self.inboxes))
+        if shard == self.index:
+            self.frontier.add_url(url, parent)
+        else:
+            self._forward(url, shard)
+
+    def add_urls(self, urls, parent=None):
+        local = list()
+        for url in urls:
+            url = normalize(url)
+            shard = shard_of(url, len(self.inboxes))
+            if shard == self.index:
+                local.append(url)
+            else:
+                self._forward(url, shard)
+        self.frontier.add_urls(local, parent)
+
+    def _forward(self, url, shard):
+        with self.lock:
+            if not self.forwarded.add(url):
+                return
+            outbox = self.outboxes[shard]
+            outbox.append(url)
+            if len(outbox) >= self.batch_size:
+                self._send(shard)
+
+    def _send(self, shard):
+        batch = self.outboxes[shard]
+        self.outboxes[shard] = list()
+        with self.outstanding.get_lock():
+            self.outstanding.value += 1
+        self.inboxes[shard].put(batch)
+
+    def flush(self):
+        with self.lock:
+            for shard, outbox in enumerate(self.outboxes):
+                if outbox:
+                    self._send(shard)
+
+
+def run_shard(config, restart, frontier_factory, index, inboxes, outstanding, results):
+    ''' One crawler process. It crawls until its frontier is empty, forwards
+    what is left in its outboxes, then waits for a batch from another shard
+    and crawls again, until the crawl is over everywhere. '''
+    config = shard_config(config, index, len(inboxes))
+    open_corpus(config)
+    scraper.configure(config)
+    exporter = start_exporter(config)
+    logger = get_logger(f"SHARD-{index}", "CRAWLER")
+
+    def shard_frontier(config, restart):
+        return ShardFrontier(
+            frontier_factory(config, restart), index, inboxes, outstanding,
+            config.forward_batch)
+
+    if config.engine == "async":
+        from crawler.async_crawler import AsyncCrawler # aiohttp is only imported by async crawls
+        crawler_factory = AsyncCrawler
+    else:
+        crawler_factory = Crawler
+    crawler = crawler_factory(config, restart, frontier_factory=shard_frontier)
+    inbox = inboxes[index]
+    while True:
+        crawler.run()
+        crawler.frontier.flush()
+        with outstanding.get_lock():
+            outstanding.value -= 1
+            finished = outstanding.value == 0
+        if finished:
+            for other in inboxes:
+                other.put(STOP)
+        batch = inbox.get()
+        if batch is STOP:
+            break
+        # the batch's count now stands for this shard crawling again
+        crawler.frontier.add_urls(batch)
+    logger.info("Crawl is over on every shard. Stopping.")
+    crawler.close()
+    close_corpus(config)
+    scraper.shutdown()
+    exporter.stop()
+    results.put((index, scraper.shard_stats()))
+
+
+class DistributedCrawler(object):
+    ''' Crawls with config.shards processes instead of one. Urls are
+    partitioned by a hash of their host, each process has its own frontier
+    and save file (SAVE.shard<i>) and forwards the links it finds for other
+    shards in batches over multiprocessing queues. When every shard is done
+    their stats are merged into this process's scraper globals, so
+    print_summary covers the whole crawl. '''
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        self.config = config
+        self.restart = restart
+        self.frontier_factory = frontier_factory
+        self.logger = get_logger("CRAWLER")
+
+    def start(self):
+        shards = self.config.shards
+        inboxes = [multiprocessing.Queue() for _ in range(shards)]
+        outstanding = multiprocessing.Value("i", shards)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=run_shard, args=(
+                    self.config, self.restart, self.frontier_factory, index,
+                    inboxes, outstanding, results))
+            for index in range(shards)]
+        for process in processes:
+            process.start()
+        stats = dict()
+        # collect before joining, a process does not exit until its result is read
+        while len(stats) < shards:
+            try:
+                index, shard = results.get(timeout=1)
+                stats[index] = shard
+            except Empty:
+                failed = [process for process in processes if process.exitcode]
+                if failed:
+                    for process in processes:
+                        process.terminate()
+                    raise RuntimeError(
+                        f"Shard process exited with code {failed[0].exitcode}.")
+        for process in processes:
+            process.join()
+        for index in sorted(stats):
+            scraper.merge_stats(stats[index])
+        self.logger.info(f"Merged the stats of {shards} shards.")
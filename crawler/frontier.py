@@ -1,30 +1,67 @@
 import os
-import shelve
+import time
 
-from threading import Thread, RLock
-from queue import Queue, Empty
+from collections import Counter, deque
+from itertools import count
+from heapq import heappush, heappop
+from threading import Lock, RLock, Condition
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+import traps
+from utils import get_logger, get_urlhash, get_canonical_urlhash, normalize
+from utils.metrics import metrics
+from url_filter import url_filter
+import scraper
+from crawler.storage import open_storage, save_files
+from crawler.rate_control import open_rate_control
 
 class Frontier(object):
+    # Workers sleep base_delay after every page unless the frontier
+    # spaces out the urls it hands out by itself. With rate control the
+    # backoff of a failing host only holds back that host's urls.
+    handles_politeness = False
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
         self.to_be_downloaded = list()
+        self.waiting = list() # (time, url) heap of urls put back until then, see defer_url
+        self.waiting_lock = Lock()
+        self.fetching = Counter() # host -> urls handed out by _next_url not done yet, with rate control
+        self.fetched_at = dict() # host -> when its last url handed out by _next_url was done
+        self.crawl_delays = dict() # host -> Crawl-delay of its robots.txt, see crawler/robots.py
+        self.rate = open_rate_control(config) # per host backoff and concurrency, None for fixed delays
+        self.traps_file = traps.state_file(self.config)
         
-        if not os.path.exists(self.config.save_file) and not restart:
+        existing = save_files(self.config.save_file)
+        # the blocked templates and the stats belong to the save file, without it they start over too
+        fresh = restart or not existing
+        if not existing and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif existing and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            for path in existing:
+                os.remove(path)
+        elif (self.config.storage_type == "log" and self.config.save_file not in existing
+                and set(existing) - {f"{self.config.save_file}.checkpoint"}):
+            # only the files of a shelve, which the log cannot read
+            self.logger.warning(
+                f"Found a shelve save file at {self.config.save_file}, but STORAGE = log "
+                f"cannot read it, starting from seed. Set STORAGE = shelve to resume it.")
+        if os.path.exists(self.traps_file) and fresh:
+            os.remove(self.traps_file)
+        elif not fresh:
+            # templates blocked in an earlier run stay blocked
+            traps.trap_detector.load(self.traps_file)
+        # the stats print_summary reports carry over to a resumed crawl too
+        scraper.open_analytics(self.config, fresh)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = open_storage(self.config, self.logger, url_filter.version)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
@@ -34,39 +71,448 @@ class Frontier(object):
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        metrics.collect("frontier_depth", "gauge", "host", self.depth)
+        if self.rate is not None:
+            metrics.collect("host_latency_seconds", "gauge", "host", self.rate.latencies)
+            metrics.collect("host_error_rate", "gauge", "host", self.rate.error_rates)
+            metrics.collect("host_concurrency", "gauge", "host", self.rate.concurrencies)
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
+        # save files from before urls were canonicalized are keyed by the url as written
+        moved = self.save.rekey(normalize, get_canonical_urlhash)
+        if moved:
+            self.logger.info(f"Moved {moved} saved urls to the urlhash of their canonical url.")
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
+        # (url, False) records of the urls that pass the url filter, plus whatever
+        # a subclass added to the record. The storage may reuse earlier results.
+        # Their rejections were counted when they were found, allows does not
+        # count them again.
+        for record in self.save.pending_records(url_filter.allows):
+            if traps.trap_detector.allows(record[0]):
+                self._enqueue_record(record)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        while True:
+            with self.waiting_lock:
+                url, wait = self._next_url()
+            if url is not None or wait is None:
+                return url
+            time.sleep(wait)
+
+    def _next_url(self):
+        # (url, None), or (None, seconds until the first url put back is due),
+        # or (None, None) once there is no url left
+        now = time.time()
+        while self.waiting and self.waiting[0][0] <= now:
+            self.to_be_downloaded.append(heappop(self.waiting)[1])
+        while self.to_be_downloaded:
+            url = self.to_be_downloaded.pop()
+            # its template may have been blocked since it was queued
+            if not traps.trap_detector.allows(url):
+                continue
+            if self.rate is not None:
+                host = urlparse(url).netloc
+                ready_at = self._ready_at(host, now)
+                if ready_at > now:
+                    # the host is backing off, busy or its circuit breaker is open, the others go first
+                    heappush(self.waiting, (ready_at, url))
+                    continue
+                self.fetching[host] += 1
+            return url, None
+        if self.waiting:
+            return None, self.waiting[0][0] - now
+        return None, None
+
+    def _ready_at(self, host, now):
+        # when rate control lets _next_url hand out a url of host, called with waiting_lock held
+        if self.fetching.get(host, 0) >= self.rate.concurrency(host):
+            return now + self.base_delay(host)
+        return max(self.rate.ready_at(host), self.fetched_at.get(host, 0) + self.time_delay(host))
+
+    def _host_done(self, host):
+        # a url of host handed out by _next_url was completed or put back
+        if self.rate is None:
+            return
+        with self.waiting_lock:
+            self.fetching[host] -= 1
+            if self.fetching[host] <= 0:
+                del self.fetching[host]
+            self.fetched_at[host] = time.time()
+
+    def defer_url(self, url, retry_at):
+        ''' Puts a url that was handed out back without completing it, it
+        is handed out again once retry_at (a time.time()) has passed. '''
+        with self.waiting_lock:
+            heappush(self.waiting, (retry_at, url))
+        self._host_done(urlparse(url).netloc)
+
+    def add_url(self, url, parent=None):
+        # parent is the url of the page the link was found on, None for seeds
+        with metrics.timer("frontier_add"):
+            url = normalize(url)
+            if not traps.trap_detector.allows(url):
+                return
+            urlhash = get_urlhash(url)
+            if urlhash not in self.save:
+                record = self._new_record(url, parent)
+                self.save.put(urlhash, record)
+                self._enqueue_record(record)
+
+    def add_urls(self, urls, parent=None):
+        ''' add_url for all the links found on a page at once. Every url is
+        normalized and hashed once, repeats within the batch are dropped and
+        the new records go to the storage in one put_many. '''
+        with metrics.timer("frontier_add_urls"):
+            records = list()
+            new = set()
+            for url in dict.fromkeys(normalize(url) for url in urls):
+                if not traps.trap_detector.allows(url):
+                    continue
+                urlhash = get_canonical_urlhash(url)
+                if urlhash not in new and urlhash not in self.save:
+                    new.add(urlhash)
+                    records.append((urlhash, self._new_record(url, parent)))
+            self.save.put_many(records)
+            for _, record in records:
+                self._enqueue_record(record)
+
+    def _new_record(self, url, parent):
+        return (url, False)
+
+    def _enqueue_record(self, record):
+        self._enqueue(record[0])
+
+    def _enqueue(self, url):
+        self.to_be_downloaded.append(url)
+
+    def depth(self):
+        # urls waiting per host, for metrics
+        return Counter(url.split("/")[2] for url in (
+            list(self.to_be_downloaded) + [url for _, url in list(self.waiting)]))
+
+    def set_crawl_delay(self, host, seconds):
+        if seconds:
+            self.crawl_delays[host] = seconds
+
+    def base_delay(self, host):
+        # seconds between two downloads from host without rate control: POLITENESS or its Crawl-delay
+        return max(self.config.time_delay, self.crawl_delays.get(host, 0))
+
+    def time_delay(self, host):
+        # seconds between two downloads from host
+        delay = self.base_delay(host)
+        return self.rate.delay(host, delay) if self.rate is not None else delay
+
+    def record_download(self, url, status, seconds):
+        # how a download from the url's host went, before the url is marked complete
+        if self.rate is None:
+            return
+        host = urlparse(url).netloc
+        given_up = self.rate.record(host, status, seconds)
+        if given_up:
+            # its queued urls are dropped like those of a trap
+            traps.trap_detector.block_host(host, given_up)
 
-    def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
     def mark_url_complete(self, url):
+        try:
+            self._save_complete(url)
+        finally:
+            self._host_done(urlparse(url).netloc)
+
+    def _save_complete(self, url):
         urlhash = get_urlhash(url)
         if urlhash not in self.save:
             # This should not happen.
             self.logger.error(
                 f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+        self.save.put(urlhash, (url, True))
+        if traps.trap_detector.should_save():
+            traps.trap_detector.save(self.traps_file)
+
+    def close(self):
+        # write out whatever the storage has not committed yet
+        self.save.close()
+        traps.trap_detector.save(self.traps_file)
+        scraper.close_analytics()
+
+
+class PoliteFrontier(Frontier):
+    ''' Frontier that keeps one queue per host and only hands out a url once
+    its host's politeness delay has passed. get_tbd_url blocks until some host
+    is ready, so it is safe to share between several workers.
+
+    With rate control a host may have more than one download in flight once
+    it proved healthy (see crawler/rate_control.py), their starts are then
+    spaced out by the delay too, and a host whose circuit breaker is open
+    is not handed out until it closes. '''
+    handles_politeness = True
+
+    def __init__(self, config, restart):
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
+        self.host_queues = dict() # host -> urls waiting for that host
+        self.ready_heap = list() # (next allowed fetch time, host) of idle hosts with urls
+        self.next_fetch = dict() # host -> earliest time it may be fetched again
+        self.busy_hosts = Counter() # host -> downloads in flight from it
+        super().__init__(config, restart)
+
+    def _enqueue(self, url):
+        host = urlparse(url).netloc
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = deque()
+        # a host is in the heap only while it has urls and can take another download
+        if not queue and not self._at_limit(host):
+            heappush(self.ready_heap, (self.next_fetch.get(host, 0), host))
+            self.has_work.notify()
+        queue.append(url)
+
+    def _at_limit(self, host):
+        limit = self.rate.concurrency(host) if self.rate is not None else 1
+        return self.busy_hosts.get(host, 0) >= limit
+
+    def _pop_ready(self):
+        # (host, None) for the next host that is ready, or (None, wait) like _poll.
+        # Entries of hosts that ran out of urls or are at their limit are
+        # dropped, and entries from before the host was pushed back go back in.
+        while self.ready_heap:
+            ready_at, host = self.ready_heap[0]
+            wait = ready_at - time.time()
+            if wait > 0:
+                return None, wait
+            heappop(self.ready_heap)
+            if host not in self.host_queues or self._at_limit(host):
+                continue
+            if ready_at < self.next_fetch.get(host, 0):
+                heappush(self.ready_heap, (self.next_fetch[host], host))
+                continue
+            return host, None
+        return None, None
+
+    def _start(self, host):
+        # a url of host was handed out
+        self.busy_hosts[host] += 1
+        if self.rate is not None and self.rate.concurrency(host) > 1:
+            # the next download may start before this one is done, but not before the delay
+            self.next_fetch[host] = time.time() + self.time_delay(host)
+            if host in self.host_queues and not self._at_limit(host):
+                heappush(self.ready_heap, (self.next_fetch[host], host))
+
+    def _poll(self):
+        # (url, None) if a host is ready, otherwise (None, seconds until the
+        # next host is ready) or (None, None) if no host has urls queued
+        while True:
+            host, wait = self._pop_ready()
+            if host is None:
+                return None, wait
+            queue = self.host_queues[host]
+            url = queue.pop()
+            # skip urls whose template was blocked since they were queued
+            while not traps.trap_detector.allows(url) and queue:
+                url = queue.pop()
+            if not queue:
+                del self.host_queues[host]
+            if traps.trap_detector.allows(url):
+                self._start(host)
+                return url, None
+
+    def poll_tbd_url(self):
+        ''' Non blocking get_tbd_url for callers that cannot wait on a
+        lock (the async crawler). Returns (url, None) or (None, wait) like
+        _poll. '''
+        with self.lock:
+            return self._poll()
+
+    def get_tbd_url(self):
+        with self.has_work:
+            while True:
+                url, wait = self._poll()
+                if url:
+                    return url
+                if wait is None and not self.busy_hosts:
+                    # nothing queued and nothing in flight that could add more
+                    return None
+                self.has_work.wait(wait)
+
+    def _parse_save_file(self):
+        # _enqueue notifies has_work, which needs the lock held
+        with self.lock:
+            super()._parse_save_file()
+
+    def add_url(self, url, parent=None):
+        with self.lock:
+            super().add_url(url, parent)
+
+    def add_urls(self, urls, parent=None):
+        with self.lock:
+            super().add_urls(urls, parent)
+
+    def depth(self):
+        with self.lock:
+            return {host: len(queue) for host, queue in self.host_queues.items()}
+
+    def mark_url_complete(self, url):
+        with self.has_work:
+            try:
+                self._save_complete(url)
+            finally:
+                # the host is freed even if saving failed
+                self._release(urlparse(url).netloc)
+
+    def defer_url(self, url, retry_at):
+        # the url goes back in its host's queue, and the host waits until retry_at
+        with self.has_work:
+            try:
+                self._enqueue_record(self._handed_out_record(url))
+            finally:
+                self._release(urlparse(url).netloc, retry_at)
+
+    def _handed_out_record(self, url):
+        # the record of a url that was handed out, to queue it again
+        return (url, False)
+
+    def _release(self, host, not_before=0):
+        # a download from host is over, called with the lock held
+        self.busy_hosts[host] -= 1
+        if self.busy_hosts[host] <= 0:
+            del self.busy_hosts[host]
+        # the delay counts from the end of the download so that slow
+        # responses never overlap on one host (unless rate control allows it)
+        self.next_fetch[host] = max(time.time() + self.time_delay(host), not_before)
+        if self.rate is not None:
+            self.next_fetch[host] = max(self.next_fetch[host], self.rate.ready_at(host))
+        if host in self.host_queues and not self._at_limit(host):
+            heappush(self.ready_heap, (self.next_fetch[host], host))
+        # wake everyone: idle workers may need to notice the crawl is over
+        self.has_work.notify_all()
+
+    def close(self):
+        with self.lock:
+            super().close()
+
+
+def depth_score(url, depth, parent_tokens, host_fetches):
+    # breadth first: one point per link followed from the seeds
+    return depth
+
+
+def value_score(url, depth, parent_tokens, host_fetches):
+    # links from pages with more text are worth more, up to 4 levels of depth
+    return -min(parent_tokens, 2000) / 500
+
+
+def fairness_score(url, depth, parent_tokens, host_fetches):
+    # every 50 pages already fetched from the host cost one level of depth
+    return host_fetches / 50
+
+
+SCORERS = {
+    "depth": depth_score,
+    "value": value_score,
+    "fairness": fairness_score,
+}
+
+
+class PriorityFrontier(PoliteFrontier):
+    ''' PoliteFrontier that hands out the best scored url instead of the
+    last one found. Every url gets the sum of the config.priority scorers
+    when it is added (lower is crawled first). Each host's urls are a heap on
+    that score, and of the hosts whose politeness delay has passed the one
+    with the best url goes next. The score and depth are kept in the url's
+    record, (url, completed, score, depth), so a resumed crawl keeps the
+    order. '''
+    def __init__(self, config, restart):
+        self.scorers = [SCORERS[name] for name in config.priority]
+        self.sequence = count() # tie breaker, equal scores keep insertion order
+        self.due_heap = list() # (best score, sequence, host) of hosts whose delay has passed
+        self.due_entries = dict() # host -> sequence of its live due_heap entry
+        self.depths = dict() # url handed out -> its (score, depth), for the links found on it and to queue it again
+        self.host_fetches = Counter()
+        super().__init__(config, restart)
+
+    def _new_record(self, url, parent):
+        depth = self.depths.get(parent, (0, -1))[1] + 1 if parent else 0
+        parent_tokens = scraper.word_count.get(parent, 0) if parent else 0
+        host_fetches = self.host_fetches[urlparse(url).netloc]
+        score = sum(
+            scorer(url, depth, parent_tokens, host_fetches) for scorer in self.scorers)
+        return (url, False, score, depth)
+
+    def _enqueue_record(self, record):
+        url = record[0]
+        # records saved by another frontier have no score
+        score, depth = record[2:4] if len(record) >= 4 else (0, 0)
+        host = urlparse(url).netloc
+        queue = self.host_queues.setdefault(host, list())
+        was_empty = not queue
+        heappush(queue, (score, next(self.sequence), depth, url))
+        if self._at_limit(host):
+            return
+        if host in self.due_entries:
+            if queue[0][0] == score:
+                # the host's best url got better, its old entry goes stale
+                self._make_due(host)
+        elif was_empty:
+            heappush(self.ready_heap, (self.next_fetch.get(host, 0), host))
+            self.has_work.notify()
+
+    def _make_due(self, host):
+        entry = (self.host_queues[host][0][0], next(self.sequence), host)
+        self.due_entries[host] = entry[1]
+        heappush(self.due_heap, entry)
+
+    def _poll(self):
+        now = time.time()
+        while True:
+            host, _ = self._pop_ready()
+            if host is None:
+                break
+            if host not in self.due_entries:
+                self._make_due(host)
+        while self.due_heap:
+            _, sequence, host = heappop(self.due_heap)
+            if self.due_entries.get(host) != sequence:
+                continue
+            del self.due_entries[host]
+            queue = self.host_queues[host]
+            url = None
+            while queue:
+                score, _, depth, candidate = heappop(queue)
+                # skip urls whose template was blocked since they were queued
+                if traps.trap_detector.allows(candidate):
+                    url = candidate
+                    break
+            if not queue:
+                del self.host_queues[host]
+            if url is None:
+                continue
+            self._start(host)
+            self.depths[url] = (score, depth)
+            return url, None
+        if self.ready_heap:
+            return None, self.ready_heap[0][0] - now
+        return None, None
+
+    def _handed_out_record(self, url):
+        score, depth = self.depths.pop(url, (0, 0))
+        return (url, False, score, depth)
+
+    def mark_url_complete(self, url):
+        with self.lock:
+            self.depths.pop(url, None)
+            self.host_fetches[urlparse(url).netloc] += 1
+            super().mark_url_complete(url)
+
+
+FRONTIERS = {
+    "lifo": Frontier,
+    "polite": PoliteFrontier,
+    "priority": PriorityFrontier,
+}
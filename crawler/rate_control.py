@@ -0,0 +1,151 @@
+import time
+from threading import Lock
+
+from utils import get_logger
+from utils.metrics import metrics
+
+EWMA_WEIGHT = 0.2 # weight of the newest download in the latency and error averages
+GROW_AFTER = 10 # healthy downloads in a row before a host may have one more in flight
+SLOW_FACTOR = 2 # a latency average above SLOW_FACTOR times the host's best (plus SLOW_MARGIN) is overload
+SLOW_MARGIN = 0.05 # seconds, so a host answering in 1ms is not slow at 3ms
+MIN_BACKOFF = 0.25 # seconds the backoff starts from when POLITENESS is lower
+# cache server statuses for a host it could not reach or that timed out. Its
+# other 6xx (604 and up) are about the page: a bad url, a page too large or unreadable.
+CACHE_HOST_ERRORS = frozenset(range(600, 604))
+
+
+def is_host_error(status):
+    # the host is failing or asks us to slow down. Other 4xx and the cache
+    # server's page level 6xx are about the page, not the host.
+    return status == 429 or 500 <= status < 600 or status in CACHE_HOST_ERRORS
+
+
+class HostRate(object):
+    ''' What the controller knows about one host. '''
+    __slots__ = ("latency", "best_latency", "error_rate", "errors", "healthy",
+                 "concurrency", "open_until", "trips")
+
+    def __init__(self):
+        self.latency = None # average seconds of its healthy downloads
+        self.best_latency = None # lowest that average has been
+        self.error_rate = 0.0 # average of 1 per host error and 0 per healthy download
+        self.errors = 0 # host errors in a row
+        self.healthy = 0 # healthy downloads since concurrency last changed
+        self.concurrency = 1 # downloads it may have in flight at once
+        self.open_until = 0 # nothing is downloaded from it until then, see RateController
+        self.trips = 0 # circuit breaker openings since its last healthy download
+
+
+class RateController(object):
+    ''' Download rate of every host, driven by how the host responds.
+
+    Every download reports its status and seconds to record(). A host
+    error (429, 5xx, or a cache server 600-603 for an unreachable host or a
+    timeout) doubles the host's delay, up to max_backoff, until it answers
+    properly again, and halves the downloads it may have in flight. After
+    GROW_AFTER healthy downloads in a row whose latency average stays close
+    to the host's best, it may have one more in flight, up to
+    max_concurrency; a latency average well above its best takes one back. Averages are exponentially weighted (EWMA_WEIGHT).
+
+    breaker_errors host errors in a row open the host's circuit breaker:
+    nothing is downloaded from it for breaker_seconds, doubled every time it
+    opens again, then one download probes it. A healthy download closes the
+    breaker. The breaker_trips-th time in a row it would open the host is
+    given up instead, and record() returns why. '''
+    def __init__(self, max_concurrency=1, max_backoff=60, breaker_errors=5,
+                 breaker_seconds=60, breaker_trips=3):
+        self.max_concurrency = max_concurrency
+        self.max_backoff = max_backoff
+        self.breaker_errors = breaker_errors
+        self.breaker_seconds = breaker_seconds
+        self.breaker_trips = breaker_trips
+        self.logger = get_logger("RATE")
+        self.lock = Lock()
+        self.hosts = dict() # host -> HostRate
+
+    def record(self, host, status, seconds):
+        with self.lock:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostRate()
+            error = is_host_error(status)
+            state.error_rate += EWMA_WEIGHT * (error - state.error_rate)
+            if error:
+                return self._error(host, state, status)
+            state.errors = 0
+            state.trips = 0
+            # only healthy downloads count, failures are often instant or timeouts
+            state.latency = seconds if state.latency is None else (
+                state.latency + EWMA_WEIGHT * (seconds - state.latency))
+            if state.best_latency is None or state.latency < state.best_latency:
+                state.best_latency = state.latency
+            if state.latency > SLOW_FACTOR * state.best_latency + SLOW_MARGIN:
+                if state.concurrency > 1:
+                    state.concurrency -= 1
+                state.healthy = 0
+            else:
+                state.healthy += 1
+                if state.healthy >= GROW_AFTER and state.concurrency < self.max_concurrency:
+                    state.concurrency += 1
+                    state.healthy = 0
+        return None
+
+    def _error(self, host, state, status):
+        state.errors += 1
+        state.healthy = 0
+        state.concurrency = max(1, state.concurrency // 2)
+        now = time.time()
+        # downloads that were already in flight when it opened do not open it again
+        if state.errors < self.breaker_errors or state.open_until > now:
+            return None
+        state.trips += 1
+        metrics.count("circuit_breaker_trips", "host", host)
+        if state.trips >= self.breaker_trips:
+            reason = f"circuit breaker opened {state.trips} times in a row, last status {status}"
+            self.logger.warning(f"Giving up on {host}: {reason}.")
+            return reason
+        seconds = self.breaker_seconds * 2 ** (state.trips - 1)
+        state.open_until = now + seconds
+        self.logger.warning(
+            f"{state.errors} errors in a row from {host} (last status {status}), "
+            f"pausing it for {seconds:g}s.")
+        return None
+
+    def delay(self, host, base):
+        # base (the politeness delay) doubled for every host error in a row, up to max_backoff
+        state = self.hosts.get(host)
+        if state is None or not state.errors:
+            return base
+        return max(base, min(max(base, MIN_BACKOFF) * 2 ** state.errors, self.max_backoff))
+
+    def ready_at(self, host):
+        # time the host's circuit breaker lets downloads through again, 0 when it is closed
+        state = self.hosts.get(host)
+        return state.open_until if state is not None else 0
+
+    def concurrency(self, host):
+        state = self.hosts.get(host)
+        return state.concurrency if state is not None else 1
+
+    def latencies(self):
+        # {host: latency average} for metrics
+        with self.lock:
+            return {host: round(state.latency, 6) for host, state in self.hosts.items()
+                    if state.latency is not None}
+
+    def concurrencies(self):
+        with self.lock:
+            return {host: state.concurrency for host, state in self.hosts.items()}
+
+    def error_rates(self):
+        with self.lock:
+            return {host: round(state.error_rate, 4) for host, state in self.hosts.items()}
+
+
+def open_rate_control(config):
+    # None when RATE_CONTROL is off
+    if not config.rate_control:
+        return None
+    return RateController(
+        config.host_concurrency, config.max_backoff, config.breaker_errors,
+        config.breaker_seconds, config.breaker_trips)
@@ -0,0 +1,273 @@
+import gzip
+import io
+import re
+import time
+from collections import Counter, OrderedDict
+from threading import Event, Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.download import download
+from scraper import is_valid
+
+MAX_CRAWL_DELAY = 60 # seconds, a larger Crawl-delay would stall the host for the whole crawl
+FAILED_TTL = 120 # seconds the rules standing in for a robots.txt that failed to load are kept
+FAILED_LOADS = 3 # failed loads in a row after which the rules standing in for it are kept for good
+SITEMAP_BATCH = 500 # sitemap urls handed to the frontier at a time
+
+
+def compile_pattern(pattern):
+    # None for a plain prefix, else * matches anything and a final $ anchors the end
+    if "*" not in pattern and not pattern.endswith("$"):
+        return None
+    anchored = pattern.endswith("$")
+    regex = ".*".join(re.escape(part) for part in pattern.rstrip("$").split("*"))
+    return re.compile(regex + ("\\Z" if anchored else ""))
+
+
+class RobotRules(object):
+    ''' The rules of the robots.txt group that applies to the crawler.
+
+    Of all the rules matching a path the longest one wins and allow wins a
+    tie (RFC 9309), so the rules are kept longest first and the first match
+    decides. Plain rules are prefixes checked with startswith, only rules
+    with * or $ are compiled to regexes. A path that starts with none of
+    the plain prefixes and with no wildcard rules is allowed right away. '''
+    def __init__(self, rules=(), crawl_delay=0, sitemaps=()):
+        self.rules = [
+            (pattern, compile_pattern(pattern), allow)
+            for pattern, allow in sorted(
+                rules, key=lambda rule: (-len(rule[0]), not rule[1]))]
+        self.prefixes = tuple(pattern for pattern, regex, _ in self.rules if regex is None)
+        self.has_wildcards = len(self.prefixes) < len(self.rules)
+        self.crawl_delay = min(crawl_delay, MAX_CRAWL_DELAY)
+        self.sitemaps = list(sitemaps)
+
+    def allows(self, path):
+        if path == "/robots.txt" or not (self.has_wildcards or path.startswith(self.prefixes)):
+            return True
+        for pattern, regex, allow in self.rules:
+            if regex.match(path) if regex is not None else path.startswith(pattern):
+                return allow
+        return True
+
+
+ALLOW_ALL = RobotRules()
+DISALLOW_ALL = RobotRules([("/", False)])
+
+
+class RobotsUnavailable(Exception):
+    ''' Raised by RobotsCache.allowed for a url that only the rules standing
+    in for a robots.txt that failed to load disallow. Nothing is known about
+    the url yet, it should be tried again at retry_at, when the robots.txt
+    is fetched again. '''
+    def __init__(self, host, retry_at):
+        super().__init__(f"The robots.txt of {host} did not load")
+        self.retry_at = retry_at
+
+
+def parse_robots(text, user_agent):
+    ''' RobotRules for user_agent from the text of a robots.txt. The group
+    with the longest user-agent contained in user_agent applies, otherwise
+    the * groups. Sitemap lines apply to every agent. '''
+    user_agent = user_agent.lower()
+    groups = dict() # agent -> [rules, crawl delay]
+    sitemaps = list()
+    agents = list() # agents of the group being read
+    in_rules = False
+    for line in text.splitlines():
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if key == "user-agent":
+            if in_rules:
+                agents = list()
+                in_rules = False
+            agents.append(value.lower())
+            groups.setdefault(value.lower(), [list(), 0])
+        elif key in ("allow", "disallow"):
+            in_rules = True
+            if value: # an empty disallow allows everything
+                for agent in agents:
+                    groups[agent][0].append((value, key == "allow"))
+        elif key == "crawl-delay":
+            in_rules = True
+            try:
+                for agent in agents:
+                    groups[agent][1] = float(value)
+            except ValueError:
+                pass
+        elif key == "sitemap" and value:
+            sitemaps.append(value)
+    matching = [agent for agent in groups if agent != "*" and agent in user_agent]
+    rules, crawl_delay = groups.get(
+        max(matching, key=len) if matching else "*", (list(), 0))
+    return RobotRules(rules, crawl_delay, sitemaps)
+
+
+def sitemap_locs(content):
+    ''' Yields (kind, url) for every entry of a sitemap, kind is "url" for a
+    page and "sitemap" for an entry of a sitemap index. The document is
+    parsed with iterparse and every entry is dropped once read, so only one
+    entry at a time is in memory. Gzipped sitemaps are decompressed on the
+    fly. Parsing stops quietly at the first error. '''
+    from lxml import etree # only needed once a host lists sitemaps
+    stream = io.BytesIO(content)
+    if content[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream)
+    entries = etree.iterparse(
+        stream, events=("end",), tag=("{*}url", "{*}sitemap"),
+        resolve_entities=False, no_network=True)
+    try:
+        for _, element in entries:
+            loc = element.findtext("{*}loc")
+            kind = etree.QName(element).localname
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if loc:
+                yield kind, loc.strip()
+    except (etree.XMLSyntaxError, OSError, EOFError):
+        return
+
+
+class RobotsCache(object):
+    ''' robots.txt rules of the hosts being crawled, fetched through the
+    cache server like any page. The rules of the last capacity hosts are
+    kept (least recently used go first, and are fetched again if needed).
+    Only a 2xx or 4xx robots.txt is kept for good. When it failed to load
+    (5xx, cache server errors, timeouts) the rules standing in for it expire
+    after FAILED_TTL seconds and it is fetched again, the urls they disallow
+    raise RobotsUnavailable until then. After FAILED_LOADS failures in a row
+    they are kept for good.
+    Each robots.txt is fetched by one thread while the others asking for the
+    same host wait for it.
+
+    When a host's rules are first loaded its Crawl-delay is handed to the
+    frontier and the urls of its sitemaps (on the same host, nested sitemap
+    indexes included) are added to the frontier, up to sitemap_limit per
+    host. Every fetch here is followed by the host's delay, the caller holds
+    the host's next url and downloads it right after. '''
+    def __init__(self, config, frontier, capacity=1000, sitemap_limit=10000):
+        self.config = config
+        self.frontier = frontier
+        self.capacity = capacity
+        self.sitemap_limit = sitemap_limit
+        self.logger = get_logger("ROBOTS")
+        self.lock = Lock()
+        self.hosts = OrderedDict() # host -> (RobotRules, expiry time or None), least recently used first
+        self.loading = dict() # host -> Event set once its rules are in hosts
+        self.failures = Counter() # host -> loads of its robots.txt that failed in a row
+        self.sitemaps_read = set() # hosts whose sitemaps were read, only once per crawl
+
+    def allowed(self, url):
+        # raises RobotsUnavailable instead of returning False while the host's robots.txt has not loaded
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        rules, expires = self.rules(parsed.scheme, parsed.netloc)
+        if rules.allows(path):
+            return True
+        if expires is not None:
+            raise RobotsUnavailable(parsed.netloc, expires)
+        return False
+
+    def rules(self, scheme, host):
+        # (rules, expiry time), the expiry is None unless they stand in for a robots.txt that failed to load
+        with self.lock:
+            rules, expires = self.hosts.get(host, (None, None))
+            if rules is not None and (expires is None or expires > time.time()):
+                self.hosts.move_to_end(host)
+                return rules, expires
+            loading = self.loading.get(host)
+            if loading is None:
+                self.loading[host] = Event()
+        if loading is not None:
+            loading.wait()
+            with self.lock:
+                return self.hosts.get(host, (ALLOW_ALL, None))
+        try:
+            rules, failed = self._fetch_rules(scheme, host)
+        except Exception as e:
+            self.logger.error(f"Could not fetch the robots.txt of {host}: {e}")
+            rules, failed = ALLOW_ALL, True
+        with self.lock:
+            expires = None
+            if failed:
+                self.failures[host] += 1
+                if self.failures[host] < FAILED_LOADS:
+                    expires = time.time() + FAILED_TTL
+                else:
+                    self.logger.warning(
+                        f"The robots.txt of {host} failed to load {self.failures[host]} "
+                        f"times in a row, keeping the rules standing in for it.")
+            else:
+                self.failures.pop(host, None)
+            self.hosts[host] = (rules, expires)
+            self.hosts.move_to_end(host)
+            if len(self.hosts) > self.capacity:
+                self.hosts.popitem(last=False)
+            self.loading.pop(host).set()
+            # sitemaps are read once, from a robots.txt that loaded
+            read_sitemaps = not failed and host not in self.sitemaps_read
+            if read_sitemaps:
+                self.sitemaps_read.add(host)
+        self.frontier.set_crawl_delay(host, rules.crawl_delay)
+        if read_sitemaps and self.sitemap_limit:
+            self._read_sitemaps(host, rules.sitemaps)
+        return rules, expires
+
+    def _fetch(self, url, host):
+        start = time.perf_counter()
+        resp = download(url, self.config, self.logger)
+        self.frontier.record_download(url, resp.status, time.perf_counter() - start)
+        # the frontier holds the host back for its backoff, if any
+        time.sleep(self.frontier.base_delay(host))
+        return resp
+
+    def _fetch_rules(self, scheme, host):
+        # (rules, whether the robots.txt failed to load), a 4xx means there is none
+        resp = self._fetch(f"{scheme}://{host}/robots.txt", host)
+        failed = not (200 <= resp.status < 300 or 400 <= resp.status < 500)
+        if 500 <= resp.status < 600:
+            # the host is failing, RFC 9309 says to assume everything is disallowed
+            return DISALLOW_ALL, failed
+        if resp.status != 200 or not resp.raw_response or not resp.raw_response.content:
+            return ALLOW_ALL, failed
+        text = resp.raw_response.content.decode("utf-8", errors="replace")
+        return parse_robots(text, self.config.user_agent), False
+
+    def _read_sitemaps(self, host, sitemaps):
+        # breadth first over the sitemap index tree, every sitemap at most once
+        queue = [url for url in sitemaps if urlparse(url).netloc == host]
+        seen = set(queue)
+        added = 0
+        batch = list()
+        while queue and added < self.sitemap_limit:
+            resp = self._fetch(queue.pop(0), host)
+            if resp.status != 200 or not resp.raw_response or not resp.raw_response.content:
+                continue
+            for kind, url in sitemap_locs(resp.raw_response.content):
+                if kind == "sitemap":
+                    if url not in seen and urlparse(url).netloc == host:
+                        seen.add(url)
+                        queue.append(url)
+                elif is_valid(url):
+                    batch.append(url)
+                    added += 1
+                    if len(batch) >= SITEMAP_BATCH or added >= self.sitemap_limit:
+                        self.frontier.add_urls(batch)
+                        batch = list()
+                        if added >= self.sitemap_limit:
+                            break
+        if batch:
+            self.frontier.add_urls(batch)
+        if added:
+            self.logger.info(f"Added {added} urls from the sitemaps of {host}.")
+
+
+def open_robots(config, frontier):
+    # None when ROBOTS is off
+    if not config.robots:
+        return None
+    return RobotsCache(config, frontier, config.robots_cache, config.sitemap_urls)
@@ -0,0 +1,332 @@
+import os
+import pickle
+import shelve
+import struct
+import time
+import zlib
+
+from utils.metrics import metrics
+from utils.url_set import HashSet64
+
+
+class ShelveStorage(object):
+    ''' The original shelve save file. Writes go straight to the shelve but it
+    is only synced once per batch instead of after every url. '''
+    def __init__(self, save_file, batch_size, interval, logger, rules_version=None):
+        self.logger = logger
+        self.save = shelve.open(save_file)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save
+
+    def __len__(self):
+        return len(self.save)
+
+    def __getitem__(self, urlhash):
+        return self.save[urlhash]
+
+    def values(self):
+        return self.save.values()
+
+    def pending_records(self, check):
+        # records of the urls still to be downloaded that pass check(url)
+        return [record for record in self.save.values()
+                if not record[1] and check(record[0])]
+
+    def rekey(self, canonical, urlhash):
+        ''' Moves the records saved under another key than
+        urlhash(canonical(url)), by a crawler that hashed urls as they were
+        written or with other CANONICALIZE steps, to that key with the
+        canonical url. Two records of one page become one, completed if
+        either was. Returns how many records were moved. '''
+        moved = list()
+        for key in list(self.save.keys()):
+            record = self.save[key]
+            url = canonical(record[0])
+            new_key = urlhash(url)
+            if new_key != key:
+                moved.append((key, new_key, (url,) + tuple(record[1:])))
+        for key, _, _ in moved:
+            del self.save[key]
+        for _, new_key, record in moved:
+            existing = self.save.get(new_key)
+            if existing is None or (record[1] and not existing[1]):
+                self.save[new_key] = record
+        if moved:
+            self.flush()
+        return len(moved)
+
+    def put(self, urlhash, record):
+        self.put_many([(urlhash, record)])
+
+    def put_many(self, items):
+        # (urlhash, record) pairs, synced at most once
+        for urlhash, record in items:
+            self.save[urlhash] = record
+        self.unsynced += len(items)
+        if (self.unsynced >= self.batch_size
+                or time.time() - self.last_sync >= self.interval):
+            self.flush()
+
+    def flush(self):
+        with metrics.timer("save_sync"):
+            self.save.sync()
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        self.save.close()
+
+
+class LogStorage(object):
+    ''' Append-only log of (key, record) pairs with group commit.
+
+    Every record is framed as <length, crc32, pickled payload>. Records are
+    buffered and written with one write and one fsync per batch of
+    batch_size records or every interval seconds, whichever comes first. The
+    whole log is replayed into memory on open; a torn or corrupt tail left
+    behind by a crash is cut off, so a crash loses at most the last batch.
+
+    Urls are keyed by the first 8 bytes of their urlhash. Only urls still to
+    be downloaded are kept in memory with their record, completed urls are
+    just an 8 byte key in a HashSet64 (and a None record after compaction).
+
+    On close (and after compaction) the in-memory state is written to a
+    checkpoint file next to the log: the pending records, the completed keys
+    as one array and which pending urls failed the url filter under
+    rules_version. Opening then reads the checkpoint in one go and only
+    replays the log written after it, and the url filter is only run again
+    on urls it has not checked under the current rules_version. '''
+    MAGIC = b"FRONTIERLOG1\n"
+    HEADER = struct.Struct("<II")
+    TAIL = 64 # bytes of log before the checkpoint offset it keeps a checksum of
+
+    def __init__(self, save_file, batch_size, interval, logger, rules_version=None):
+        self.logger = logger
+        self.path = save_file
+        self.checkpoint_path = f"{save_file}.checkpoint"
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rules_version = rules_version
+        self.pending = dict() # key -> record of urls not completed yet
+        self.completed = HashSet64()
+        self.invalid = set() # pending keys that failed the url filter under rules_version
+        self.unchecked = set() # pending keys replayed from the log after the checkpoint
+        self.check_all = True # nothing checked under rules_version yet
+        self.buffer = list()
+        self.last_sync = time.time()
+        log_records = self._replay(*self._load_checkpoint())
+        if not self.pending:
+            self.check_all = False
+        # rewrite the log when most of it is superseded records
+        if log_records > 2 * len(self) + self.batch_size:
+            self._compact()
+        self.log = open(self.path, "ab")
+        if self.log.tell() == 0:
+            self.log.write(self.MAGIC)
+            self.log.flush()
+        self.log_records = log_records
+
+    def _load_checkpoint(self):
+        # (offset, records) of the log the checkpoint covers, (0, 0) without one
+        if not os.path.exists(self.checkpoint_path) or not os.path.exists(self.path):
+            return 0, 0
+        try:
+            with open(self.checkpoint_path, "rb") as checkpoint_file:
+                checkpoint = pickle.load(checkpoint_file)
+        except (EOFError, pickle.UnpicklingError):
+            return 0, 0
+        offset = checkpoint["offset"]
+        start = max(0, offset - self.TAIL)
+        with open(self.path, "rb") as log:
+            log.seek(start)
+            tail = log.read(offset - start)
+        # the log must still be the one the checkpoint was taken of
+        if len(tail) != offset - start or zlib.crc32(tail) != checkpoint["tail_checksum"]:
+            self.logger.info(
+                f"Ignoring {self.checkpoint_path}, it does not match {self.path}.")
+            return 0, 0
+        self.pending = checkpoint["pending"]
+        self.completed = HashSet64.from_bytes(checkpoint["completed"])
+        if checkpoint["rules_version"] == self.rules_version:
+            self.invalid = checkpoint["invalid"]
+            self.check_all = False
+        return offset, checkpoint["records"]
+
+    def _write_checkpoint(self, offset, records):
+        with open(self.path, "rb") as log:
+            start = max(0, offset - self.TAIL)
+            log.seek(start)
+            tail = log.read(offset - start)
+        checkpoint = {
+            "offset": offset,
+            "records": records,
+            "tail_checksum": zlib.crc32(tail),
+            "pending": self.pending,
+            "completed": self.completed.to_bytes(),
+            "invalid": self.invalid if not self.check_all else set(),
+            "rules_version": self.rules_version if not self.check_all else None,
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "wb") as checkpoint_file:
+            pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _replay(self, offset=0, count=0):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as log:
+            magic = log.read(len(self.MAGIC))
+            if not magic:
+                return 0
+            if magic != self.MAGIC:
+                raise ValueError(
+                    f"{self.path} is not a frontier log, delete it or "
+                    f"set STORAGE = shelve.")
+            if offset:
+                log.seek(offset)
+            good_offset = log.tell()
+            while True:
+                header = log.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                length, checksum = self.HEADER.unpack(header)
+                payload = log.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                key, record = pickle.loads(payload)
+                self._apply(key, record)
+                if key in self.pending:
+                    self.unchecked.add(key)
+                good_offset = log.tell()
+                count += 1
+            size = log.seek(0, os.SEEK_END)
+        if good_offset < size:
+            self.logger.info(
+                f"Dropping {size - good_offset} bytes of incomplete records "
+                f"at the end of {self.path}.")
+            with open(self.path, "r+b") as log:
+                log.truncate(good_offset)
+        return count
+
+    def _compact(self):
+        tmp_path = f"{self.path}.compact"
+        with open(tmp_path, "wb") as log:
+            log.write(self.MAGIC)
+            log.write(b"".join(
+                self._encode(key, record)
+                for key, record in self.pending.items()))
+            log.write(b"".join(
+                self._encode(key, None) for key in self.completed))
+            log.flush()
+            os.fsync(log.fileno())
+            size = log.tell()
+        os.replace(tmp_path, self.path)
+        self._write_checkpoint(size, len(self))
+
+    def _encode(self, key, record):
+        payload = pickle.dumps((key, record), protocol=pickle.HIGHEST_PROTOCOL)
+        return self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _key(self, urlhash):
+        return int(urlhash[:16], 16)
+
+    def _apply(self, key, record):
+        # a None record is a completed url whose record was compacted away
+        if record is None or record[1]:
+            self.pending.pop(key, None)
+            self.invalid.discard(key)
+            self.completed.add(key)
+        else:
+            self.pending[key] = record
+
+    def __contains__(self, urlhash):
+        key = self._key(urlhash)
+        return key in self.pending or key in self.completed
+
+    def __len__(self):
+        return len(self.pending) + len(self.completed)
+
+    def values(self):
+        # only the urls that still have to be downloaded
+        return self.pending.values()
+
+    def pending_records(self, check):
+        ''' Records of the urls still to be downloaded that pass check(url).
+        check is only called for urls not checked under rules_version yet,
+        the results are kept in the checkpoint. '''
+        if self.check_all:
+            self.invalid = set(
+                key for key, record in self.pending.items() if not check(record[0]))
+        else:
+            for key in self.unchecked:
+                record = self.pending.get(key)
+                if record is not None and not check(record[0]):
+                    self.invalid.add(key)
+        self.unchecked = set()
+        self.check_all = False
+        invalid = self.invalid
+        return [record for key, record in self.pending.items() if key not in invalid]
+
+    def rekey(self, canonical, urlhash):
+        # the log was always keyed by the urlhash of the canonical url
+        return 0
+
+    def put(self, urlhash, record):
+        self.put_many([(urlhash, record)])
+
+    def put_many(self, items):
+        # (urlhash, record) pairs, written with at most one flush. Urls added
+        # while crawling already passed the url filter.
+        for urlhash, record in items:
+            key = self._key(urlhash)
+            self._apply(key, record)
+            self.buffer.append(self._encode(key, record))
+        self.log_records += len(items)
+        if (len(self.buffer) >= self.batch_size
+                or time.time() - self.last_sync >= self.interval):
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            with metrics.timer("save_sync"):
+                self.log.write(b"".join(self.buffer))
+                self.log.flush()
+                os.fsync(self.log.fileno())
+            self.buffer = list()
+        self.last_sync = time.time()
+
+    def close(self):
+        self.flush()
+        offset = self.log.tell()
+        self.log.close()
+        self._write_checkpoint(offset, self.log_records)
+
+
+# the dbm module behind shelve may write the save file under one of these suffixes
+SHELVE_SUFFIXES = ("", ".db", ".dat", ".dir", ".bak")
+LOG_SUFFIXES = ("", ".checkpoint") # the log and its checkpoint, see LogStorage
+
+
+def save_files(save_file):
+    # the files of save_file that exist, whichever storage wrote them
+    return [save_file + suffix for suffix in dict.fromkeys(SHELVE_SUFFIXES + LOG_SUFFIXES)
+            if os.path.exists(save_file + suffix)]
+
+
+STORAGES = {
+    "shelve": ShelveStorage,
+    "log": LogStorage,
+}
+
+
+def open_storage(config, logger, rules_version=None):
+    return STORAGES[config.storage_type](
+        config.save_file, config.commit_batch,
+        config.commit_interval / 1000, logger, rules_version)
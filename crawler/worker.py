@@ -1,20 +1,32 @@
+from functools import lru_cache
 from threading import Thread
+from urllib.parse import urlparse
 
 from inspect import getsource
+from crawler.robots import RobotsUnavailable
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics, RateLimitedLog
 import scraper
 import time
 
 
+@lru_cache(maxsize=None)
+def check_scraper():
+    # basic check for requests in scraper, the source is read once per process instead of per worker
+    source = getsource(scraper)
+    assert {source.find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
+    assert {source.find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+
+
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, robots=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
-        # basic check for requests in scraper
-        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
-        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        self.robots = robots # crawler.robots.RobotsCache, None to ignore robots.txt
+        self.download_log = RateLimitedLog(self.logger, config.log_interval)
+        check_scraper()
         super().__init__(daemon=True)
         
     def run(self):
@@ -23,12 +35,38 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
+            downloaded = True
+            retry_at = None
+            try:
+                downloaded = self.crawl(tbd_url)
+            except RobotsUnavailable as e:
+                # nothing is known about the url yet, it goes back to the frontier
+                self.download_log.info("robots_unavailable", url=tbd_url)
+                downloaded = False
+                retry_at = e.retry_at
+            except Exception:
+                self.logger.exception(f"Failed to crawl {tbd_url}, skipping it.")
+            finally:
+                # completing the url frees its host, without it the other workers wait forever
+                if retry_at is None:
+                    self.frontier.mark_url_complete(tbd_url)
+                else:
+                    self.frontier.defer_url(tbd_url, retry_at)
+            if downloaded and not getattr(self.frontier, "handles_politeness", False):
+                time.sleep(self.frontier.base_delay(urlparse(tbd_url).netloc))
+
+    def crawl(self, tbd_url):
+        # downloads and scrapes the url, False if robots.txt disallows it. Raises
+        # RobotsUnavailable while the robots.txt that would decide did not load.
+        if self.robots is not None and not self.robots.allowed(tbd_url):
+            self.download_log.info("robots_disallowed", url=tbd_url)
+            return False
+        with metrics.timer("download") as timer:
             resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+        self.frontier.record_download(tbd_url, resp.status, timer.elapsed)
+        self.download_log.info(
+            "downloaded", url=tbd_url, status=resp.status,
+            cache=self.config.cache_server)
+        scraped_urls = scraper.scraper(tbd_url, resp)
+        self.frontier.add_urls(scraped_urls, parent=tbd_url)
+        return True
@@ -1,22 +1,64 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
 from utils.config import Config
+from utils.replay import open_corpus, close_corpus
+from utils.metrics import start_exporter
 from crawler import Crawler
-from scraper import print_summary
+from crawler.distributed import DistributedCrawler, shard_configs
+from crawler.frontier import FRONTIERS
+from scraper import configure, configure_stats, shutdown, print_summary, load_analytics
+import traps
 
 import multiprocessing
 multiprocessing.set_start_method("fork")
 
 
-def main(config_file, restart):
+def summary(config):
+    # output.txt from the stats the last crawl checkpointed (it may still be running), without crawling
+    for config in shard_configs(config):
+        load_analytics(config)
+        detector = traps.TrapDetector()
+        detector.load(traps.state_file(config))
+        traps.trap_detector.blocked.update(detector.blocked)
+        traps.trap_detector.blocked_hosts.update(detector.blocked_hosts)
+    print_summary()
+
+
+def main(config_file, restart, summary_only=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if summary_only:
+        summary(config)
+        return
+    if not config.replay_file:
+        # a replayed crawl is served from the recorded corpus, and never imports spacetime
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if config.shards > 1:
+        # each shard process opens its own corpus, scraper state and exporter
+        # (see crawler/distributed.py), nothing is open yet when they fork
+        configure_stats(config)
+        DistributedCrawler(
+            config, restart, frontier_factory=FRONTIERS[config.frontier_type]).start()
+        print_summary()
+        return
+    open_corpus(config)
+    configure(config)
+    exporter = start_exporter(config)
+    if config.engine == "async":
+        # aiohttp is only imported when it is used
+        from crawler.async_crawler import AsyncCrawler
+        crawler_factory = AsyncCrawler
+    else:
+        crawler_factory = Crawler
+    crawler = crawler_factory(
+        config, restart, frontier_factory=FRONTIERS[config.frontier_type])
     crawler.start()
+    close_corpus(config)
+    shutdown()
+    exporter.stop()
 
     print_summary() 
 
@@ -25,5 +67,6 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--summary", action="store_true", default=False)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.summary)
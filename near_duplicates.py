@@ -0,0 +1,94 @@
+from collections import deque
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+
+FINGERPRINT_BITS = 64
+LANE_BITS = 32 # room for each bit's vote count, pages have far fewer than 2**32 tokens
+LANE_MASK = (1 << LANE_BITS) - 1
+
+
+@lru_cache(maxsize=2**16)
+def token_lanes(token):
+    ''' The token's 64 bit hash spread out into one 32 bit lane per bit, so
+    that adding count * lanes for every word sums up all 64 bit votes with a
+    single big int addition. Uses blake2b (unlike hash()) so fingerprints
+    agree across processes. '''
+    h = int.from_bytes(
+        blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    lanes = 0
+    for bit in range(FINGERPRINT_BITS):
+        if h >> bit & 1:
+            lanes |= 1 << (bit * LANE_BITS)
+    return lanes
+
+
+def simhash(word_freq):
+    ''' 64 bit SimHash of a page from its word frequencies. Every word votes
+    on each bit with its count (for if its hash has the bit set, against
+    otherwise); pages with mostly the same words end up with fingerprints that
+    differ in only a few bits. '''
+    set_votes = 0
+    total = 0
+    for word, count in word_freq.items():
+        set_votes += count * token_lanes(word)
+        total += count
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        # votes for minus votes against is set - (total - set)
+        if 2 * (set_votes >> (bit * LANE_BITS) & LANE_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(object):
+    ''' Banded LSH over SimHash fingerprints. The 64 bits are split into
+    max_distance + 1 bands, so two fingerprints at most max_distance bits
+    apart are equal on at least one band and only pages sharing a band are
+    compared. Holds at most capacity fingerprints, the oldest are dropped
+    first. '''
+    def __init__(self, max_distance=3, capacity=100000):
+        self.lock = Lock()
+        self.max_distance = max_distance
+        self.capacity = capacity
+        band_count = max_distance + 1
+        self.band_width = -(-FINGERPRINT_BITS // band_count)
+        self.band_mask = (1 << self.band_width) - 1
+        self.bands = [dict() for _ in range(band_count)] # band value -> fingerprints
+        self.order = deque() # fingerprints, oldest first
+        self.duplicates = 0
+
+    def _band_values(self, fingerprint):
+        return [fingerprint >> (i * self.band_width) & self.band_mask
+                for i in range(len(self.bands))]
+
+    def check_and_add(self, fingerprint):
+        ''' Returns True if a fingerprint within max_distance is already
+        indexed, otherwise indexes this one and returns False. '''
+        band_values = self._band_values(fingerprint)
+        with self.lock:
+            for band, value in zip(self.bands, band_values):
+                for other in band.get(value, ()):
+                    if hamming_distance(fingerprint, other) <= self.max_distance:
+                        self.duplicates += 1
+                        return True
+            for band, value in zip(self.bands, band_values):
+                band.setdefault(value, list()).append(fingerprint)
+            self.order.append(fingerprint)
+            if len(self.order) > self.capacity:
+                self._evict(self.order.popleft())
+            return False
+
+    def _evict(self, fingerprint):
+        for band, value in zip(self.bands, self._band_values(fingerprint)):
+            bucket = band[value]
+            bucket.remove(fingerprint)
+            if not bucket:
+                del band[value]
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,48 @@
+import shelve
+import time
+from hashlib import blake2b
+from threading import Lock
+
+from utils import get_urlhash
+
+
+def content_hash(content):
+    return blake2b(content, digest_size=16).digest()
+
+
+class PageCache(object):
+    ''' What analyze_page found out about every page, keyed by url, kept
+    across crawls so a re-crawl only parses pages whose content changed.
+    Every entry is (content hash, content length, fetch time, PageAnalysis).
+    version says how the analyses were made (parser, canonicalization); the
+    whole cache is dropped when it changes, since cached links would no
+    longer match. '''
+    def __init__(self, path, version):
+        self.lock = Lock()
+        self.path = path
+        self.cache = shelve.open(path)
+        if self.cache.get("version") != version:
+            self.cache.clear()
+            self.cache["version"] = version
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url, content):
+        ''' The cached PageAnalysis of url if its content has not changed, else None. '''
+        with self.lock:
+            entry = self.cache.get(get_urlhash(url))
+            if (entry is None or entry[1] != len(content)
+                    or entry[0] != content_hash(content)):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[3]
+
+    def put(self, url, content, page):
+        with self.lock:
+            self.cache[get_urlhash(url)] = (
+                content_hash(content), len(content), time.time(), page)
+
+    def close(self):
+        with self.lock:
+            self.cache.close()
@@ -0,0 +1,95 @@
+# bs4 and lxml are imported by the engine that uses them, the first time it parses a page
+
+# tags whose text BeautifulSoup's get_text leaves out
+NON_TEXT_TAGS = {"script", "style", "template"}
+
+
+def parse_soup(content):
+    ''' Builds the full BeautifulSoup tree and walks it once per question. '''
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'lxml')
+    text = soup.get_text(separator=' ')
+    links = [a['href'] for a in soup.find_all('a', href=True)]
+    has_form = soup.find('form') is not None
+    return text, links, has_form
+
+
+class PageTarget(object):
+    ''' lxml parser target that collects the text, the anchor hrefs and
+    whether there is a form while the document is being parsed, without ever
+    building a tree. Text is split into strings the same way BeautifulSoup
+    does, so the tokens come out identical. '''
+    def __init__(self):
+        self.strings = list()
+        self.current = list() # pieces of the text node being parsed
+        self.links = list()
+        self.has_form = False
+        self.skip_depth = 0 # > 0 while inside script/style/template
+
+    def _end_string(self):
+        if self.current:
+            self.strings.append("".join(self.current))
+            self.current = list()
+
+    def start(self, tag, attrib):
+        self._end_string()
+        if tag in NON_TEXT_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.links.append(href)
+        elif tag == "form":
+            self.has_form = True
+
+    def end(self, tag):
+        self._end_string()
+        if tag in NON_TEXT_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.current.append(data)
+
+    def comment(self, text):
+        self._end_string()
+
+    def pi(self, target, data=None):
+        self._end_string()
+
+    def close(self):
+        self._end_string()
+        return " ".join(self.strings), self.links, self.has_form
+
+
+def parse_stream(content):
+    ''' Single pass over the document with lxml's parser events. The
+    encoding is detected like BeautifulSoup does: every encoding its
+    EncodingDetector suggests is tried in turn until lxml accepts one, so
+    undeclared and non-ascii pages decode the same in both engines. '''
+    from bs4.dammit import EncodingDetector
+    from lxml import etree
+    detector = EncodingDetector(content, is_html=True)
+    encodings = detector.encodings
+    if content.isascii() and detector.find_declared_encoding(content, is_html=True) is None:
+        # any encoding it could suggest reads ascii the same, skip the charset detection
+        encodings = ["utf-8"]
+    for encoding in encodings:
+        parser = etree.HTMLParser(target=PageTarget(), recover=True, encoding=encoding)
+        try:
+            parser.feed(detector.markup)
+            return parser.close()
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+    return "", [], False
+
+
+ENGINES = {
+    "soup": parse_soup,
+    "stream": parse_stream,
+}
+
+
+def parse_page(content, engine="soup"):
+    ''' Returns (text, hrefs of the anchors, whether the page has a form). '''
+    return ENGINES[engine](content)
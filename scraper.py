@@ -1,21 +1,102 @@
-import re
+import logging
+import os
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup # PLEASE INSTALL THIS PACKAGE FOR HTML PARSING
+# PLEASE INSTALL BeautifulSoup AND lxml FOR HTML PARSING (used in page_parser.py)
 #by running 'pip install beautifulsoup4' in terminal
 # must also install the lxml parser by running 'pip install lxml' in terminal
 # documentation can be found here: https://www.crummy.com/software/BeautifulSoup/bs4/doc/
 
-from tokenizer import tokenize, computeWordFrequencies, get_longest_page, get_50_most_common
+import traps
+from tokenizer import tokenize, computeWordFrequencies
+from analytics import WordFrequencies, WORD_FREQUENCIES, PageWordCounts, AnalyticsStore
+from analytics import state_file as analytics_file
+from near_duplicates import SimHashIndex, simhash
+from page_cache import PageCache
+from url_filter import url_filter
+from page_parser import parse_page
+from content_gate import ContentGate, DEAD_PAGE, LOGIN, MIN_TOKENS
+from utils.url_set import UrlSet
+from utils.canonical import canonicalize, set_canonicalizer
+from utils.metrics import metrics, peak_rss, RateLimitedLog
+from utils.response import content_type, is_text
+from utils import get_logger
 
-unique_links = set() #to track URL's that we have already seen
-word_count = {} # to store the URL and the word count
-all_word_freq = {} # to store word frequency
+unique_links = UrlSet() #to track URL's that we have already seen (keeps an 8 byte hash per URL, not the string)
+raw_links = UrlSet() # the same links as they were written on the pages, before canonicalization
+duplicates_avoided = 0 # links that were new as written but canonicalized to a URL we already had
+word_count = PageWordCounts() # to store the URL and the word count (url -> count, in arrays)
+all_word_freq = WordFrequencies() # to store word frequency, safe to update from several workers
 subdomain_count = {} # counting the subdomains for uci.edu
+parser_engine = "soup" # which page_parser engine extract_next_links uses
+near_duplicates = SimHashIndex() # fingerprints of the pages crawled so far, None to turn the check off
+parse_pool = None # process pool that analyze_page runs in, None to parse in the calling thread
+page_cache = None # analyses of earlier crawls, unchanged pages are not parsed again. None to always parse
+max_page_bytes = 2 * 2**20 # longer pages are cut to this many bytes before parsing, 0 to never cut them
+content_gate = ContentGate() # skips thin, dead and login pages from their raw bytes, None to parse every page
+record_lock = Lock() # guards the globals above while a page is recorded
+page_log = RateLimitedLog(logging.getLogger("SCRAPER")) # instead of a print per page, see utils/metrics.py
+analytics_store = None # checkpoints the stats print_summary reports next to the save file, see open_analytics
+saved_totals = (0, Counter(), Counter()) # duplicates_avoided, subdomain_count and rejections at the last checkpoint
+
+# what analyze_page found out about a page. links are (canonical link, link as written, host, passed is_valid) tuples,
+# timings are the seconds each stage took, recorded into metrics by the caller (analyze_page may run in another process)
+PageAnalysis = namedtuple(
+    "PageAnalysis", ["skipped", "token_count", "word_freq", "fingerprint", "links", "rejections", "timings"])
+
+
+def configure_stats(config):
+    # only what merge_stats and print_summary need, for a process that does not crawl itself
+    global all_word_freq
+    set_canonicalizer(config.canonicalize_steps)
+    traps.configure(config)
+    all_word_freq = WORD_FREQUENCIES[config.word_frequencies]()
+
+
+def configure(config):
+    global parser_engine, near_duplicates, parse_pool, page_log, page_cache, max_page_bytes, content_gate
+    configure_stats(config)
+    parser_engine = config.parser_engine
+    max_page_bytes = config.max_page_bytes
+    content_gate = ContentGate() if config.content_gate else None
+    page_log = RateLimitedLog(get_logger("SCRAPER"), config.log_interval)
+    metrics.collect("rejections_total", "counter", "rule", lambda: url_filter.rejections)
+    metrics.collect("peak_rss_bytes", "gauge", "process", peak_rss)
+    if content_gate is not None:
+        metrics.collect("content_gate_skips", "gauge", "rule", lambda: content_gate.skips.copy())
+        metrics.collect("content_gate", "gauge", "stat", content_gate.stats)
+    near_duplicates = (
+        SimHashIndex(config.simhash_distance, config.simhash_capacity)
+        if config.simhash_distance >= 0 else None)
+    if config.page_cache:
+        page_cache = PageCache(
+            config.page_cache,
+            repr((parser_engine, config.canonicalize_steps, url_filter.version, PageAnalysis._fields)))
+    if config.parse_processes > 0:
+        parse_pool = ProcessPoolExecutor(config.parse_processes)
+        # fork the processes now, before any worker threads are running
+        parse_pool.submit(len, "").result()
+
+
+def shutdown():
+    # after the crawl: stop the parse processes and write out the page cache
+    if parse_pool is not None:
+        parse_pool.shutdown()
+    if page_cache is not None:
+        page_cache.close()
+    if content_gate is not None:
+        get_logger("SCRAPER").info(content_gate.summary())
+    rss = peak_rss()
+    get_logger("SCRAPER").info(
+        f"Peak RSS {rss['crawler'] / 2**20:.1f} MB, parse processes {rss['parse_processes'] / 2**20:.1f} MB.")
 
 
 def scraper(url, resp):
-    links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    # extract_next_links only returns the links that passed is_valid when the page was analyzed
+    return extract_next_links(url, resp)
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -30,240 +111,293 @@ def extract_next_links(url, resp):
     
     # checking if there was a problem with the page, if there is we do not return anything
     if resp.status != 200: 
-        print(f"Error {resp.status} for {url}: {resp.error}")
+        page_log.info("download_error", url=url, status=resp.status, error=resp.error)
+        traps.trap_detector.record(url, low_information=True)
         return []
     
+    # too large to even unpickle, see MAX_RESPONSE_BYTES in config.ini
+    if resp.too_large:
+        page_log.info("page_too_large", url=url, bytes=resp.size)
+        traps.trap_detector.record(url, low_information=True)
+        return []
+
     if not resp.raw_response or not resp.raw_response.content: 
-        print(f"Error with response for {url}")
+        page_log.info("empty_response", url=url)
+        traps.trap_detector.record(url, low_information=True)
         return []
-    
-    print(f"In extract_next_links: {url}")
 
-    global unique_links, word_count, all_word_freq, subdomain_count # to make sure these are global and not local
-    
-    hyperlinks = []
+    # images, pdfs, archives... are not parsed at all
+    content = resp.raw_response.content
+    if not is_text(content_type(resp.raw_response), content):
+        page_log.info("not_a_page", url=url, content_type=content_type(resp.raw_response))
+        traps.trap_detector.record(url, low_information=True)
+        return []
+    if max_page_bytes and len(content) > max_page_bytes:
+        page_log.info("page_truncated", url=url, bytes=len(content))
+        content = content[:max_page_bytes]
     
+    # the cpu heavy part (parsing, tokenizing, checking links) only needs the content,
+    # so it can run in another process. Everything that touches the globals stays here.
+    # on a re-crawl a page whose content did not change is not parsed again
+    page = page_cache.get(url, content) if page_cache is not None else None
+    # thin, dead and login pages are mostly caught from the raw bytes, without building the tree
+    gated = content_gate.check(content) if page is None and content_gate is not None else None
+    if page is not None:
+        page = page._replace(timings={})
+    elif gated is not None:
+        page = PageAnalysis(f"Skipping {gated} page before parsing: {url}", 0, None, None, [], None, {})
+    elif parse_pool is not None:
+        page = parse_pool.submit(
+            analyze_page, url, resp.url, content, parser_engine).result()
+    else:
+        page = analyze_page(url, resp.url, content, parser_engine)
+    if content_gate is not None and "parse" in page.timings:
+        content_gate.parsed(len(content), page.timings["parse"] + page.timings.get("tokenize", 0))
+    if page_cache is not None and page.timings:
+        page_cache.put(url, content, page)
+    for stage, seconds in page.timings.items():
+        metrics.observe(stage, seconds)
+    # skipped pages (too few tokens, dead, login...) count against the url's template
+    traps.trap_detector.record(url, low_information=page.skipped is not None)
+    return record_page(url, resp.url, page)
+
+def analyze_page(url, page_url, content, engine):
+    # Parses the page and works out everything the crawl needs from it without touching any global state,
+    # so it is safe to run in a worker process. Returns a PageAnalysis, skipped is set to a message when the
+    # page should not be used.
+    timings = {}
+    start = time.perf_counter()
     try:
-        soup = BeautifulSoup(resp.raw_response.content, 'lxml') # parse the content of the page 
+        # parse the content of the page, getting all the text (seperated so we can process the content),
+        # the links and whether there is a form on the page
+        text, just_links, has_form = parse_page(content, engine)
     except Exception as e:
-        print(f"Error parsing HTML for {url}: {e}")
-        return []
+        return PageAnalysis(f"Error parsing HTML for {url}: {e}", 0, None, None, [], None, timings)
+    timings["parse"] = time.perf_counter() - start
     
-    text = soup.get_text(separator=' ').lower() # getting all the text from the soup and seperating it so we can process the content
+    text = text.lower()
 
+    start = time.perf_counter()
     tokens = tokenize(text) 
-    if len(tokens) < 15: 
-        print(f"Skipping page with low information: {url}")
-        return []
+    timings["tokenize"] = time.perf_counter() - start
+    if len(tokens) < MIN_TOKENS: 
+        return PageAnalysis(f"Skipping page with low information: {url}", len(tokens), None, None, [], None, timings)
 
-    # some common errors that we can check for on the page
-    http_errors = set([
-    "page not found",
-    "page could not be found",
-    "page does not exist",
-    "404 not found",
-    "error 404",
-    "problem loading page",
-    "content not available",
-    "content not found",
-    "no results found",
-    "no results available",
-    "resource not available",
-    "resource not found",
-    "not a valid page",
-    "the requested URL was not found on this server."
-    ])  
-    if any(error in text for error in http_errors):
-        print(f"Skipping dead page: {url}")
-        return []
-    
-    # Check for authentication/login pages that require credentials
-    auth_indicators = set([
-    "login",
-    "log in",
-    "sign in",
-    "username",
-    "password",
-    "authentication",
-    "credentials",
-    "insufficient access privileges",
-    "access to information in these pages are restricted",
-    "please make sure to login",
-    "you are currently not logged in"
-    ])
+    # some common errors that we can check for on the page (DEAD_PAGE_PHRASES in content_gate.py, one regex for all of them)
+    if DEAD_PAGE.search(text):
+        return PageAnalysis(f"Skipping dead page: {url}", len(tokens), None, None, [], None, timings)
     
+    # Check for authentication/login pages that require credentials (LOGIN_PHRASES in content_gate.py)
     # If the page contains authentication indicators and has a form, it's likely a login page
-    if any(indicator in text.lower() for indicator in auth_indicators) and soup.find('form'):
-        print(f"Skipping authentication page: {url}")
-        return []
-    
-    # now we scrape the page for links
-    potential_links = soup.find_all('a', href=True) # with the soup, find all the 'a' tags that have a href
-    just_links = [a['href'] for a in potential_links] # get the hyperlinks themselves without the tags
+    if has_form and LOGIN.search(text):
+        return PageAnalysis(f"Skipping authentication page: {url}", len(tokens), None, None, [], None, timings)
 
-    for link in just_links:
-        complete_link = urljoin(resp.url, link) # make sure all the links are complete links 
-
-        parsed = urlparse(complete_link) # parse the complete link and remove the fragment if it has one
-        if parsed.fragment:
-            complete_link = complete_link.split('#')[0]
-
-        if is_valid(complete_link): # making sure it is within the domains and paths specified
-            hyperlinks.append(complete_link) # add the complete link to the list we will return
-            unique_links.add(complete_link) 
-
-        # ALL CODE BELOW THIS LINE IS FOR DELIVERABLE ------------------------------
-            # to get the subdomain and the count
-        if parsed.netloc.endswith("uci.edu"):
-            if parsed.netloc not in subdomain_count:
-                subdomain_count[parsed.netloc] = 1
-            else:
-                subdomain_count[parsed.netloc] += 1
-           
     word_freq = computeWordFrequencies(tokens)
 
-    word_count[resp.url] = len(tokens) # to get the word count for the page
-    print (f"Word count for {resp.url}: {word_count[resp.url]}")
-    
-    for word in word_freq: # sum up word frequencies
-        if word in all_word_freq:
-            all_word_freq[word] = all_word_freq.get(word, 0) + word_freq[word]
-        else:
-            all_word_freq[word] = word_freq[word]
+    links = []
+    rejections = Counter()
+    start = time.perf_counter()
+    # now we go through the links (hrefs of all the 'a' tags that have one)
+    for link in just_links:
+        complete_link = urljoin(page_url, link).split('#')[0] # make sure all the links are complete links, without the fragment
+
+        # the same page can be linked as http/https, with or without www., index.html, reordered queries...
+        # the canonical form is the one the frontier and unique_links use (see utils/canonical.py)
+        canonical_link = canonicalize(complete_link)
+        parsed = urlparse(canonical_link)
+
+        rejected = url_filter.check(canonical_link) # making sure it is within the domains and paths specified
+        if rejected:
+            rejections[rejected] += 1
+        links.append((canonical_link, complete_link, parsed.netloc, not rejected))
+    timings["is_valid"] = time.perf_counter() - start # all of the page's links
+
+    return PageAnalysis(None, len(tokens), word_freq, simhash(word_freq), links, rejections, timings)
+
+def record_page(url, page_url, page):
+    # Adds a PageAnalysis to the global stats and returns the links to crawl. Runs under record_lock so
+    # several workers can record pages at the same time.
+    global unique_links, word_count, all_word_freq, subdomain_count, duplicates_avoided # to make sure these are global and not local
+
+    if page.skipped:
+        page_log.info("page_skipped", url=url, reason=page.skipped)
+        return []
+
+    with record_lock:
+        # a page recorded just before a crash may not be marked complete in the save file yet,
+        # it is downloaded again on resume but only counted once
+        recorded = word_count.get(page_url) is not None
+        if recorded:
+            return [canonical_link for canonical_link, _, _, valid in page.links if valid]
+
+        url_filter.rejections.update(page.rejections)
+
+        # mirrored pages (wiki revisions, directory listings...) have almost the same words,
+        # if we already crawled a page like this one we do not expand its links
+        if near_duplicates is not None and near_duplicates.check_and_add(page.fingerprint):
+            page_log.info("near_duplicate", url=url)
+            return []
 
-    print(f"Current URL count: {len(unique_links)}\n")
+        hyperlinks = []
+        for canonical_link, complete_link, netloc, valid in page.links:
+            if valid:
+                hyperlinks.append(canonical_link) # add the complete link to the list we will return
+                new_link = unique_links.add(canonical_link)
+                # a link we have not seen written this way before, but that is a page we already have
+                if raw_links.add(complete_link) and not new_link:
+                    duplicates_avoided += 1
+
+            # ALL CODE BELOW THIS LINE IS FOR DELIVERABLE ------------------------------
+                # to get the subdomain and the count
+            if netloc.endswith("uci.edu"):
+                if netloc not in subdomain_count:
+                    subdomain_count[netloc] = 1
+                else:
+                    subdomain_count[netloc] += 1
+               
+        word_count[page_url] = page.token_count # to get the word count for the page
+        
+        all_word_freq.update(page.word_freq) # sum up word frequencies
+
+        page_log.info("page_recorded", url=page_url, words=page.token_count, unique_urls=len(unique_links))
+
+        if analytics_store is not None and analytics_store.should_save():
+            _checkpoint_stats()
 
     return hyperlinks
 
 def is_valid(url):
-    # Decide whether to crawl this url or not. 
+    # Decide whether to crawl this url or not.
     # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        
-        #the domains we are supposed to keep
-        domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
-        
-        # check if the domain is valid from the list and then in the today.uci.edu case, 
-        # make sure it has the path that we want to keep too
-        if not (any(parsed.netloc.endswith(domain) for domain in domains) or
-            ("today.uci.edu" in parsed.netloc and 
-             "/department/information_computer_sciences" in parsed.path)):
-            return False
-
-        # check if url is too long
-        if len(url) > 2000:
-            return False
-
-        # check for crawler traps - calendars and date-based URLs
-        if re.search(r"calendar|/>(year|month|day)=\d+", parsed.path.lower()):
-            return False
-            
-        # Enhanced event page detection - avoid crawling too many event pages
-        if re.search(r"events?/(\d{4}|\d{2})/(\d{2})/(\d{2})|events?/category|events?/tag|events?/\d+|events?/page/\d+|events?/day/|events?/month/|events?/week/|events?/archive", parsed.path.lower()):
-            print(f"Skipping event page: {url}")
-            return False
-            
-        # Detect date-based URL patterns that often lead to crawler traps
-        if re.search(r"/(20\d{2})/(0[1-9]|1[0-2])/(0[1-9]|[12]\d|3[01])|/(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)|(january|february|march|april|may|june|july|august|september|october|november|december)/", parsed.path.lower()):
-            print(f"Skipping date-based URL: {url}")
-            return False
-        
-        # check patterns that may indicate a crawler trap
-        path_segments = parsed.path.split('/')
-        # might need to adjust threshold during testing
-        if len(path_segments) > 8:
-            return False
-        
-        # check for any repetitions that may indicate a crawler trap
-        if len(set(path_segments)) < len(path_segments) / 2:
-            return False
-            
-        # Check for adjacent repeated path segments (like 'EMWS09/EMWS09')
-        for i in range(1, len(path_segments)):
-            if path_segments[i] and path_segments[i] == path_segments[i-1]:
-                print(f"Skipping URL with adjacent repeated path segments: {url}")
-                return False
-        
-        # Filter out share (saw a lot of facebook and X redirects) 
-        if "share=" in parsed.query:
-            return False
-        
-        if "ical" in parsed.path or "ical" in parsed.query: # avoid calendar (nothing on the page)
-            return False
-        
-        if "do=diff" in parsed.path or "do=diff" in parsed.query: # show revisions of a page (not very important for info and very similar to each other)
-            return False
-        
-        if "idx=" in parsed.query: 
-            return False
-        
-        if "rev=" in parsed.query: # remove the pages showing revisions 
-            return False
+    # The rules themselves are declared in url_filter.py, rejections are
+    # counted per rule in url_filter.rejections.
+    return url_filter.is_valid(url)
 
-        if "action=download" in parsed.query: # avoid downloading files
-            return False
-        
-        if "wiki.ics.uci.edu" in parsed.netloc and (
-            "do=media" in parsed.query or "image=" in parsed.query
-        ):
-            return False
-        
-        if "pdf" in parsed.path: # avoid pdf in paths
-            return False
-        
-        if "redirect_to" in parsed.query or "login.php" in parsed.path: # avoid redirects and log in
-            return False
-        
-        if re.search(r"\.(java|py|js)$", parsed.path.lower()): # avoiding these code files
-            return False
-        
-        if "git" in parsed.path or "git" in parsed.query: # avoid git pages
-            return False
-        
-        # Skip specific event page patterns for known domains
-        if any(domain in parsed.netloc for domain in ["wics.ics.uci.edu", "isg.ics.uci.edu", "ics.uci.edu"]) and re.search(r"events?/|calendar/|schedule/", parsed.path.lower()):
-            print(f"Skipping domain-specific event page: {url}")
-            return False
-            
-        # Skip wiki pages that are likely to require authentication
-        if "wiki.ics.uci.edu" in parsed.netloc and (
-            "/doku.php/accounts:" in parsed.path or 
-            "/doku.php/login" in parsed.path or
-            "?do=login" in parsed.query
-        ):
-            print(f"Skipping restricted wiki page: {url}")
-            return False
-        
-        if re.search(r"[?&]C=(N|S);O=(A|D)", parsed.query): # seen a lot with eppstein, skip these (not a lot of info)
-            print(f"Skipping directory: {url}")
-            return False
-        
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz|ics|apk|war|img|jpg|scm|mpg|ppsx|frk|shar|lif|php)$", parsed.path.lower())
-
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
+def shard_stats():
+    # everything print_summary reports, for merge_stats in another process
+    with record_lock:
+        return {
+            "unique_links": unique_links,
+            "raw_links": raw_links,
+            "duplicates_avoided": duplicates_avoided,
+            "word_count": word_count,
+            "all_word_freq": all_word_freq,
+            "subdomain_count": subdomain_count,
+            "rejections": url_filter.rejections,
+            "blocked_templates": traps.trap_detector.blocked,
+            "blocked_hosts": traps.trap_detector.blocked_hosts,
+        }
+
+def merge_stats(stats):
+    # adds the stats of another crawler process (see crawler/distributed.py) to the globals
+    global duplicates_avoided
+    with record_lock:
+        unique_links.update(stats["unique_links"])
+        raw_links.update(stats["raw_links"])
+        duplicates_avoided += stats["duplicates_avoided"]
+        word_count.merge(stats["word_count"])
+        all_word_freq.merge(stats["all_word_freq"])
+        for subdomain, count in stats["subdomain_count"].items():
+            subdomain_count[subdomain] = subdomain_count.get(subdomain, 0) + count
+        url_filter.rejections.update(stats["rejections"])
+        traps.trap_detector.blocked.update(stats["blocked_templates"])
+        traps.trap_detector.blocked_hosts.update(stats["blocked_hosts"])
+
+def load_analytics(config):
+    # adds the stats an earlier crawl with this config checkpointed to the globals and returns their store
+    store = AnalyticsStore(analytics_file(config))
+    with record_lock:
+        for record in store.read():
+            _add_stats_record(record)
+    return store
+
+def open_analytics(config, restart):
+    # Called by the frontier. A resumed crawl starts from the stats its earlier runs checkpointed,
+    # from now on they are checkpointed again every analytics.SAVE_INTERVAL seconds.
+    global analytics_store, saved_totals
+    if restart and os.path.exists(analytics_file(config)):
+        os.remove(analytics_file(config))
+    store = load_analytics(config)
+    with record_lock:
+        for stats in (unique_links, raw_links, word_count, all_word_freq):
+            stats.journal()
+        saved_totals = _stats_totals()
+        analytics_store = store
+
+def close_analytics():
+    # called when the frontier closes, checkpoints what was recorded since the last checkpoint
+    global analytics_store
+    with record_lock:
+        if analytics_store is not None:
+            _checkpoint_stats()
+            analytics_store = None
+
+def _stats_totals():
+    # dict() copies the rejections in one step, the frontier counts into them without record_lock
+    return (duplicates_avoided, Counter(subdomain_count), Counter(dict(url_filter.rejections)))
+
+def _checkpoint_stats():
+    # Runs under record_lock. Every record adds to what was already on disk: the first one (and one
+    # after every analytics.COMPACT_AFTER deltas) is a snapshot of everything, the others only hold
+    # what changed since the record before.
+    global saved_totals
+    totals = _stats_totals()
+    record = {
+        "snapshot": False,
+        "unique_links": unique_links.take_journal(),
+        "raw_links": raw_links.take_journal(),
+        "word_count": word_count.take_journal(),
+        "all_word_freq": all_word_freq.take_journal(),
+        "duplicates_avoided": totals[0] - saved_totals[0],
+        "subdomain_count": totals[1] - saved_totals[1], # counts only ever grow
+        "rejections": totals[2] - saved_totals[2],
+    }
+    if analytics_store.needs_snapshot():
+        record.update({
+            "snapshot": True,
+            "unique_links": unique_links,
+            "raw_links": raw_links,
+            "word_count": word_count,
+            "all_word_freq": all_word_freq,
+            "duplicates_avoided": totals[0],
+            "subdomain_count": totals[1],
+            "rejections": totals[2],
+        })
+        analytics_store.write_snapshot(record)
+    else:
+        analytics_store.append(record)
+    saved_totals = totals
+
+def _add_stats_record(record):
+    global duplicates_avoided, all_word_freq
+    if record["snapshot"]:
+        unique_links.update(record["unique_links"])
+        raw_links.update(record["raw_links"])
+        word_count.merge(record["word_count"])
+        if all_word_freq.pages:
+            all_word_freq.merge(record["all_word_freq"])
+        else:
+            all_word_freq = record["all_word_freq"] # exact or sketched, as the crawl that saved it
+    else:
+        unique_links.replay_journal(record["unique_links"])
+        raw_links.replay_journal(record["raw_links"])
+        word_count.replay_journal(record["word_count"])
+        all_word_freq.replay_journal(record["all_word_freq"])
+    duplicates_avoided += record["duplicates_avoided"]
+    for subdomain, count in record["subdomain_count"].items():
+        subdomain_count[subdomain] = subdomain_count.get(subdomain, 0) + count
+    url_filter.rejections.update(record["rejections"])
 
 def print_summary(output="output.txt"):  
     global subdomain_count, unique_links, word_count, all_word_freq
-    with open(output, "w") as file:
+    # under record_lock it can also be written while the crawl is running
+    with record_lock, open(output, "w") as file:
         file.write("SUMMARY: -----------------------------------\n")
         file.write(f"Total unique links: {len(unique_links)}\n")
-        file.write(f"Page with longest word count: {get_longest_page(word_count)}\n\n")
+        file.write(f"Duplicate downloads avoided by canonicalization: {duplicates_avoided}\n")
+        file.write(f"Page with longest word count: {word_count.longest_page()}\n\n")
 
-        most_common_words = get_50_most_common(all_word_freq)
+        most_common_words = all_word_freq.most_common(50)
         file.write("Most Common Words:\n")
         for word, freq in most_common_words:
             file.write(f"{word}: {freq}\n")
@@ -273,3 +407,13 @@ def print_summary(output="output.txt"):
         for subdomain, count in sorted_subdomains.items():
             file.write(f"{subdomain}: {count}\n")
 
+        file.write("Rejected Links By Rule:\n")
+        for rule, count in url_filter.rejections.most_common():
+            file.write(f"{rule}: {count}\n")
+
+        file.write("Blocked Trap Templates:\n")
+        for template, reason in traps.trap_detector.blocked.items():
+            file.write(f"{template}: {reason}\n")
+        for host, reason in traps.trap_detector.blocked_hosts.items():
+            file.write(f"{host}: {reason}\n")
+
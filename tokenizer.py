@@ -1,13 +1,11 @@
+import heapq
+import re
+from collections import Counter
 
 # imported my functions from assignment 1 - Rachael Le
-def tokenize(text_string):
-    token_list = []
-    token = []
 
-    alphanum = set("abcdefghijklmnopqrstuvwxyz'") # keep apostrophes now as well
-
-    # list is from assignment 1 writeup link
-    stop_words = {
+# list is from assignment 1 writeup link
+STOP_WORDS = frozenset({
     "a", "about", "above", "after", "again", "against", "all", "am", "an", "and",
     "any", "are", "aren't", "as", "at", "be", "because", "been", "before", "being",
     "below", "between", "both", "but", "by", "can't", "cannot", "could", "couldn't",
@@ -28,36 +26,24 @@ def tokenize(text_string):
     "while", "who", "who's", "whom", "why", "why's", "with", "won't", "would",
     "wouldn't", "you", "you'd", "you'll", "you're", "you've", "your", "yours",
     "yourself", "yourselves", "ics", "uci"
-    }
+    })
 
-    for char in text_string:
-        if char.lower() in alphanum: # specify we only want english alphabet and numbers in tokens
-            token.append(char.lower())
-        else:
-            if token: # if not alphanumeric, see if the token is empty, if not empty, do a check
-                token_string = ''.join(token)
-                if token_string not in stop_words and len(token_string)>1: # check if the token is a stop word and greater than one character
-                    token_list.append(token_string)
-                token = [] # reset
+# a token is a run of english letters and apostrophes. The kelvin sign is the
+# only other character whose lower() is one of those, the per character loop
+# this replaced treated it as a 'k' so it is kept here too.
+TOKEN_PATTERN = re.compile("[a-zA-Z'\u212a]+")
 
-    if token: # if the last character is alphanumeric, catch the token
-        token_string = ''.join(token)
-        if token_string not in stop_words and len(token_string)>1: # check if the token is a stop word and greater than one character
-            token_list.append(token_string)
-        token = [] # reset
 
+def tokenize(text_string):
+    token_list = []
+    for token in TOKEN_PATTERN.findall(text_string):
+        token = token.lower()
+        if len(token) > 1 and token not in STOP_WORDS: # check if the token is a stop word and greater than one character
+            token_list.append(token)
     return token_list
 
-def computeWordFrequencies(token_list): 
-    word_freq={}
-
-    for token in token_list: 
-        if token not in word_freq: # if not in the dict add it with a count of one
-            word_freq[token]=1
-        else:
-            word_freq[token]+=1 #if in dict, increment everytime you see the same token
-    
-    return word_freq
+def computeWordFrequencies(token_list):
+    return Counter(token_list)
 
 def get_longest_page(word_count): 
     if not word_count:
@@ -66,9 +52,5 @@ def get_longest_page(word_count):
     return longest_page, word_count[longest_page] # return the page and the number of words in it
 
 def get_50_most_common(all_word_freq): 
-    
-    sorted_word_freq = sorted(all_word_freq.items(), key=lambda item: item[1], reverse=True) 
-    most_common = sorted_word_freq[:50]
-
-    return most_common
-
+    # a heap of 50 instead of sorting the whole vocabulary, ties keep the same order as sorted()
+    return heapq.nlargest(50, all_word_freq.items(), key=lambda item: item[1])
@@ -0,0 +1,148 @@
+import os
+import pickle
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlsplit
+
+DATE = re.compile(r"\d{4}-\d{1,2}(?:-\d{1,2})?|\d{8}")
+NUMBER = re.compile(r"\d+")
+SAVE_INTERVAL = 30 # seconds between saves of the detector state while crawling
+
+
+def _wildcard(part):
+    if DATE.fullmatch(part):
+        return "<date>"
+    return NUMBER.sub("<n>", part)
+
+
+def url_template(url):
+    ''' Collapses a url into the pattern it was generated from: numbers and
+    dates in the path and in query values become wildcards, query parameters
+    are sorted. /events/2019-05-01/page/3?id=7 and /events/2020-01-12/page/9?id=2
+    share the template /events/<date>/page/<n>?id=<n>. '''
+    parsed = urlsplit(url)
+    template = parsed.netloc + "/".join(
+        _wildcard(segment) for segment in parsed.path.split("/"))
+    if parsed.query:
+        params = sorted(
+            f"{key}={_wildcard(value)}" for key, _, value in
+            (param.partition("=") for param in parsed.query.split("&") if param))
+        template += "?" + "&".join(params)
+    return template
+
+
+class TrapDetector(object):
+    ''' Learns crawler traps while crawling instead of relying only on the
+    hard coded rules in url_filter.py. Every fetch is counted against its
+    url template and its host, together with whether it was low information
+    (error status or too few tokens). A template is blocked once it used up
+    its fetch budget, or once at least min_samples of its fetches came back
+    and more than low_info_ratio of them were low information. A host is
+    blocked the same way with 10x min_samples.
+
+    Only the max_templates most recently used templates are tracked (and at
+    most as many blocked ones), so memory stays bounded. '''
+    def __init__(self, template_budget=200, low_info_ratio=0.5,
+                 min_samples=20, max_templates=100000):
+        self.lock = Lock()
+        self.template_budget = template_budget
+        self.low_info_ratio = low_info_ratio
+        self.min_samples = min_samples
+        self.max_templates = max_templates
+        self.templates = OrderedDict() # template -> [fetches, low information fetches]
+        self.hosts = dict() # host -> [fetches, low information fetches]
+        self.blocked = OrderedDict() # template -> why it was blocked
+        self.blocked_hosts = dict() # host -> why it was blocked
+        self.updates = 0 # record calls since the last save
+        self.last_save = time.time()
+
+    def allows(self, url):
+        if not self.blocked and not self.blocked_hosts:
+            return True
+        template = url_template(url)
+        return (template not in self.blocked
+                and template.split("/", 1)[0] not in self.blocked_hosts)
+
+    def record(self, url, low_information):
+        template = url_template(url)
+        host = template.split("/", 1)[0]
+        with self.lock:
+            self.updates += 1
+            counts = self.templates.pop(template, None) or [0, 0]
+            self.templates[template] = counts # most recently used last
+            if len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+            host_counts = self.hosts.setdefault(host, [0, 0])
+            for c in (counts, host_counts):
+                c[0] += 1
+                if low_information:
+                    c[1] += 1
+            if template in self.blocked:
+                return
+            if counts[0] >= self.template_budget:
+                self._block(template, f"fetch budget of {self.template_budget} used up")
+            elif self._mostly_low_information(counts, self.min_samples):
+                self._block(template, f"{counts[1]} of {counts[0]} fetches low information")
+            if (host not in self.blocked_hosts
+                    and self._mostly_low_information(host_counts, 10 * self.min_samples)):
+                self.blocked_hosts[host] = (
+                    f"{host_counts[1]} of {host_counts[0]} fetches low information")
+
+    def block_host(self, host, reason):
+        # for hosts blocked from outside, e.g. given up by crawler/rate_control.py
+        with self.lock:
+            self.blocked_hosts.setdefault(host, reason)
+
+    def _mostly_low_information(self, counts, min_samples):
+        return counts[0] >= min_samples and counts[1] > self.low_info_ratio * counts[0]
+
+    def _block(self, template, reason):
+        self.blocked[template] = reason
+        if len(self.blocked) > self.max_templates:
+            self.blocked.popitem(last=False)
+
+    def should_save(self):
+        return self.updates and time.time() - self.last_save >= SAVE_INTERVAL
+
+    def save(self, path):
+        with self.lock:
+            state = {
+                "templates": list(self.templates.items()),
+                "hosts": dict(self.hosts),
+                "blocked": list(self.blocked.items()),
+                "blocked_hosts": dict(self.blocked_hosts),
+            }
+            self.updates = 0
+            self.last_save = time.time()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as state_file:
+            pickle.dump(state, state_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as state_file:
+            state = pickle.load(state_file)
+        with self.lock:
+            self.templates = OrderedDict(state["templates"])
+            self.hosts = state["hosts"]
+            self.blocked = OrderedDict(state["blocked"])
+            self.blocked_hosts = state["blocked_hosts"]
+
+
+trap_detector = TrapDetector()
+
+
+def configure(config):
+    global trap_detector
+    trap_detector = TrapDetector(
+        config.trap_template_budget, config.trap_low_info_ratio,
+        config.trap_min_samples, config.trap_max_templates)
+
+
+def state_file(config):
+    # the detector's state is kept next to the frontier save file
+    return f"{config.save_file}.traps"
@@ -0,0 +1,198 @@
+import re
+from collections import Counter
+from hashlib import blake2b
+from urllib.parse import urlparse
+
+# the domains we are supposed to keep, matched on whole host labels
+DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+
+# hosts that are only kept when the path contains the given string
+PATH_RESTRICTED_DOMAINS = {
+    "today.uci.edu": "/department/information_computer_sciences",
+}
+
+# (rule name, url component, pattern)
+# the component is one of "path", "path_lower" or "query". All the rules for
+# one component are compiled into a single alternation, so every component is
+# scanned once no matter how many rules there are.
+RULES = [
+    # crawler traps - calendars and date-based URLs
+    ("calendar", "path_lower", r"calendar|/>(?:year|month|day)=\d+"),
+    ("event_page", "path_lower",
+        r"events?/(?:\d{4}|\d{2})/\d{2}/\d{2}|events?/category|events?/tag"
+        r"|events?/\d+|events?/page/\d+|events?/day/|events?/month/"
+        r"|events?/week/|events?/archive"),
+    ("date_path", "path_lower",
+        r"/20\d{2}/(?:0[1-9]|1[0-2])/(?:0[1-9]|[12]\d|3[01])"
+        r"|/(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)"
+        r"|(?:january|february|march|april|may|june|july|august|september"
+        r"|october|november|december)/"),
+    # share links (saw a lot of facebook and X redirects)
+    ("share", "query", r"share="),
+    # calendar exports (nothing on the page)
+    ("ical", "path", r"ical"),
+    ("ical", "query", r"ical"),
+    # revisions of a page (not very important for info and very similar to each other)
+    ("diff", "path", r"do=diff"),
+    ("diff", "query", r"do=diff"),
+    ("index", "query", r"idx="),
+    ("revision", "query", r"rev="),
+    ("download", "query", r"action=download"),
+    ("pdf", "path", r"pdf"),
+    # redirects and log in
+    ("login", "query", r"redirect_to"),
+    ("login", "path", r"login\.php"),
+    ("code_file", "path_lower", r"\.(?:java|py|js)$"),
+    ("git", "path", r"git"),
+    ("git", "query", r"git"),
+    # sorted directory listings, seen a lot with eppstein (not a lot of info)
+    ("directory_listing", "query", r"[?&]C=(?:N|S);O=(?:A|D)"),
+    ("file_extension", "path_lower",
+        r"\.(?:css|js|bmp|gif|jpe?g|ico"
+        r"|png|tiff?|mid|mp2|mp3|mp4"
+        r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        r"|epub|dll|cnf|tgz|sha1"
+        r"|thmx|mso|arff|rtf|jar|csv"
+        r"|rm|smil|wmv|swf|wma|zip|rar|gz|ics|apk|war|img|jpg|scm|mpg|ppsx|frk|shar|lif|php)$"),
+]
+
+# (string the host must contain, rule name, url component, pattern)
+HOST_RULES = [
+    ("wiki.ics.uci.edu", "wiki_media", "query", r"do=media|image="),
+    # wiki pages that are likely to require authentication
+    ("wiki.ics.uci.edu", "wiki_restricted", "path", r"/doku\.php/accounts:|/doku\.php/login"),
+    ("wiki.ics.uci.edu", "wiki_restricted", "query", r"\?do=login"),
+    ("ics.uci.edu", "domain_event_page", "path_lower", r"events?/|calendar/|schedule/"),
+]
+
+MAX_URL_LENGTH = 2000
+MAX_PATH_SEGMENTS = 8
+
+# bump when UrlFilter.check changes in a way the data above does not show,
+# cached validation results (see LogStorage.pending) are redone
+CHECK_REVISION = 1
+
+
+def compile_rules(rules):
+    ''' Joins (name, component, pattern) rules into one regex per component.
+    Returns {component: (regex, names)} where names[i] is the rule behind
+    the group r{i}. '''
+    by_component = dict()
+    for name, component, pattern in rules:
+        by_component.setdefault(component, list()).append((name, pattern))
+    compiled = dict()
+    for component, component_rules in by_component.items():
+        names = [name for name, _ in component_rules]
+        regex = re.compile("|".join(
+            f"(?P<r{i}>{pattern})"
+            for i, (_, pattern) in enumerate(component_rules)))
+        compiled[component] = (regex, names)
+    return compiled
+
+
+class HostTrie(object):
+    ''' Host suffixes stored by reversed labels (edu -> uci -> ics), so a
+    lookup walks the labels of a host once instead of trying every suffix. '''
+    def __init__(self):
+        self.root = dict()
+
+    def add(self, suffix, value=True):
+        node = self.root
+        for label in reversed(suffix.split(".")):
+            node = node.setdefault(label, dict())
+        node[None] = value
+
+    def match(self, host):
+        # returns the value of the longest suffix of host in the trie
+        node = self.root
+        found = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
+class UrlFilter(object):
+    def __init__(self, domains=DOMAINS, path_restricted=PATH_RESTRICTED_DOMAINS,
+                 rules=RULES, host_rules=HOST_RULES):
+        self.hosts = HostTrie()
+        for domain in domains:
+            self.hosts.add(domain)
+        for domain, required_path in path_restricted.items():
+            self.hosts.add(domain, required_path)
+        self.rules = compile_rules(rules)
+        self.host_rules = [
+            (host_part, compile_rules([(name, component, pattern)]))
+            for host_part, name, component, pattern in host_rules]
+        self.rejections = Counter() # rule name -> number of urls it rejected
+        # changes whenever the rules do, so results checked under it can be reused
+        self.version = blake2b(repr((
+            CHECK_REVISION, sorted(domains), sorted(path_restricted.items()),
+            rules, host_rules, MAX_URL_LENGTH, MAX_PATH_SEGMENTS,
+        )).encode("utf-8"), digest_size=8).hexdigest()
+
+    def check(self, url):
+        ''' Returns the name of the rule that rejects url, or None if the url
+        should be crawled. '''
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return "scheme"
+
+        allowed = self.hosts.match(parsed.netloc)
+        if allowed is None or (allowed is not True and allowed not in parsed.path):
+            return "domain"
+
+        if len(url) > MAX_URL_LENGTH:
+            return "too_long"
+
+        path_segments = parsed.path.split('/')
+        if len(path_segments) > MAX_PATH_SEGMENTS:
+            return "too_deep"
+        # repetitions that may indicate a crawler trap
+        if len(set(path_segments)) < len(path_segments) / 2:
+            return "repeated_segments"
+        # adjacent repeated path segments (like 'EMWS09/EMWS09')
+        for i in range(1, len(path_segments)):
+            if path_segments[i] and path_segments[i] == path_segments[i-1]:
+                return "adjacent_repeated_segments"
+
+        components = {
+            "path": parsed.path,
+            "path_lower": parsed.path.lower(),
+            "query": parsed.query,
+        }
+        rejected = self._search(self.rules, components)
+        if rejected:
+            return rejected
+        for host_part, rules in self.host_rules:
+            if host_part in parsed.netloc:
+                rejected = self._search(rules, components)
+                if rejected:
+                    return rejected
+        return None
+
+    def _search(self, rules, components):
+        for component, (regex, names) in rules.items():
+            match = regex.search(components[component])
+            if match:
+                return names[int(match.lastgroup[1:])]
+        return None
+
+    def allows(self, url):
+        ''' Like is_valid, without counting the rejection. For urls that
+        were counted when they were first found. '''
+        return self.check(url) is None
+
+    def is_valid(self, url):
+        rejected = self.check(url)
+        if rejected:
+            self.rejections[rejected] += 1
+            return False
+        return True
+
+
+url_filter = UrlFilter()
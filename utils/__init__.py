@@ -1,35 +1,74 @@
 import os
 import logging
 from hashlib import sha256
+from threading import Lock
 from urllib.parse import urlparse
 
+from utils.canonical import canonicalize
+
+_handlers = dict() # log file name (None for the console) -> its handler, shared by all the loggers using it
+_loggers = set() # names of the loggers get_logger already set up
+_handlers_lock = Lock()
+
 def get_logger(name, filename=None):
+    # sets the logger up the first time, later calls return it as it is instead of adding more handlers
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    with _handlers_lock:
+        if name in _loggers:
+            return logger
+        logger.setLevel(logging.INFO)
+        # add the handlers to the logger
+        logger.addHandler(_handler(f"Logs/{filename if filename else name}.log"))
+        logger.addHandler(_handler(None))
+        _loggers.add(name)
     return logger
 
+def _handler(path):
+    handler = _handlers.get(path)
+    if handler is None:
+        if path is None:
+            handler = logging.StreamHandler()
+            handler.setLevel(logging.INFO)
+        else:
+            os.makedirs("Logs", exist_ok=True)
+            handler = logging.FileHandler(path)
+            handler.setLevel(logging.DEBUG)
+        handler.setFormatter(logging.Formatter(
+           "%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        _handlers[path] = handler
+    return handler
+
 
 def get_urlhash(url):
-    parsed = urlparse(url)
+    return get_canonical_urlhash(canonicalize(url))
+
+def get_canonical_urlhash(url):
+    # get_urlhash of a url that is already canonical, e.g. after normalize
+    parts = _split_plain_url(url)
+    if parts is None:
+        parsed = urlparse(url)
+        parts = (parsed.netloc, parsed.path, parsed.params, parsed.query, parsed.fragment)
     # everything other than scheme.
-    return sha256(
-        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
-        f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
+    return sha256("/".join(parts).encode("utf-8")).hexdigest()
+
+def _split_plain_url(url):
+    # urlparse's (netloc, path, params, query, fragment) for the common http(s) url:
+    # printable ascii without ';', spaces or an ipv6 host, in a fraction of its time. None otherwise.
+    if url.startswith("https://"):
+        rest = url[8:]
+    elif url.startswith("http://"):
+        rest = url[7:]
+    else:
+        return None
+    if not (rest.isascii() and rest.isprintable()) or any(c in rest for c in "; []"):
+        return None
+    rest, _, fragment = rest.partition("#")
+    rest, _, query = rest.partition("?")
+    slash = rest.find("/")
+    if slash < 0:
+        return (rest, "", "", query, fragment)
+    return (rest[:slash], rest[slash:], "", query, fragment)
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    # see utils/canonical.py for what is rewritten
+    return canonicalize(url)
@@ -0,0 +1,55 @@
+import aiohttp
+import cbor
+
+from utils.download import CHUNK_SIZE
+from utils.response import Response, oversized_response
+
+
+async def read_body(resp, limit):
+    # like utils.download.read_body for an aiohttp response
+    if not limit:
+        return await resp.read()
+    if resp.content_length is not None and resp.content_length > limit:
+        return None
+    chunks = list()
+    size = 0
+    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def open_session(config):
+    # one keep-alive connection pool to the cache server shared by all downloads
+    connector = aiohttp.TCPConnector(
+        limit=config.concurrency, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def download(url, config, session, logger=None):
+    if config.replay_corpus is not None:
+        return config.replay_corpus.response(url, config.max_response_bytes)
+    host, port = config.cache_server
+    async with session.get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")]) as resp:
+        content = await read_body(resp, config.max_response_bytes) if resp.ok else b""
+        status = resp.status
+        ok = resp.ok
+    if content is None:
+        return oversized_response(url, status, config.max_response_bytes)
+    try:
+        if ok and content:
+            response = Response(cbor.loads(content), config.max_response_bytes)
+            if config.record_corpus is not None:
+                config.record_corpus.add(url, content)
+            return response
+    except (EOFError, ValueError) as e:
+        pass
+    logger.error(f"Spacetime Response error {status} with url {url}.")
+    return Response({
+        "error": f"Spacetime Response error {status} with url {url}.",
+        "status": status,
+        "url": url})
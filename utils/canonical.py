@@ -0,0 +1,103 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+# every rewrite the canonicalizer knows, in the order they are applied
+STEPS = ("port", "scheme", "www", "percent", "index", "slash", "query", "fragment")
+
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+PERCENT_ESCAPE = re.compile(r"%[0-9a-fA-F]{2}")
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+INDEX_PAGE = re.compile(r"/index\.(?:html?|php)$", re.IGNORECASE)
+
+
+def _normalize_escape(match):
+    # %7e -> ~ for characters that never need escaping, %2f -> %2F otherwise
+    char = chr(int(match.group()[1:], 16))
+    return char if char in UNRESERVED else match.group().upper()
+
+
+def _drop_default_port(scheme, netloc):
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and netloc.endswith(default_port):
+        return netloc[:-len(default_port)]
+    return netloc
+
+
+class Canonicalizer(object):
+    ''' Rewrites urls that point at the same page to one canonical form so
+    they are only downloaded once. steps picks which rewrites are applied:
+
+        port      drop :80 on http and :443 on https
+        scheme    http -> https
+        www       www.ics.uci.edu -> ics.uci.edu
+        percent   uppercase %-escapes, decode escaped unreserved characters
+        index     /a/index.html (or .htm, .php) -> /a/
+        slash     strip trailing slashes from the path
+        query     sort the query parameters
+        fragment  drop the #fragment
+
+    The scheme and host are always lowercased. Recent results are kept in an
+    LRU cache since the same links show up on page after page. '''
+    def __init__(self, steps=STEPS, cache_size=2**16):
+        unknown = set(steps) - set(STEPS)
+        if unknown:
+            raise ValueError(f"Unknown canonicalization steps {sorted(unknown)}")
+        self.steps = frozenset(steps)
+        self.canonicalize = lru_cache(maxsize=cache_size)(self._canonicalize)
+
+    def _canonicalize(self, url):
+        try:
+            scheme, netloc, path, query, fragment = urlsplit(url)
+        except ValueError:
+            # malformed (e.g. a broken ipv6 host), leave it for is_valid to reject
+            return url
+        # every step leaves nothing for a second pass to rewrite, so that
+        # canonicalizing a canonical url gives the same url (and urlhash)
+        steps = self.steps
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+        if "port" in steps:
+            netloc = _drop_default_port(scheme, netloc)
+        if "scheme" in steps and scheme == "http":
+            scheme = "https"
+            if "port" in steps:
+                # http://host:443 is https://host now
+                netloc = _drop_default_port(scheme, netloc)
+        if "www" in steps:
+            while netloc.startswith("www."):
+                netloc = netloc[4:]
+        if "percent" in steps and "%" in url:
+            path = PERCENT_ESCAPE.sub(_normalize_escape, path)
+            query = PERCENT_ESCAPE.sub(_normalize_escape, query)
+        if "slash" in steps:
+            path = path.rstrip("/")
+        if "index" in steps:
+            # /a/index.html/index.html/ -> /a/, the slashes go first so each index page is last once
+            stripped = INDEX_PAGE.sub("/", path)
+            while stripped != path:
+                path = stripped.rstrip("/") if "slash" in steps else stripped
+                stripped = INDEX_PAGE.sub("/", path)
+        if "query" in steps and query:
+            query = "&".join(sorted(param for param in query.split("&") if param))
+        if "fragment" in steps:
+            fragment = ""
+        return urlunsplit((scheme, netloc, path, query, fragment))
+
+    def cache_info(self):
+        return self.canonicalize.cache_info()
+
+
+canonicalizer = Canonicalizer()
+
+
+def set_canonicalizer(steps):
+    # every caller goes through canonical.canonicalizer, so replacing it
+    # here changes the rules for the frontier, get_urlhash and the scraper
+    global canonicalizer
+    canonicalizer = Canonicalizer(steps)
+
+
+def canonicalize(url):
+    return canonicalizer.canonicalize(url)
@@ -9,11 +9,58 @@ class Config(object):
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.storage_type = config["LOCAL PROPERTIES"].get("STORAGE", "shelve").strip()
+        self.commit_batch = config["LOCAL PROPERTIES"].getint("COMMIT_BATCH", 64)
+        self.commit_interval = config["LOCAL PROPERTIES"].getint("COMMIT_INTERVAL", 500)
+        self.record_file = config["LOCAL PROPERTIES"].get("RECORD", "").strip()
+        self.replay_file = config["LOCAL PROPERTIES"].get("REPLAY", "").strip()
+        self.page_cache = config["LOCAL PROPERTIES"].get("PAGE_CACHE", "").strip()
+        self.metrics_port = config["LOCAL PROPERTIES"].getint("METRICS_PORT", 0)
+        self.metrics_file = config["LOCAL PROPERTIES"].get("METRICS_FILE", "").strip()
+        self.metrics_interval = config["LOCAL PROPERTIES"].getfloat("METRICS_INTERVAL", 10)
+        self.log_interval = config["LOCAL PROPERTIES"].getfloat("LOG_INTERVAL", 1)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.parser_engine = config["CRAWLER"].get("PARSER", "soup").strip()
+        self.word_frequencies = config["CRAWLER"].get("WORD_FREQUENCIES", "exact").strip()
+        self.parse_processes = config["CRAWLER"].getint("PARSE_PROCESSES", 0)
+        self.simhash_distance = config["CRAWLER"].getint("SIMHASH_DISTANCE", 3)
+        self.simhash_capacity = config["CRAWLER"].getint("SIMHASH_CAPACITY", 100000)
+        self.max_response_bytes = config["CRAWLER"].getint("MAX_RESPONSE_BYTES", 10 * 2**20)
+        self.max_page_bytes = config["CRAWLER"].getint("MAX_PAGE_BYTES", 2 * 2**20)
+        self.content_gate = config["CRAWLER"].getboolean("CONTENT_GATE", True)
+        self.rate_control = config["CRAWLER"].getboolean("RATE_CONTROL", True)
+        self.host_concurrency = config["CRAWLER"].getint("HOST_CONCURRENCY", 1)
+        self.max_backoff = config["CRAWLER"].getfloat("MAX_BACKOFF", 60)
+        self.breaker_errors = config["CRAWLER"].getint("BREAKER_ERRORS", 5)
+        self.breaker_seconds = config["CRAWLER"].getfloat("BREAKER_SECONDS", 60)
+        self.breaker_trips = config["CRAWLER"].getint("BREAKER_TRIPS", 3)
+        self.robots = config["CRAWLER"].getboolean("ROBOTS", True)
+        self.robots_cache = config["CRAWLER"].getint("ROBOTS_CACHE", 1000)
+        self.sitemap_urls = config["CRAWLER"].getint("SITEMAP_URLS", 10000)
+        self.engine = config["CRAWLER"].get("ENGINE", "threads").strip()
+        self.concurrency = config["CRAWLER"].getint("CONCURRENCY", 16)
+        self.shards = config["CRAWLER"].getint("SHARDS", 1)
+        self.forward_batch = config["CRAWLER"].getint("FORWARD_BATCH", 256)
+        self.canonicalize_steps = [
+            step.strip() for step in config["CRAWLER"].get(
+                "CANONICALIZE", "port,scheme,www,percent,index,slash,query,fragment").split(",")
+            if step.strip()]
+        self.frontier_type = config["CRAWLER"].get("FRONTIER", "lifo").strip()
+        self.priority = [
+            scorer.strip() for scorer in config["CRAWLER"].get(
+                "PRIORITY", "depth,value,fairness").split(",")
+            if scorer.strip()]
+        self.trap_template_budget = config["CRAWLER"].getint("TRAP_BUDGET", 200)
+        self.trap_low_info_ratio = config["CRAWLER"].getfloat("TRAP_LOW_INFO_RATIO", 0.5)
+        self.trap_min_samples = config["CRAWLER"].getint("TRAP_MIN_SAMPLES", 20)
+        self.trap_max_templates = config["CRAWLER"].getint("TRAP_TEMPLATES", 100000)
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # set by utils.replay.open_corpus
+        self.record_corpus = None
+        self.replay_corpus = None
\ No newline at end of file
@@ -1,17 +1,47 @@
-import requests
 import cbor
 import time
 
-from utils.response import Response
+from utils.response import Response, oversized_response
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_body(resp, limit):
+    # the body of a streamed response, None as soon as it is longer than limit (0 for no limit)
+    if not limit:
+        return resp.content
+    length = resp.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > limit:
+        return None
+    chunks = list()
+    size = 0
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
 
 def download(url, config, logger=None):
+    if config.replay_corpus is not None:
+        return config.replay_corpus.response(url, config.max_response_bytes)
+    import requests # not needed by replayed crawls, imported with the first download
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    # streamed, so an oversized page is dropped before it is all in memory
+    with requests.get(
+            f"http://{host}:{port}/",
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+            stream=True) as resp:
+        content = read_body(resp, config.max_response_bytes) if resp else b""
+    if content is None:
+        return oversized_response(url, resp.status_code, config.max_response_bytes)
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            response = Response(cbor.loads(content), config.max_response_bytes)
+            if config.record_corpus is not None:
+                config.record_corpus.add(url, content)
+            return response
     except (EOFError, ValueError) as e:
         pass
     logger.error(f"Spacetime Response error {resp} with url {url}.")
@@ -0,0 +1,95 @@
+import pickle
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+
+def make_raw_response(url, status, content, content_type="text/html"):
+    # the cache server pickles a requests.Response, build the same thing
+    raw_response = requests.Response()
+    raw_response.url = url
+    raw_response.status_code = status
+    raw_response._content = content
+    raw_response.headers["Content-Type"] = content_type
+    return raw_response
+
+
+def make_body(url, status, content, content_type="text/html"):
+    # what the cache server sends back: a cbor dict with the pickled response
+    return cbor.dumps({
+        "url": url,
+        "status": status,
+        "response": pickle.dumps(make_raw_response(url, status, content, content_type))})
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real cache server
+    wbufsize = -1 # send headers and body together, avoids nagle stalls on keep-alive
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        self.server.requests += 1
+        body = self.server.respond(url)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the client stopped reading, e.g. at MAX_RESPONSE_BYTES
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalCacheServer(object):
+    ''' A stand-in for the spacetime cache server that answers on localhost
+    in the same cbor Response format. pages is a function url -> (status,
+    content) or (status, content, content type), or a dict of url ->
+    content (missing urls are 404s). latency
+    seconds are added to every request. Use config.cache_server =
+    server.address to point the crawler at it. '''
+    def __init__(self, pages, latency=0, port=0):
+        if isinstance(pages, dict):
+            site = pages
+            pages = lambda url: (200, site[url]) if url in site else (404, b"")
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), CacheRequestHandler)
+        self.server.daemon_threads = True
+        self.server.respond = lambda url: make_body(url, *pages(url))
+        self.server.latency = latency
+        self.server.requests = 0
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @classmethod
+    def replaying(cls, corpus, latency=0, port=0):
+        ''' Serves the responses recorded in a utils.replay.Corpus byte for
+        byte, urls that were not recorded are 404s. '''
+        server = cls(dict(), latency, port)
+        server.server.respond = lambda url: (
+            corpus.body(url) or make_body(url, 404, b""))
+        return server
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,229 @@
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds of the histogram buckets in seconds, 100us doubling up to ~13s
+BUCKETS = [0.0001 * 2 ** i for i in range(18)]
+
+
+class Timer(object):
+    ''' with metrics.timer("parse"): ... observes how long the block took,
+    which is kept in elapsed. '''
+    __slots__ = ("metrics", "stage", "start", "elapsed")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.stage, self.elapsed)
+
+
+class Metrics(object):
+    ''' Stage timings and counters for the whole crawl.
+
+    Every thread records into its own histograms and counters (a
+    threading.local), so observe and count never take a lock; the lock is
+    only taken once per thread to register its shard. render() adds all
+    shards up when metrics are exported, which is rare compared to writes.
+
+    Values that already live somewhere else (rejections per rule, frontier
+    depth per host) are not copied, collect() registers a function that
+    returns {label value: number} and is called at render time. '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = list() # (histograms, counters) of every thread
+        self.collectors = list() # (name, kind, label, function)
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = (dict(), dict())
+            with self.lock:
+                self.shards.append(shard)
+            return shard
+
+    def observe(self, stage, seconds):
+        histograms = self._shard()[0]
+        histogram = histograms.get(stage)
+        if histogram is None:
+            # one count per bucket, one for +Inf, then the sum
+            histogram = histograms[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def timer(self, stage):
+        return Timer(self, stage)
+
+    def count(self, name, label, label_value, n=1):
+        counters = self._shard()[1]
+        key = (name, label, label_value)
+        counters[key] = counters.get(key, 0) + n
+
+    def collect(self, name, kind, label, function):
+        with self.lock:
+            self.collectors = [
+                collector for collector in self.collectors if collector[0] != name]
+            self.collectors.append((name, kind, label, function))
+
+    def snapshot(self):
+        ''' (histograms, counters) summed over all threads. '''
+        histograms = dict()
+        counters = dict()
+        with self.lock:
+            shards = list(self.shards)
+        for shard_histograms, shard_counters in shards:
+            for stage, histogram in list(shard_histograms.items()):
+                total = histograms.setdefault(stage, [0] * len(histogram))
+                for i, value in enumerate(histogram):
+                    total[i] += value
+            for key, value in list(shard_counters.items()):
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self):
+        ''' All metrics in the Prometheus text format. '''
+        histograms, counters = self.snapshot()
+        lines = ["# TYPE crawler_stage_seconds histogram"]
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ["+Inf"], histogram):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(
+                    f'crawler_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram[-1]:.6f}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        for name in sorted(set(key[0] for key in counters)):
+            lines.append(f"# TYPE crawler_{name}_total counter")
+            for (counter, label, label_value), value in sorted(counters.items(), key=str):
+                if counter == name:
+                    lines.append(f'crawler_{name}_total{{{label}="{_escape(label_value)}"}} {value}')
+        with self.lock:
+            collectors = list(self.collectors)
+        for name, kind, label, function in collectors:
+            lines.append(f"# TYPE crawler_{name} {kind}")
+            for label_value, value in sorted(function().items()):
+                lines.append(f'crawler_{name}{{{label}="{_escape(label_value)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+def metrics_server(port):
+    # http.server is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+class MetricsExporter(object):
+    ''' Serves metrics.render() on http://127.0.0.1:port/metrics and/or
+    rewrites path with it every interval seconds (and once more on stop). '''
+    def __init__(self, port=0, path="", interval=10):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server = None
+        self.threads = list()
+        if port:
+            self.server = metrics_server(port)
+            self.threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        if path:
+            self.threads.append(threading.Thread(target=self._write_snapshots, daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def _write_snapshots(self):
+        while not self.stopped.wait(self.interval):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as snapshot:
+            snapshot.write(metrics.render())
+        os.replace(tmp_path, self.path)
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path:
+            self.write_snapshot()
+
+
+def peak_rss():
+    # in bytes (ru_maxrss is in kilobytes on linux), children are the parse processes that exited
+    return {
+        "crawler": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "parse_processes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+def start_exporter(config):
+    return MetricsExporter(
+        config.metrics_port, config.metrics_file, config.metrics_interval).start()
+
+
+class RateLimitedLog(object):
+    ''' Structured replacement for per url prints: info("downloaded",
+    url=..., status=...) logs "downloaded url=... status=..." at most once
+    per interval seconds for each event, with the number of lines skipped
+    since the last one. Everything is still counted in metrics. '''
+    def __init__(self, logger, interval=1.0):
+        self.logger = logger
+        self.interval = interval
+        self.last = dict() # event -> time of its last line
+        self.suppressed = dict() # event -> lines skipped since then
+
+    def info(self, event, **fields):
+        metrics.count("events", "event", event)
+        now = time.monotonic()
+        if now - self.last.get(event, -self.interval) < self.interval:
+            self.suppressed[event] = self.suppressed.get(event, 0) + 1
+            return
+        self.last[event] = now
+        suppressed = self.suppressed.pop(event, 0)
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self.logger.info(" ".join(
+            [event] + [f"{key}={_format(value)}" for key, value in fields.items()]))
+
+
+def _format(value):
+    value = str(value)
+    if not value or " " in value or '"' in value:
+        return '"' + value.replace('"', '\\"') + '"'
+    return value
@@ -0,0 +1,116 @@
+import mmap
+import os
+from threading import Lock
+
+import cbor
+
+from utils.response import Response, oversized_response
+
+
+def index_file(path):
+    return f"{path}.index"
+
+
+class CorpusWriter(object):
+    ''' Records cache server responses to disk so a crawl can be replayed
+    without the cache server. The corpus is two files: path holds the cbor
+    bodies exactly as the cache server sent them, back to back, and
+    path.index has one "offset<TAB>length<TAB>url" line per body. Both are
+    only appended to, so a crawl can be recorded over several runs. Only the
+    first response for a url is kept. '''
+    def __init__(self, path):
+        self.lock = Lock()
+        self.urls = set(read_index(path)) if os.path.exists(index_file(path)) else set()
+        self.segment = open(path, "ab")
+        self.index = open(index_file(path), "a")
+
+    def add(self, url, body):
+        with self.lock:
+            if url in self.urls:
+                return
+            self.urls.add(url)
+            offset = self.segment.tell()
+            self.segment.write(body)
+            # the body has to be on disk before the index points at it
+            self.segment.flush()
+            self.index.write(f"{offset}\t{len(body)}\t{url}\n")
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.segment.close()
+            self.index.close()
+
+
+def read_index(path):
+    ''' url -> (offset, length) of every complete body in the corpus. '''
+    entries = dict()
+    size = os.path.getsize(path)
+    with open(index_file(path)) as index:
+        for line in index:
+            if not line.endswith("\n"):
+                break # torn last line
+            offset, length, url = line[:-1].split("\t", 2)
+            offset, length = int(offset), int(length)
+            if offset + length <= size:
+                entries.setdefault(url, (offset, length))
+    return entries
+
+
+class Corpus(object):
+    ''' Read side of a recorded corpus. The segment file is memory mapped,
+    so only the pages a crawl actually asks for are read from disk. '''
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_index(path)
+        self.file = open(path, "rb")
+        self.map = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.entries else b"")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def urls(self):
+        return self.entries.keys()
+
+    def body(self, url):
+        ''' The cbor body the cache server sent for url, None if it was not recorded. '''
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self.map[offset:offset + length]
+
+    def response(self, url, max_bytes=0):
+        body = self.body(url)
+        if body is None:
+            return Response({
+                "error": f"{url} is not in the corpus {self.path}.",
+                "status": 404,
+                "url": url})
+        if max_bytes and len(body) > max_bytes:
+            return oversized_response(url, 200, max_bytes, len(body))
+        return Response(cbor.loads(body), max_bytes)
+
+    def close(self):
+        if self.entries:
+            self.map.close()
+        self.file.close()
+
+
+def open_corpus(config):
+    # REPLAY wins over RECORD, a replayed crawl has nothing new to record
+    if config.replay_file:
+        config.replay_corpus = Corpus(config.replay_file)
+    elif config.record_file:
+        config.record_corpus = CorpusWriter(config.record_file)
+
+
+def close_corpus(config):
+    for corpus in (config.replay_corpus, config.record_corpus):
+        if corpus is not None:
+            corpus.close()
@@ -1,14 +1,61 @@
 import pickle
 
+# first bytes of common binary formats served under html urls
+BINARY_SIGNATURES = (
+    b"%PDF", b"\x89PNG", b"GIF8", b"\xff\xd8\xff", b"PK\x03\x04", b"\x1f\x8b",
+    b"\xd0\xcf\x11\xe0", b"\x7fELF")
+TEXT_TYPES = ("text/", "application/xhtml+xml", "application/xml")
+
+
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A cache server response. raw_response (the requests.Response the
+    cache server pickled) is only unpickled when it is first used, and not
+    at all when the pickled response is larger than max_bytes: too_large is
+    set and raw_response is None. resp_dict may give the size itself when
+    the body was dropped while downloading. '''
+    def __init__(self, resp_dict, max_bytes=0):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self.pickled = resp_dict["response"] if "response" in resp_dict else None
+        self.size = resp_dict.get("size") or (
+            len(self.pickled) if isinstance(self.pickled, (bytes, bytearray)) else 0)
+        self.too_large = bool(max_bytes) and self.size > max_bytes
+        if self.too_large:
+            self.pickled = None
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if self.pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self.pickled)
+            except TypeError:
+                self._raw_response = None
+            self.pickled = None
+        return self._raw_response
+
+
+def oversized_response(url, status, max_bytes, size=None):
+    # the Response for a page dropped because it is larger than max_bytes
+    return Response({
+        "error": f"Response for {url} is larger than {max_bytes} bytes.",
+        "status": status,
+        "url": url,
+        "size": size or max_bytes + 1}, max_bytes)
+
+
+def content_type(raw_response):
+    headers = getattr(raw_response, "headers", None)
+    return headers.get("Content-Type", "") if headers is not None else ""
+
+
+def is_text(content_type, content):
+    ''' False for bodies that are clearly not a web page: a non-text
+    Content-Type, a known binary signature or a NUL byte in the first KB.
+    A missing Content-Type is decided by the content alone. '''
+    mime = content_type.split(";")[0].strip().lower()
+    if mime and not mime.startswith(TEXT_TYPES):
+        return False
+    head = content[:1024]
+    return not head.startswith(BINARY_SIGNATURES) and b"\0" not in head
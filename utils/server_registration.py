@@ -1,5 +1,6 @@
-import os
 from spacetime import Node
+from crawler.distributed import shard_configs
+from crawler.storage import save_files
 from utils.pcc_models import Register
 
 def init(df, user_agent, fresh):
@@ -22,5 +23,6 @@ def init(df, user_agent, fresh):
 def get_cache_server(config, restart):
     init_node = Node(
         init, Types=[Register], dataframe=(config.host, config.port))
-    return init_node.start(
-        config.user_agent, restart or not os.path.exists(config.save_file))
\ No newline at end of file
+    # a sharded crawl saves its progress in SAVE.shard<i>
+    saved = any(save_files(shard.save_file) for shard in shard_configs(config))
+    return init_node.start(config.user_agent, restart or not saved)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import math
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from itertools import chain
+
+
+def url_hash64(url):
+    # 8 byte hash of a url, small enough to store millions of them compactly
+    return int.from_bytes(
+        blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BloomFilter(object):
+    ''' Fixed size bloom filter over 64 bit hashes. The k bit positions come
+    from the two 32 bit halves of the hash (double hashing). '''
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bit_count = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, h):
+        # positions are computed one at a time so a miss stops at the first clear bit
+        bits = self.bits
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        m = self.bit_count
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % m
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, h):
+        bits = self.bits
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        m = self.bit_count
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % m
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter(object):
+    ''' Bloom filter that grows without knowing the final size: when the
+    current filter is full a new one with twice the capacity and a tighter
+    error rate is added, so the total false positive rate stays below
+    error_rate. '''
+    def __init__(self, initial_capacity=2**16, error_rate=0.01, tightening=0.5):
+        self.error_rate = error_rate * (1 - tightening)
+        self.tightening = tightening
+        self.filters = [BloomFilter(initial_capacity, self.error_rate)]
+
+    def __contains__(self, h):
+        for bloom in self.filters:
+            if h in bloom:
+                return True
+        return False
+
+    def add(self, h):
+        bloom = self.filters[-1]
+        if bloom.count >= bloom.capacity:
+            bloom = BloomFilter(
+                bloom.capacity * 2,
+                self.error_rate * self.tightening ** len(self.filters))
+            self.filters.append(bloom)
+        bloom.add(h)
+
+    def nbytes(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+
+class HashSet64(object):
+    ''' Exact set of 64 bit hashes in a sorted array('Q') (8 bytes each),
+    searched with bisect. New hashes wait in a small set until it grows past
+    an eighth of the array and are then merged in, which keeps inserts
+    amortized O(log n). '''
+    def __init__(self, hashes=()):
+        self.sorted = array("Q", sorted(set(hashes)))
+        self.recent = set()
+
+    @classmethod
+    def from_bytes(cls, data):
+        # the inverse of to_bytes, no sorting needed
+        hashes = cls()
+        hashes.sorted.frombytes(data)
+        return hashes
+
+    def to_bytes(self):
+        self._merge()
+        return self.sorted.tobytes()
+
+    def __contains__(self, h):
+        if h in self.recent:
+            return True
+        i = bisect_left(self.sorted, h)
+        return i < len(self.sorted) and self.sorted[i] == h
+
+    def add(self, h):
+        if h in self:
+            return False
+        self.insert_new(h)
+        return True
+
+    def insert_new(self, h):
+        # add for a hash the caller already knows is not in the set
+        self.recent.add(h)
+        if len(self.recent) > max(4096, len(self.sorted) >> 3):
+            self._merge()
+
+    def _merge(self):
+        # timsort merges the two sorted runs in linear time
+        self.sorted = array("Q", sorted(chain(self.sorted, sorted(self.recent))))
+        self.recent = set()
+
+    def __len__(self):
+        return len(self.sorted) + len(self.recent)
+
+    def __iter__(self):
+        self._merge()
+        return iter(self.sorted)
+
+    def nbytes(self):
+        # the recent set costs about 60 bytes per hash until it is merged
+        return self.sorted.itemsize * len(self.sorted) + 60 * len(self.recent)
+
+
+class UrlSet(object):
+    ''' Compact stand-in for a set of url strings. Only an 8 byte hash of
+    each url is kept. The bloom filter answers most checks for urls never
+    seen before and the HashSet64 answers the rest exactly (up to 64 bit
+    hash collisions). '''
+    def __init__(self, error_rate=0.01):
+        self.bloom = ScalableBloomFilter(error_rate=error_rate)
+        self.hashes = HashSet64()
+        self.added = None # hashes added since take_journal, once journal() was called
+
+    def __contains__(self, url):
+        return self.contains_hash(url_hash64(url))
+
+    def add(self, url):
+        ''' Returns True if url had not been seen before. '''
+        return self.add_hash(url_hash64(url))
+
+    def contains_hash(self, h):
+        return h in self.bloom and h in self.hashes
+
+    def add_hash(self, h):
+        if h not in self.bloom:
+            self.bloom.add(h)
+            self.hashes.insert_new(h)
+        elif not self.hashes.add(h):
+            return False
+        if self.added is not None:
+            self.added.append(h)
+        return True
+
+    def journal(self):
+        # from now on take_journal returns the hashes added since its last call
+        self.added = array("Q")
+
+    def take_journal(self):
+        added = self.added.tobytes()
+        self.added = array("Q")
+        return added
+
+    def replay_journal(self, added):
+        hashes = array("Q")
+        hashes.frombytes(added)
+        for h in hashes:
+            self.add_hash(h)
+
+    def update(self, other):
+        # union with another UrlSet, e.g. the links seen by another shard
+        for h in other.hashes:
+            self.add_hash(h)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def nbytes(self):
+        return self.bloom.nbytes() + self.hashes.nbytes()